@@ -0,0 +1,68 @@
+"""
+Admin helpers for large tables
+
+The default changelist runs an exact ``COUNT(*)`` over the whole filtered
+table on every page view (twice when filters are active) and renders every
+foreign key of the change form as a <select> with one <option> per row. Both
+become unusable once the guest, media or invitation tables grow to millions
+of rows. LargeTableAdmin replaces the counts with cheap estimates and is meant
+to be combined with list_select_related and autocomplete_fields.
+"""
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Filtered changelists count at most this many rows exactly
+COUNT_LIMIT = 10000
+
+
+def _table_estimate(queryset):
+    """
+    Planner estimate of the number of rows in a table (PostgreSQL only)
+
+    Returns:
+        int: Estimated row count, or None if no estimate is available
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 for tables that have never been analyzed
+    if not row or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts more rows than it has to
+
+    An unfiltered changelist uses the planner's row estimate on PostgreSQL.
+    Filtered changelists, and databases without an estimate, count at most
+    COUNT_LIMIT rows, so the last pages of a huge result are not reachable
+    through the page links (narrow the filter or search instead).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _table_estimate(queryset)
+            if estimate is not None and estimate > COUNT_LIMIT:
+                return estimate
+        # COUNT(*) over a LIMITed subquery stops after COUNT_LIMIT rows
+        return queryset.order_by()[:COUNT_LIMIT].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin defaults for tables with many rows"""
+    paginator = EstimatedCountPaginator
+    # Skip the extra unfiltered COUNT(*) behind "N results (M total)"
+    show_full_result_count = False
+    list_per_page = 50
@@ -0,0 +1,75 @@
+"""
+Helpers for async views
+
+Under ASGI (see README, "Running under ASGI"), async views let one process
+wait on many slow clients, SMTP servers and disks at once. Database queries
+use Django's async ORM methods; blocking work that does not touch the
+database, such as sending mail or reading files, runs in a thread pool so
+several such calls can overlap.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# How many blocking calls (e.g. SMTP sends) one request runs at the same time
+BLOCKING_CONCURRENCY = getattr(settings, 'ASYNC_BLOCKING_CONCURRENCY', 8)
+
+
+async def get_user_with_profile(request):
+    """
+    Get the logged in user with their profile loaded, from an async view
+
+    request.user cannot be used in async views because it loads lazily with a
+    synchronous query.
+
+    Args:
+        request: HttpRequest
+
+    Returns:
+        User: The user; user.profile is available without further queries
+    """
+    from .models import UserProfile
+
+    user = await request.auser()
+    if user.is_authenticated:
+        user.profile = await UserProfile.objects.aget(user_id=user.pk)
+    return user
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function in a worker thread
+
+    func must not use the database: worker threads are not the thread async
+    ORM calls run in, and their connections would never be closed.
+
+    Args:
+        func (callable): Function to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The return value of func
+    """
+    return await sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
+
+
+async def gather_blocking(calls, limit=None):
+    """
+    Run several blocking calls concurrently, at most limit at a time
+
+    Args:
+        calls (list): (func, args) tuples; funcs must not use the database
+        limit (int): Maximum concurrent calls (default ASYNC_BLOCKING_CONCURRENCY)
+
+    Returns:
+        list: Return values in the same order as calls
+    """
+    semaphore = asyncio.Semaphore(limit or BLOCKING_CONCURRENCY)
+
+    async def run(func, args):
+        async with semaphore:
+            return await run_blocking(func, *args)
+
+    return await asyncio.gather(*(run(func, args) for func, args in calls))
@@ -0,0 +1,180 @@
+"""
+Read-only JSON API (/api/v1/)
+
+Integrations read weddings and their guests, tasks, media and so on as JSON
+instead of scraping pages. Every request pays only for what it asks for:
+
+- ?fields=a,b selects columns; rows are read with values(), so unrequested
+  columns are never loaded or serialized.
+- ?include=events,comments embeds related rows. Each include is one extra
+  values() query over the whole page (a prefetch), not one per row;
+  ?fields[events]=name,date narrows its columns too.
+- Pages are cursor-based: ?cursor= is the opaque "next" value of the
+  previous page, so deep pages cost the same as the first one.
+
+Responses are encoded with orjson when it is installed.
+
+Resources register with register() from their app's api module (imported by
+its AppConfig.ready()), like the search index and delta sync do from the
+app's search and sync modules (see core/search.py and core/sync.py).
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 100)
+MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+
+Resource = namedtuple('Resource', 'name model wedding_field fields default_fields includes')
+Include = namedtuple('Include', 'name model foreign_key fields')
+
+_registry = {}
+
+
+class APIError(Exception):
+    """A request the API cannot answer; becomes a 400 response"""
+
+
+def register(name, model, wedding_field, fields, default_fields=None, includes=()):
+    """
+    Register a model with the JSON API
+
+    Args:
+        name (str): Resource name in URLs, e.g. 'guests'
+        model: Model class
+        wedding_field (str): Lookup path to the wedding, e.g. 'wedding' or
+            'id' for weddings themselves
+        fields (tuple): Fields clients may select (id is always sent)
+        default_fields (tuple): Fields sent without ?fields= (default: all)
+        includes (tuple): Include tuples of related rows clients may embed
+    """
+    _registry[name] = Resource(
+        name, model, wedding_field, tuple(fields), tuple(default_fields or fields),
+        {include.name: include for include in includes},
+    )
+
+
+def get_resource(name):
+    return _registry.get(name)
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The last ID of the previous page, or None for no cursor"""
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise APIError("Invalid cursor.")
+
+
+def _selected(value, allowed, default, what):
+    """Validate a comma separated field list against the allowed fields"""
+    if not value:
+        return list(default)
+    requested = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in allowed and field != 'id']
+    if unknown:
+        raise APIError(f"Unknown {what}: {', '.join(unknown)}.")
+    return [field for field in requested if field != 'id']
+
+
+def _parse_limit(value):
+    if not value:
+        return PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise APIError("limit must be a number.")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _embed(resource, rows, includes, params):
+    """Add included related rows to rows, one query per include"""
+    ids = [row['id'] for row in rows]
+    for name in includes:
+        include = resource.includes[name]
+        fields = _selected(params.get(f'fields[{name}]'), include.fields, include.fields, f"{name} fields")
+        related = {row['id']: [] for row in rows}
+        queryset = (
+            include.model._default_manager
+            .filter(**{f"{include.foreign_key}__in": ids})
+            .order_by('id')
+            .values('id', include.foreign_key, *fields)
+        )
+        for item in queryset:
+            related[item.pop(include.foreign_key)].append(item)
+        for row in rows:
+            row[name] = related[row['id']]
+
+
+def query(resource, wedding_ids, params, object_id=None):
+    """
+    Read one page of a resource (or one object) as plain dicts
+
+    Args:
+        resource (Resource): Registered resource
+        wedding_ids (list): Weddings the user may read
+        params: Query parameters (fields, include, cursor, limit, wedding)
+        object_id (int): Read this object only
+
+    Returns:
+        dict: {"data": [...], "next": cursor or None}, or {"data": {...}}
+        for one object (None if it does not exist or is not visible)
+    """
+    fields = _selected(params.get('fields'), resource.fields, resource.default_fields, "fields")
+    includes = _selected(params.get('include'), resource.includes, (), "include")
+
+    queryset = resource.model._default_manager.filter(**{f"{resource.wedding_field}__in": wedding_ids})
+    if params.get('wedding'):
+        requested = [part.strip() for part in params['wedding'].split(',')]
+        queryset = queryset.filter(**{f"{resource.wedding_field}__in": [
+            wedding_id for wedding_id in wedding_ids if str(wedding_id) in requested
+        ]})
+
+    if object_id is not None:
+        rows = list(queryset.filter(pk=object_id).values('id', *fields))
+        if rows:
+            _embed(resource, rows, includes, params)
+        return {'data': rows[0] if rows else None}
+
+    after = decode_cursor(params.get('cursor'))
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    limit = _parse_limit(params.get('limit'))
+
+    # One row more than the page tells whether there is a next page
+    rows = list(queryset.order_by('id').values('id', *fields)[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    _embed(resource, rows, includes, params)
+    return {'data': rows, 'next': encode_cursor(rows[-1]['id']) if has_next else None}
+
+
+def _default(value):
+    # orjson handles dates and times itself; Decimals, lazy strings and the
+    # like go through Django's encoder
+    return DjangoJSONEncoder().default(value)
+
+
+def json_response(data, status=200):
+    """Compact JSON response, encoded with orjson when available"""
+    if orjson is not None:
+        content = orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    else:
+        content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return HttpResponse(content, status=status, content_type='application/json')
@@ -0,0 +1,42 @@
+"""
+Background work for the Wedding Management System
+
+A small in-process thread pool for work that should not hold up a request,
+such as building archives or sending emails. Jobs are submitted only after
+the surrounding database transaction commits, so they always see the rows
+the request created.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+    thread_name_prefix='wms-background',
+)
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Error in background task %s", func.__name__)
+    finally:
+        # Worker threads open their own database connections; release them
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run a function in a background thread once the current transaction commits
+
+    Args:
+        func (callable): Function to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+    """
+    transaction.on_commit(lambda: _executor.submit(_run, func, args, kwargs))
@@ -0,0 +1,103 @@
+"""
+Per-wedding cache helpers for the Wedding Management System
+
+Every wedding has a version number stored in the cache. Cache keys for data
+belonging to a wedding embed that version, so invalidating everything cached
+for a wedding is a single bump of the version (see the signals modules of the
+weddings, guests and gallery apps). Old entries are never deleted explicitly;
+they simply stop being read and expire on their own.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = getattr(settings, 'WEDDING_CACHE_TIMEOUT', 60 * 15)
+
+
+def _version_key(wedding_id):
+    return f"wedding:{wedding_id}:version"
+
+
+def _new_version():
+    # Time based so a version that was evicted from the cache is never reused
+    return int(time.time() * 1000)
+
+
+def get_wedding_cache_version(wedding_id):
+    """
+    Get the current cache version of a wedding
+
+    Args:
+        wedding_id (int): Wedding ID
+
+    Returns:
+        int: Version number to embed in cache keys
+    """
+    key = _version_key(wedding_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_wedding_cache_version(wedding_id):
+    """
+    Invalidate everything cached for a wedding
+
+    Args:
+        wedding_id (int): Wedding ID
+    """
+    if wedding_id is None:
+        return
+    key = _version_key(wedding_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def bump_wedding_cache_versions(wedding_ids):
+    """Invalidate the cache of several weddings, e.g. after a QuerySet.update()"""
+    for wedding_id in set(wedding_ids):
+        bump_wedding_cache_version(wedding_id)
+
+
+def wedding_cache_key(wedding_id, name, *parts):
+    """
+    Build a versioned cache key for data belonging to a wedding
+
+    Args:
+        wedding_id (int): Wedding ID
+        name (str): Name of the cached value
+        *parts: Extra values the cached data varies on
+
+    Returns:
+        str: Cache key
+    """
+    version = get_wedding_cache_version(wedding_id)
+    suffix = ':'.join(str(part) for part in parts)
+    return f"wedding:{wedding_id}:v{version}:{name}:{suffix}"
+
+
+def cached_for_wedding(wedding_id, name, compute, *parts, timeout=None):
+    """
+    Return a cached value for a wedding, computing and storing it on a miss
+
+    Args:
+        wedding_id (int): Wedding ID
+        name (str): Name of the cached value
+        compute (callable): Called without arguments to build the value
+        *parts: Extra values the cached data varies on
+        timeout (int): Cache timeout in seconds (optional)
+
+    Returns:
+        The cached or freshly computed value
+    """
+    key = wedding_cache_key(wedding_id, name, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, DEFAULT_TIMEOUT if timeout is None else timeout)
+    return value
@@ -0,0 +1,153 @@
+"""
+Signed-cookie sessions for guests
+
+With GUEST_SESSION_MODE = 'signed', guests who log in with their QR code or
+credential are not given a database session. They get a signed cookie
+holding their GuestCredential token instead, and GuestSessionMiddleware turns
+that cookie back into request.user. The credential and user are cached
+briefly, so on event day a scanning crowd browsing event info and the gallery
+causes no session table reads or writes at all.
+
+The cookie stops working when it expires, when the credential expires, or when
+the credential is deleted or replaced (its token changes).
+"""
+from django.conf import settings
+from django.contrib.auth import login
+from django.core import signing
+from django.core.cache import cache
+from django.shortcuts import redirect
+from django.utils import timezone
+
+COOKIE_NAME = getattr(settings, 'GUEST_SESSION_COOKIE_NAME', 'wms_guest')
+SALT = 'wms.guest_session'
+
+# How long a credential lookup is reused before it is checked again (seconds)
+CACHE_TIMEOUT = 60 * 5
+
+
+def signed_mode():
+    """Whether guests get signed-cookie sessions instead of database sessions"""
+    return getattr(settings, 'GUEST_SESSION_MODE', 'database') == 'signed'
+
+
+def _cache_key(token):
+    return f"guest_session:{token}"
+
+
+def forget_credential(token):
+    """Drop the cached lookup of a credential, e.g. after it changed"""
+    cache.delete(_cache_key(token))
+
+
+def _load(token):
+    """Return (user, expiry_date) for a credential token, or None"""
+    key = _cache_key(token)
+    entry = cache.get(key)
+    if entry is None:
+        from guests.models import GuestCredential
+
+        credential = (
+            GuestCredential.objects.select_related('guest__user__profile')
+            .filter(token=token)
+            .first()
+        )
+        if credential is None or credential.guest.user is None:
+            entry = False
+        else:
+            entry = (credential.guest.user, credential.expiry_date)
+        cache.set(key, entry, CACHE_TIMEOUT)
+    return entry or None
+
+
+def guest_login_redirect(request, credential, user, to='dashboard'):
+    """
+    Log a guest in and redirect, using the configured session mode
+
+    Args:
+        request: HttpRequest
+        credential: GuestCredential the guest proved they hold
+        user: The guest's User
+        to (str): URL name to redirect to
+
+    Returns:
+        HttpResponseRedirect
+    """
+    if not signed_mode():
+        login(request, user)
+        return redirect(to)
+
+    response = redirect(to)
+    max_age = min(
+        getattr(settings, 'GUEST_SESSION_AGE', settings.SESSION_COOKIE_AGE),
+        max(int((credential.expiry_date - timezone.now()).total_seconds()), 0),
+    )
+    response.set_cookie(
+        COOKIE_NAME,
+        signing.dumps(str(credential.token), salt=SALT),
+        max_age=max_age,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
+    return response
+
+
+def end_guest_session(response):
+    """Remove the guest session cookie from a response (logout)"""
+    response.delete_cookie(COOKIE_NAME, samesite=settings.SESSION_COOKIE_SAMESITE)
+    return response
+
+
+class GuestSessionMiddleware:
+    """
+    Authenticate guests from their signed session cookie
+
+    Must come after AuthenticationMiddleware. A user logged in through a
+    regular session keeps it, so staff logins are unaffected; a session
+    cookie without a logged-in user (stale, or anonymous) does not log the
+    guest out.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        value = request.COOKIES.get(COOKIE_NAME)
+        if value and not self._has_session_login(request):
+            user = self._authenticate(value)
+            if user is not None:
+                request.user = user
+                # Async views and the async login_required read request.auser()
+                request.auser = self._auser(user)
+            else:
+                response = self.get_response(request)
+                return end_guest_session(response)
+        return self.get_response(request)
+
+    @staticmethod
+    def _has_session_login(request):
+        # Without a session cookie there is no session to read
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+        return request.user.is_authenticated
+
+    @staticmethod
+    def _auser(user):
+        async def auser():
+            return user
+        return auser
+
+    def _authenticate(self, value):
+        max_age = getattr(settings, 'GUEST_SESSION_AGE', settings.SESSION_COOKIE_AGE)
+        try:
+            token = signing.loads(value, salt=SALT, max_age=max_age)
+        except signing.BadSignature:
+            return None
+
+        entry = _load(token)
+        if entry is None:
+            return None
+        user, expiry_date = entry
+        if timezone.now() >= expiry_date or not user.is_active:
+            return None
+        return user
@@ -0,0 +1,103 @@
+"""
+Conditional GET helpers for the Wedding Management System
+
+Views decorated with conditional_page() answer repeat requests with
+``304 Not Modified`` when nothing they display has changed. Each view
+provides a cheap "state" function, usually a single aggregate query over the
+``updated_at`` fields of the rows it renders, that returns the newest
+modification time plus any extra values (row counts etc.) the page depends on.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+
+def subquery_aggregate(queryset, field, aggregate):
+    """
+    Build a correlated subquery aggregating rows related to the outer row
+
+    Args:
+        queryset: QuerySet of the related rows
+        field (str): Name of the foreign key pointing at the outer model
+        aggregate: Aggregate expression, e.g. Max('updated_at')
+
+    Returns:
+        Subquery: Expression usable in annotate()
+    """
+    return Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(value=aggregate)
+        .values('value')[:1]
+    )
+
+
+def latest(*values):
+    """Return the newest of several datetimes, ignoring missing ones"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _has_pending_messages(request):
+    # Flash messages are rendered into the page once, so a page carrying one
+    # must never be answered with a 304
+    return len(messages.get_messages(request)) > 0
+
+
+def _page_state(request, state_func, args, kwargs):
+    """Compute the state of a page once per request"""
+    if not hasattr(request, '_page_state'):
+        state = None
+        if request.method in ('GET', 'HEAD') and not _has_pending_messages(request):
+            state = state_func(request, *args, **kwargs)
+        request._page_state = state
+    return request._page_state
+
+
+def conditional_page(state_func):
+    """
+    Decorator adding ETag/Last-Modified handling to a view
+
+    Args:
+        state_func (callable): Called with the view's arguments. Returns a tuple
+            ``(last_modified, parts)`` where parts is any hashable summary of the
+            data the page shows, or None to skip conditional handling.
+
+    The ETag also covers the requesting user, their CSRF cookie and the current
+    date, because pages render per-user links, CSRF tokens and date-dependent
+    badges such as "overdue". Responses are marked ``private, no-cache`` so
+    browsers always revalidate instead of showing a stale copy.
+    """
+    def etag_func(request, *args, **kwargs):
+        state = _page_state(request, state_func, args, kwargs)
+        if state is None:
+            return None
+        last_modified, parts = state
+        payload = repr((
+            getattr(settings, 'CONDITIONAL_GET_SALT', ''),
+            request.user.pk,
+            request.META.get('CSRF_COOKIE'),
+            timezone.localdate(),
+            last_modified,
+            parts,
+        ))
+        return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        state = _page_state(request, state_func, args, kwargs)
+        if state is None:
+            return None
+        return state[0]
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+        return wraps(view_func)(cache_control(private=True, no_cache=True)(conditional_view))
+
+    return decorator
@@ -0,0 +1,207 @@
+"""
+Live wedding updates
+
+An in-process publish/subscribe hub that pushes small deltas (guest check-ins,
+RSVP changes, new media) to the coordinators watching a wedding, so their
+pages can update in place instead of being reloaded. Events are published
+from model signals once the saving transaction commits (see guests/signals.py
+and gallery/signals.py) and delivered by the server-sent events and long-poll
+views in weddings/views.py.
+
+Each wedding keeps its last LIVE_BUFFER_SIZE events so a client that
+reconnects with the id of the last event it saw gets everything it missed.
+If events it needs are gone (buffer overflow, server restart, or it
+reconnected to another process), it receives a 'reset' event and should
+reload the page.
+
+The hub lives in process memory: with several server processes, a client
+only sees events published by the process it is connected to. Run a single
+ASGI process for the event-day dashboard, or put the stream behind a sticky
+route.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+# Events kept per wedding for clients that reconnect
+BUFFER_SIZE = getattr(settings, 'LIVE_BUFFER_SIZE', 200)
+
+# Seconds an event stream stays open before the browser reconnects, and a
+# long-poll request waits for events
+STREAM_DURATION = getattr(settings, 'LIVE_STREAM_DURATION', 60 * 5)
+POLL_TIMEOUT = getattr(settings, 'LIVE_POLL_TIMEOUT', 25)
+
+LiveEvent = namedtuple('LiveEvent', 'id kind data')
+
+# Event ids increase across the process lifetime. Starting from the clock
+# makes ids from before a restart look older than anything buffered now.
+_ids = itertools.count(int(time.time() * 1000))
+_latest_id = 0
+_lock = threading.Condition()
+_channels = {}
+
+
+def _next_id():
+    global _latest_id
+    _latest_id = next(_ids)
+    return _latest_id
+
+
+class _Channel:
+    """Buffered events and waiting subscribers of one wedding"""
+
+    def __init__(self, horizon):
+        self.events = deque()
+        # Clients that last saw an event older than this may have missed some
+        self.horizon = horizon
+        self.waiters = set()
+
+
+def _channel(wedding_id):
+    channel = _channels.get(wedding_id)
+    if channel is None:
+        channel = _channels[wedding_id] = _Channel(_next_id())
+    return channel
+
+
+def publish(wedding_id, kind, data):
+    """
+    Send an event to everyone watching a wedding, right away
+
+    Args:
+        wedding_id (int): Wedding ID
+        kind (str): Event type, e.g. 'checkin', 'rsvp' or 'media'
+        data (dict): JSON-serializable payload
+    """
+    with _lock:
+        channel = _channel(wedding_id)
+        channel.events.append(LiveEvent(_next_id(), kind, data))
+        while len(channel.events) > BUFFER_SIZE:
+            channel.horizon = channel.events.popleft().id
+        waiters = list(channel.waiters)
+        _lock.notify_all()
+
+    # Wake async subscribers in their own event loops
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+def publish_on_commit(wedding_id, kind, data):
+    """Publish an event once the current transaction commits (right away outside one)"""
+    transaction.on_commit(lambda: publish(wedding_id, kind, data))
+
+
+def _pending(wedding_id, last_id):
+    """Events after last_id; [reset event] if some may have been missed (lock held)"""
+    channel = _channel(wedding_id)
+    if last_id is None:
+        return []
+    if last_id < channel.horizon or last_id > _latest_id:
+        # Too old, or issued by another process
+        return [LiveEvent(channel.horizon, 'reset', {})]
+    return [event for event in channel.events if event.id > last_id]
+
+
+def current_id(wedding_id):
+    """The id a new subscriber should start after"""
+    with _lock:
+        channel = _channel(wedding_id)
+        return channel.events[-1].id if channel.events else channel.horizon
+
+
+def wait_for_events(wedding_id, last_id, timeout):
+    """
+    Block until there are events after last_id, or the timeout passes
+
+    Args:
+        wedding_id (int): Wedding ID
+        last_id (int): Id of the last event the client saw
+        timeout (float): Seconds to wait at most
+
+    Returns:
+        list: LiveEvent objects, possibly empty
+    """
+    with _lock:
+        _lock.wait_for(lambda: _pending(wedding_id, last_id), timeout)
+        return _pending(wedding_id, last_id)
+
+
+async def await_events(wedding_id, last_id, timeout):
+    """Async version of wait_for_events that does not hold a thread while waiting"""
+    event = asyncio.Event()
+    waiter = (asyncio.get_running_loop(), event)
+    with _lock:
+        events = _pending(wedding_id, last_id)
+        if events:
+            return events
+        channel = _channel(wedding_id)
+        channel.waiters.add(waiter)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with _lock:
+            channel.waiters.discard(waiter)
+    with _lock:
+        return _pending(wedding_id, last_id)
+
+
+def format_sse(event):
+    """Encode a LiveEvent as a server-sent events message"""
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.data)}\n\n"
+
+
+def _stream_start(wedding_id, last_id):
+    """(last_id, opening message) of a new stream"""
+    if last_id is None:
+        # Tell the client where it starts, so a reconnect can resume from here
+        last_id = current_id(wedding_id)
+        return last_id, f"retry: 3000\nid: {last_id}\n\n"
+    return last_id, "retry: 3000\n\n"
+
+
+async def aevent_stream(wedding_id, last_id, duration, keepalive=15):
+    """
+    Server-sent events stream of a wedding (async iterator, for ASGI)
+
+    Args:
+        wedding_id (int): Wedding ID
+        last_id (int): Last-Event-ID sent by a reconnecting client, or None
+        duration (float): Seconds after which the stream ends; browsers
+            reconnect on their own and resume from the last event id
+        keepalive (float): Seconds between comments that keep proxies from
+            closing an idle connection
+    """
+    last_id, opening = _stream_start(wedding_id, last_id)
+    yield opening
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events = await await_events(wedding_id, last_id, min(keepalive, deadline - time.monotonic()))
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+        for event in events:
+            yield format_sse(event)
+        last_id = events[-1].id
+
+
+def event_stream(wedding_id, last_id, duration, keepalive=15):
+    """Blocking version of aevent_stream, for WSGI servers (holds a thread while open)"""
+    last_id, opening = _stream_start(wedding_id, last_id)
+    yield opening
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events = wait_for_events(wedding_id, last_id, min(keepalive, deadline - time.monotonic()))
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+        for event in events:
+            yield format_sse(event)
+        last_id = events[-1].id
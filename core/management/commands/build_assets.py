@@ -0,0 +1,84 @@
+import os
+import re
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+BUILD_DIR = os.path.join(settings.BASE_DIR, 'static', 'build')
+NODE_MODULES = os.path.join(settings.BASE_DIR, 'node_modules')
+
+# (npm package, output name, stylesheets) for self-hosted fonts; the same
+# weights the Google Fonts link in base.html asks for
+FONTS = [
+    ('@fontsource/poppins', 'poppins', ['300', '400', '500', '600', '700']),
+    ('@fontsource/playfair-display', 'playfair-display', ['400', '500', '600', '700', '400-italic']),
+]
+
+FONT_URL_RE = re.compile(r'url\(\./files/([^)]+)\)')
+
+
+class Command(BaseCommand):
+    help = "Build the site stylesheet, copy self-hosted fonts and icons, and collect static files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-npm', action='store_true',
+                            help="Use the node_modules and CSS already built instead of running npm")
+        parser.add_argument('--no-collect', action='store_true',
+                            help="Only build into static/build/; do not run collectstatic")
+
+    def handle(self, *args, **options):
+        if not options['skip_npm']:
+            self._npm('install', '--no-audit', '--no-fund')
+            self._npm('run', 'build:css')
+            self.stdout.write("  ✓ Tailwind stylesheet built")
+
+        if not os.path.isdir(NODE_MODULES):
+            raise CommandError("node_modules is missing; run without --skip-npm first.")
+        self._copy_fontawesome()
+        for package, name, styles in FONTS:
+            self._copy_font(package, name, styles)
+        self.stdout.write("  ✓ Fonts and icons copied")
+
+        if not options['no_collect']:
+            # Writes hashed names and .gz/.br copies (core.staticfiles)
+            call_command('collectstatic', interactive=False, verbosity=0)
+            self.stdout.write(f"  ✓ Static files collected to {settings.STATIC_ROOT}")
+
+        self.stdout.write(self.style.SUCCESS("Assets built. Set WMS_STATIC_ASSETS=local if it is not picked up."))
+
+    def _npm(self, *args):
+        npm = shutil.which('npm')
+        if npm is None:
+            raise CommandError("npm was not found; install Node.js or use --skip-npm.")
+        result = subprocess.run([npm, *args], cwd=settings.BASE_DIR)
+        if result.returncode != 0:
+            raise CommandError(f"npm {' '.join(args)} failed.")
+
+    def _copy_fontawesome(self):
+        source = os.path.join(NODE_MODULES, '@fortawesome', 'fontawesome-free')
+        target = os.path.join(BUILD_DIR, 'vendor', 'fontawesome')
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(os.path.join(target, 'css'))
+        shutil.copy(os.path.join(source, 'css', 'all.min.css'), os.path.join(target, 'css'))
+        shutil.copytree(os.path.join(source, 'webfonts'), os.path.join(target, 'webfonts'))
+
+    def _copy_font(self, package, name, styles):
+        """Combine the font's stylesheets into one and copy the files they use"""
+        source = os.path.join(NODE_MODULES, *package.split('/'))
+        target = os.path.join(BUILD_DIR, 'vendor', 'fonts')
+        shutil.rmtree(os.path.join(target, name), ignore_errors=True)
+        os.makedirs(os.path.join(target, name))
+
+        css = []
+        for style in styles:
+            with open(os.path.join(source, f"{style}.css"), encoding='utf-8') as f:
+                stylesheet = f.read()
+            for filename in FONT_URL_RE.findall(stylesheet):
+                shutil.copy(os.path.join(source, 'files', filename), os.path.join(target, name, filename))
+            css.append(FONT_URL_RE.sub(lambda match: f"url(./{name}/{match.group(1)})", stylesheet))
+
+        with open(os.path.join(target, f"{name}.css"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(css))
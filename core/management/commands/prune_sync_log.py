@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.sync import RETENTION, prune_sync_log
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones and stored mutation results past the retention period"
+
+    def handle(self, *args, **options):
+        tombstones, mutations = prune_sync_log()
+        self.stdout.write(f"  ✓ {tombstones} tombstones and {mutations} mutation results deleted")
+        self.stdout.write(self.style.SUCCESS(f"Sync log pruned to the last {RETENTION.days} days."))
@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.apps import apps
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from core.models import Blob
+from core.storage import ContentAddressedStorage, content_addressed_storage
+
+BATCH_SIZE = 500
+
+
+def content_addressed_fields():
+    """(model, field name) of every file field stored in content-addressed storage"""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field.name
+
+
+class Command(BaseCommand):
+    help = "Recount references to content-addressed files and move older files into that storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true',
+                            help='Move files stored before content addressing to their hashed names')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Delete stored files no row refers to any more')
+
+    def handle(self, *args, **options):
+        fields = list(content_addressed_fields())
+
+        if options['adopt']:
+            adopted = sum(self._adopt(model, name) for model, name in fields)
+            self.stdout.write(f"  ✓ {adopted} older files moved to content-addressed names")
+
+        references = Counter()
+        for model, name in fields:
+            names = model._default_manager.exclude(**{name: ''}).exclude(**{f"{name}__isnull": True})
+            references.update(names.values_list(name, flat=True).iterator(chunk_size=BATCH_SIZE))
+
+        fixed, orphans = [], []
+        for blob in Blob.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+            count = references.get(blob.name, 0)
+            if count == 0:
+                orphans.append(blob)
+            elif blob.refcount != count:
+                blob.refcount = count
+                fixed.append(blob)
+        Blob.objects.bulk_update(fixed, ['refcount'], batch_size=BATCH_SIZE)
+        self.stdout.write(f"  ✓ {len(fixed)} reference counts corrected")
+
+        if orphans and options['delete_orphans']:
+            storage = content_addressed_storage()
+            for blob in orphans:
+                storage.delete(blob.name)
+            self.stdout.write(f"  ✓ {len(orphans)} unreferenced files deleted")
+        elif orphans:
+            self.stdout.write(f"  ✗ {len(orphans)} files are not referenced; run with --delete-orphans to delete them")
+
+        self.stdout.write(self.style.SUCCESS("Content-addressed storage is consistent."))
+
+    def _adopt(self, model, name):
+        """Re-store files of one field whose names are not blobs yet"""
+        storage = model._meta.get_field(name).storage
+        known = set(Blob.objects.values_list('name', flat=True))
+        rows = (
+            model._default_manager.exclude(**{name: ''}).exclude(**{f"{name}__isnull": True})
+            .values_list('pk', name).order_by('pk')
+        )
+        adopted = 0
+        for pk, old_name in rows.iterator(chunk_size=BATCH_SIZE):
+            if old_name in known:
+                continue
+            if not storage.exists(old_name):
+                self.stdout.write(f"  ✗ {model.__name__} {pk}: {old_name} is missing")
+                continue
+            with storage.open(old_name, 'rb') as f:
+                new_name = storage.save(old_name, File(f, name=old_name))
+            # update() keeps upload dates and the like untouched and skips signals
+            model._default_manager.filter(pk=pk).update(**{name: new_name})
+            known.add(new_name)
+            if not model._default_manager.filter(**{name: old_name}).exists():
+                storage.delete(old_name)
+            adopted += 1
+        return adopted
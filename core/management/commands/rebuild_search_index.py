@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild (default: default)')
+
+    def handle(self, *args, **options):
+        counts = rebuild_search_index(options['database'])
+        if not counts:
+            self.stdout.write(self.style.WARNING("This database has no search index; searches fall back to icontains."))
+            return
+
+        for kind, count in counts.items():
+            self.stdout.write(f"  ✓ {count} {kind} documents")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from core.search import ensure_search_index
+
+    ensure_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
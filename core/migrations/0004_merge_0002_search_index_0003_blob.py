@@ -0,0 +1,12 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_search_index'),
+        ('core', '0003_blob'),
+    ]
+
+    operations = [
+    ]
@@ -23,3 +23,40 @@ class UserProfile(models.Model):
     @property
     def full_name(self):
         return f"{self.user.first_name} {self.user.last_name}"
+
+class Tombstone(models.Model):
+    """Record of a deleted row, so syncing devices learn about the deletion"""
+    model = models.CharField(max_length=30)
+    object_id = models.PositiveBigIntegerField()
+    wedding_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['wedding_id', 'deleted_at'])]
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id}"
+
+class SyncMutation(models.Model):
+    """A change sent by a syncing device, kept so a retried batch is not applied twice"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_mutations')
+    mutation_id = models.CharField(max_length=64)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'mutation_id')
+
+    def __str__(self):
+        return f"Mutation {self.mutation_id} by {self.user.username}"
+
+class Blob(models.Model):
+    """A file in content-addressed storage and the number of rows referring to it"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,91 @@
+"""
+Password hashing policy for the Wedding Management System
+
+Different kinds of accounts get different hashing costs:
+
+- 'staff': admins and team members, hashed with the first (strong) hasher
+  in PASSWORD_HASHERS.
+- 'seed': generated demo and test accounts, hashed with
+  SEED_PASSWORD_HASHER: the strong hasher, or MD5 on demo databases that
+  opted in with WMS_FAST_SEED_PASSWORDS. If such an account ever logs in,
+  Django rehashes its password with the strong hasher.
+- 'guest': accounts that only exist so a wedding guest can be logged in.
+  They have no usable password at all; guests prove who they are with their
+  GuestCredential (QR code token, or credential username and password), so
+  logging in never runs a password hasher.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.utils.crypto import constant_time_compare
+
+ACCOUNT_CLASSES = ('staff', 'seed', 'guest')
+
+
+def make_account_password(password, account_class='staff'):
+    """
+    Hash a password according to the policy of an account class
+
+    Args:
+        password (str): Plain text password
+        account_class (str): 'staff', 'seed' or 'guest'
+
+    Returns:
+        str: Encoded password for User.password
+    """
+    if account_class not in ACCOUNT_CLASSES:
+        raise ValueError(f"Unknown account class: {account_class}")
+    if account_class == 'guest':
+        return make_password(None)
+    if account_class == 'seed':
+        hasher = get_hasher(getattr(settings, 'SEED_PASSWORD_HASHER', 'default'))
+        return make_password(password, hasher=hasher)
+    return make_password(password)
+
+
+def set_account_password(user, password, account_class='staff'):
+    """Set a user's password according to the policy of an account class (does not save)"""
+    user.password = make_account_password(password, account_class)
+    user._password = password
+
+
+def check_guest_credential(credential, password):
+    """
+    Check a password against a guest credential without hashing
+
+    Args:
+        credential: GuestCredential object
+        password (str): Submitted password
+
+    Returns:
+        bool: True if the password matches
+    """
+    return bool(credential.password) and constant_time_compare(credential.password, password or '')
+
+
+def create_guest_user(guest, username):
+    """
+    Create the login account of a guest
+
+    The account gets an unusable password; the guest logs in with their
+    credential instead.
+
+    Args:
+        guest: Guest object, linked to the new user
+        username (str): Username for the account
+
+    Returns:
+        User: The new user
+    """
+    from .models import UserProfile
+
+    user = User.objects.create(
+        username=username,
+        email=guest.email or '',
+        password=make_account_password(None, 'guest'),
+    )
+    UserProfile.objects.create(user=user, role='guest')
+
+    guest.user = user
+    guest.save()
+    return user
@@ -0,0 +1,318 @@
+"""
+Full-text search for the Wedding Management System
+
+Guests, tasks, task comments, media and events are copied into a single
+inverted index as they are saved (see the search and signals modules of each
+app), so a search never scans the application tables:
+
+- SQLite: an FTS5 virtual table ranked with bm25()
+- PostgreSQL: a table with a generated tsvector column and a GIN index,
+  ranked with ts_rank()
+- Other databases: a slower icontains fallback over the registered fields
+
+Every document belongs to one wedding. Its row id is derived from its type
+and primary key, so updating or removing a document is a single lookup.
+
+The table is created by a core migration, so saves never run DDL: creating
+it inside a request or test transaction that then rolls back leaves SQLite
+unable to open savepoints on that connection afterwards.
+
+Existing data can be (re)indexed with ``python manage.py rebuild_search_index``.
+"""
+import re
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.html import escape
+
+SEARCH_TABLE = 'search_index'
+
+# Markers around matched words in snippets, turned into <mark> after escaping
+_START, _STOP = '\x02', '\x03'
+
+MAX_TERMS = 8
+
+SearchType = namedtuple('SearchType', 'kind code model wedding_field search_fields document related')
+
+_registry = {}
+
+
+def register(kind, code, model, wedding_field, search_fields, document, related=()):
+    """
+    Register a model with the search index
+
+    Args:
+        kind (str): Result type, e.g. 'guest'
+        code (int): Unique number 1-15 used to build row ids
+        model: Model class
+        wedding_field (str): Lookup path to the wedding, e.g. 'task__wedding'
+        search_fields (tuple): Fields searched by the icontains fallback
+        document (callable): Called with an instance, returns a dict with
+            wedding_id, title, body, url and staff_only
+        related (tuple): select_related() paths needed by document when reindexing
+    """
+    _registry[kind] = SearchType(kind, code, model, wedding_field, tuple(search_fields), document, tuple(related))
+
+
+def _type_for(model):
+    for search_type in _registry.values():
+        if issubclass(model, search_type.model):
+            return search_type
+    return None
+
+
+def _row_id(search_type, object_id):
+    return object_id * 16 + search_type.code
+
+
+def _terms(query):
+    """Split a user query into lower-case word tokens"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _connection(instance):
+    return connections[instance._state.db or router.db_for_write(type(instance))]
+
+
+def ensure_search_index(connection):
+    """Create the index table on a database if it does not exist yet (migrations, rebuilds)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "wedding, title, body, "
+                "kind UNINDEXED, object_id UNINDEXED, url UNINDEXED, staff_only UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                "row_id bigint PRIMARY KEY, "
+                "wedding_id bigint NOT NULL, "
+                "kind varchar(20) NOT NULL, "
+                "object_id bigint NOT NULL, "
+                "title text NOT NULL, "
+                "body text NOT NULL, "
+                "url text NOT NULL, "
+                "staff_only boolean NOT NULL, "
+                "document tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('simple', title), 'A') || "
+                "setweight(to_tsvector('simple', body), 'B')) STORED)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_wedding ON {SEARCH_TABLE} (wedding_id)")
+
+
+def _document_row(search_type, instance):
+    doc = search_type.document(instance)
+    if doc['wedding_id'] is None:
+        return None
+    return (
+        _row_id(search_type, instance.pk),
+        doc['wedding_id'],
+        search_type.kind,
+        instance.pk,
+        doc['title'] or '',
+        ' '.join(part for part in doc['body'] if part),
+        doc['url'],
+        bool(doc['staff_only']),
+    )
+
+
+def _write_rows(connection, rows):
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, wedding, kind, object_id, title, body, url, staff_only) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                [(row[0], f"w{row[1]}", *row[2:7], int(row[7])) for row in rows],
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (row_id, wedding_id, kind, object_id, title, body, url, staff_only) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+                "ON CONFLICT (row_id) DO UPDATE SET wedding_id = EXCLUDED.wedding_id, title = EXCLUDED.title, "
+                "body = EXCLUDED.body, url = EXCLUDED.url, staff_only = EXCLUDED.staff_only",
+                rows,
+            )
+
+
+def index_object(instance):
+    """Add or update the search document of a saved object"""
+    search_type = _type_for(type(instance))
+    connection = _connection(instance)
+    if search_type is None or connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    row = _document_row(search_type, instance)
+    if row is None:
+        remove_object(instance)
+    else:
+        _write_rows(connection, [row])
+
+
+def remove_object(instance):
+    """Remove the search document of a deleted object"""
+    search_type = _type_for(type(instance))
+    connection = _connection(instance)
+    if search_type is None or connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    id_column = 'rowid' if connection.vendor == 'sqlite' else 'row_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {id_column} = %s", [_row_id(search_type, instance.pk)])
+
+
+def index_queryset(queryset, batch_size=1000):
+    """
+    (Re)index every object of a queryset, e.g. after QuerySet.update()
+
+    Returns:
+        int: Number of documents written
+    """
+    search_type = _type_for(queryset.model)
+    connection = connections[queryset.db]
+    if search_type is None or connection.vendor not in ('sqlite', 'postgresql'):
+        return 0
+
+    count = 0
+    rows = []
+    for instance in queryset.select_related(*search_type.related).iterator(chunk_size=batch_size):
+        row = _document_row(search_type, instance)
+        if row is not None:
+            rows.append(row)
+        if len(rows) >= batch_size:
+            _write_rows(connection, rows)
+            count += len(rows)
+            rows = []
+    _write_rows(connection, rows)
+    return count + len(rows)
+
+
+def rebuild_search_index(using='default'):
+    """
+    Empty the index and fill it from all registered models
+
+    Returns:
+        dict: Number of documents indexed per type
+    """
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return {}
+    ensure_search_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    return {
+        kind: index_queryset(search_type.model._default_manager.using(using).all())
+        for kind, search_type in _registry.items()
+    }
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _search_sqlite(connection, wedding_id, terms, kinds, include_staff_only, limit):
+    match = f'wedding : "w{wedding_id}" AND {{title body}} : (' + ' AND '.join(f'"{term}"*' for term in terms) + ')'
+    sql = (
+        f"SELECT kind, object_id, title, url, "
+        f"snippet({SEARCH_TABLE}, 2, %s, %s, '…', 12), bm25({SEARCH_TABLE}, 0.0, 10.0, 1.0) AS score "
+        f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+    )
+    params = [_START, _STOP, match]
+    if not include_staff_only:
+        sql += " AND staff_only = 0"
+    if kinds:
+        sql += f" AND kind IN ({', '.join(['%s'] * len(kinds))})"
+        params += list(kinds)
+    sql += " ORDER BY score LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # bm25() is lower for better matches
+        return [(kind, object_id, title, url, snippet, -score) for kind, object_id, title, url, snippet, score in cursor.fetchall()]
+
+
+def _search_postgresql(connection, wedding_id, terms, kinds, include_staff_only, limit):
+    tsquery = ' & '.join(f"{term}:*" for term in terms)
+    sql = (
+        f"SELECT kind, object_id, title, url, "
+        f"ts_headline('simple', body, query, %s), ts_rank(document, query) AS score "
+        f"FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+        f"WHERE wedding_id = %s AND document @@ query"
+    )
+    params = [f'StartSel={_START}, StopSel={_STOP}, MaxWords=20, MinWords=5', tsquery, wedding_id]
+    if not include_staff_only:
+        sql += " AND NOT staff_only"
+    if kinds:
+        sql += " AND kind = ANY(%s)"
+        params.append(list(kinds))
+    sql += " ORDER BY score DESC LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_fallback(wedding_id, terms, kinds, include_staff_only, limit):
+    rows = []
+    for kind, search_type in _registry.items():
+        if kinds and kind not in kinds:
+            continue
+        queryset = search_type.model._default_manager.filter(**{search_type.wedding_field: wedding_id})
+        for term in terms:
+            queryset = queryset.filter(reduce(or_, [Q(**{f"{field}__icontains": term}) for field in search_type.search_fields]))
+        for instance in queryset.select_related(*search_type.related)[:limit]:
+            doc = search_type.document(instance)
+            if doc['staff_only'] and not include_staff_only:
+                continue
+            body = ' '.join(part for part in doc['body'] if part)
+            rows.append((kind, instance.pk, doc['title'], doc['url'], body[:120], 0.0))
+    return rows[:limit]
+
+
+def search_wedding(wedding_id, query, kinds=None, include_staff_only=False, limit=20, using='default'):
+    """
+    Search everything indexed for a wedding
+
+    Args:
+        wedding_id (int): Wedding ID
+        query (str): Words to look for; every word must match the start of a word
+        kinds (list): Result types to include (optional, default all)
+        include_staff_only (bool): Whether to include guests, tasks and private media
+        limit (int): Maximum number of results
+        using (str): Database alias
+
+    Returns:
+        list: Dicts with type, id, title, url, snippet (HTML) and score, best first
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        rows = _search_sqlite(connection, wedding_id, terms, kinds, include_staff_only, limit)
+    elif connection.vendor == 'postgresql':
+        rows = _search_postgresql(connection, wedding_id, terms, kinds, include_staff_only, limit)
+    else:
+        rows = _search_fallback(wedding_id, terms, kinds, include_staff_only, limit)
+
+    return [
+        {
+            'type': kind,
+            'id': object_id,
+            'title': title,
+            'url': url,
+            'snippet': _highlight(snippet or ''),
+            'score': round(float(score), 4),
+        }
+        for kind, object_id, title, url, snippet, score in rows
+    ]
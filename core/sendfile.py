@@ -0,0 +1,175 @@
+"""
+File serving helpers for the Wedding Management System
+
+Views check permissions and then call sendfile_response(). Depending on the
+SENDFILE_BACKEND setting the actual bytes are sent either by the front web
+server (nginx X-Accel-Redirect, Apache/lighttpd X-Sendfile) or, as a fallback,
+streamed by Django in chunks with support for HTTP Range requests so videos
+can be seeked without downloading them first.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _content_disposition(filename, attachment):
+    disposition = 'attachment' if attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range Range header
+
+    Returns:
+        tuple: (start, end) inclusive byte positions, None if the header is
+        absent or not understood, or False if the range cannot be satisfied
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple ranges or another unit; serve the whole file instead
+        return None
+
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _file_iterator(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request, path, content_type=None, filename=None, attachment=False):
+    """
+    Stream a file from Django, honouring Range and If-Modified-Since headers
+
+    Args:
+        request: HttpRequest
+        path (str): Absolute path of the file
+        content_type (str): Content type (optional, guessed from the name)
+        filename (str): Download name (optional)
+        attachment (bool): Whether to ask the browser to download the file
+
+    Returns:
+        HttpResponse: 200, 206, 304 or 416 response
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("File not found.")
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    size = stat.st_size
+    byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+
+    # A Range request against a file that changed since the client's copy gets the whole file
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range and if_range and if_range != http_date(stat.st_mtime):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_file_iterator(path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        length = size
+        response = StreamingHttpResponse(_file_iterator(path, 0, size), content_type=content_type)
+
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = _content_disposition(filename or os.path.basename(path), attachment)
+    return response
+
+
+def sendfile_response(request, path, content_type=None, filename=None, attachment=False):
+    """
+    Send a file using the configured SENDFILE_BACKEND
+
+    SENDFILE_BACKEND can be:
+        None       - stream the file from Django (development default)
+        'nginx'    - X-Accel-Redirect to SENDFILE_URL + path relative to SENDFILE_ROOT
+        'apache'   - X-Sendfile with the absolute path (mod_xsendfile)
+        'lighttpd' - X-LIGHTTPD-send-file with the absolute path
+
+    Args:
+        request: HttpRequest
+        path (str): Absolute path of the file
+        content_type (str): Content type (optional, guessed from the name)
+        filename (str): Download name (optional)
+        attachment (bool): Whether to ask the browser to download the file
+
+    Returns:
+        HttpResponse
+    """
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    if not backend:
+        return ranged_file_response(request, path, content_type, filename, attachment)
+
+    if not os.path.exists(path):
+        raise Http404("File not found.")
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = _content_disposition(filename or os.path.basename(path), attachment)
+
+    if backend == 'nginx':
+        root = os.path.abspath(getattr(settings, 'SENDFILE_ROOT', settings.MEDIA_ROOT))
+        relative = os.path.relpath(os.path.abspath(path), root)
+        if relative.startswith('..'):
+            raise Http404("File not found.")
+        response['X-Accel-Redirect'] = quote(settings.SENDFILE_URL.rstrip('/') + '/' + relative.replace(os.sep, '/'))
+    elif backend == 'apache':
+        response['X-Sendfile'] = path
+    elif backend == 'lighttpd':
+        response['X-LIGHTTPD-send-file'] = path
+    else:
+        raise ValueError(f"Unknown SENDFILE_BACKEND: {backend}")
+
+    # The web server fills in the body, length and Range handling itself
+    return response
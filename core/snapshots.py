@@ -0,0 +1,249 @@
+"""
+Database and media snapshots for the Wedding Management System
+
+A snapshot is a copy of a seeded SQLite database together with the media
+directory. Taking one after ``reset_db.py`` has seeded the database means
+later resets (and test fixtures) can skip migrations, password hashing and
+image generation entirely.
+
+Layout of a snapshot::
+
+    snapshots/<name>/db.sqlite3   consistent copy made with the SQLite backup API
+    snapshots/<name>/media/       hard-linked copy of MEDIA_ROOT
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+SNAPSHOT_ROOT = Path(getattr(settings, 'SNAPSHOT_ROOT', Path(settings.BASE_DIR) / 'snapshots'))
+DB_FILENAME = 'db.sqlite3'
+MEDIA_DIRNAME = 'media'
+
+
+def _database_path(using='default'):
+    """Return the file path of a SQLite database alias"""
+    db_settings = settings.DATABASES[using]
+    if db_settings['ENGINE'] != 'django.db.backends.sqlite3':
+        raise ImproperlyConfigured("Snapshots are only supported for SQLite databases.")
+    return Path(db_settings['NAME'])
+
+
+def _snapshot_dir(name):
+    return SNAPSHOT_ROOT / name
+
+
+def _link_or_copy(src, dst):
+    """Hard link a file, falling back to a copy across filesystems"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _link_tree(src, dst):
+    """Replace dst with a hard-linked mirror of src"""
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    if os.path.exists(src):
+        shutil.copytree(src, dst, copy_function=_link_or_copy)
+    else:
+        os.makedirs(dst)
+
+
+def snapshot_exists(name='default'):
+    """Check whether a snapshot with the given name has been taken"""
+    return (_snapshot_dir(name) / DB_FILENAME).exists()
+
+
+def list_snapshots():
+    """
+    List the available snapshots
+
+    Returns:
+        list: Snapshot names, sorted alphabetically
+    """
+    if not SNAPSHOT_ROOT.exists():
+        return []
+    return sorted(entry.name for entry in SNAPSHOT_ROOT.iterdir() if (entry / DB_FILENAME).exists())
+
+
+def create_snapshot(name='default', using='default', include_media=True):
+    """
+    Capture the current database and media directory as a snapshot
+
+    The database is copied with the SQLite online backup API, so the copy is
+    consistent even while the development server is running. Media files are
+    hard-linked, which takes no extra disk space and is near-instant.
+
+    Args:
+        name (str): Snapshot name
+        using (str): Database alias to snapshot
+        include_media (bool): Whether to capture MEDIA_ROOT as well
+
+    Returns:
+        Path: Directory of the new snapshot
+    """
+    db_path = _database_path(using)
+    SNAPSHOT_ROOT.mkdir(parents=True, exist_ok=True)
+
+    # Build the snapshot in a temporary directory and swap it in at the end so
+    # an interrupted run never leaves a half-written snapshot behind
+    staging = Path(tempfile.mkdtemp(prefix=f'.{name}-', dir=SNAPSHOT_ROOT))
+    try:
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(staging / DB_FILENAME)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+        if include_media:
+            _link_tree(settings.MEDIA_ROOT, staging / MEDIA_DIRNAME)
+
+        final = _snapshot_dir(name)
+        if final.exists():
+            shutil.rmtree(final)
+        os.replace(staging, final)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return final
+
+
+def restore_snapshot(name='default', using='default', include_media=True):
+    """
+    Replace the database file and media directory with a snapshot
+
+    Args:
+        name (str): Snapshot name
+        using (str): Database alias to restore into
+        include_media (bool): Whether to restore MEDIA_ROOT as well
+    """
+    snapshot = _snapshot_dir(name)
+    if not snapshot_exists(name):
+        raise FileNotFoundError(f"Snapshot '{name}' does not exist in {SNAPSHOT_ROOT}")
+
+    db_path = _database_path(using)
+
+    # Make sure Django is not holding the old file open
+    connections[using].close()
+
+    # Copy next to the target first so the swap itself is a single rename
+    staging = db_path.with_name(f'.{db_path.name}.restore')
+    shutil.copyfile(snapshot / DB_FILENAME, staging)
+    os.replace(staging, db_path)
+
+    if include_media:
+        _link_tree(snapshot / MEDIA_DIRNAME, settings.MEDIA_ROOT)
+
+
+def load_snapshot(name='default', using='default', include_media=True):
+    """
+    Load a snapshot into an open database connection
+
+    Unlike restore_snapshot() this never touches the database file on disk,
+    which makes it suitable for the in-memory SQLite database Django uses when
+    running tests. It must be called outside of a transaction, e.g. from
+    setUpClass() before calling super().
+
+    Args:
+        name (str): Snapshot name
+        using (str): Database alias to load into
+        include_media (bool): Whether to mirror the snapshot media into MEDIA_ROOT
+    """
+    snapshot = _snapshot_dir(name)
+    if not snapshot_exists(name):
+        raise FileNotFoundError(f"Snapshot '{name}' does not exist in {SNAPSHOT_ROOT}")
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise ImproperlyConfigured("Snapshots are only supported for SQLite databases.")
+
+    connection.ensure_connection()
+    source = sqlite3.connect(snapshot / DB_FILENAME)
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+
+    if include_media:
+        _link_tree(snapshot / MEDIA_DIRNAME, settings.MEDIA_ROOT)
+
+
+def delete_snapshot(name='default'):
+    """Remove a snapshot from disk"""
+    snapshot = _snapshot_dir(name)
+    if snapshot.exists():
+        shutil.rmtree(snapshot)
+
+
+def _backup_connection(connection):
+    """Copy the database behind an open connection into memory"""
+    copy = sqlite3.connect(':memory:')
+    connection.ensure_connection()
+    connection.connection.backup(copy)
+    return copy
+
+
+class SnapshotTestMixin:
+    """
+    Test case mixin that starts every test class from a snapshot
+
+    The test database is copied before the snapshot is loaded and put back
+    after the class, so later test classes never see the snapshot's rows.
+    With snapshot_media, the snapshot's media is linked into a temporary
+    MEDIA_ROOT for the duration of the class; the real one is never touched.
+
+    Usage::
+
+        class GuestListTests(SnapshotTestMixin, TestCase):
+            snapshot_name = 'default'
+    """
+    snapshot_name = 'default'
+    snapshot_media = False
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test import override_settings
+
+        connection = connections['default']
+        cls._database_before_snapshot = _backup_connection(connection)
+        cls._media_settings = None
+        if cls.snapshot_media:
+            cls._media_root = tempfile.mkdtemp(prefix='snapshot-media-')
+            cls._media_settings = override_settings(MEDIA_ROOT=cls._media_root)
+            cls._media_settings.enable()
+        try:
+            load_snapshot(cls.snapshot_name, include_media=cls.snapshot_media)
+            super().setUpClass()
+        except Exception:
+            cls._restore_state()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._restore_state()
+
+    @classmethod
+    def _restore_state(cls):
+        """Put back the test database and MEDIA_ROOT as they were before the snapshot"""
+        saved = cls._database_before_snapshot
+        try:
+            saved.backup(connections['default'].connection)
+        finally:
+            saved.close()
+        if cls._media_settings is not None:
+            cls._media_settings.disable()
+            shutil.rmtree(cls._media_root, ignore_errors=True)
@@ -0,0 +1,151 @@
+"""
+Static asset storage and serving
+
+collectstatic copies assets to STATIC_ROOT under content-hashed names
+(app.3f2a9c.css), so they can be cached forever: a changed file gets a new
+name. CompressedManifestStaticFilesStorage also writes gzip and, when the
+brotli package is installed, brotli copies next to each compressible file
+(app.3f2a9c.css.gz, app.3f2a9c.css.br), so neither nginx nor Django has to
+compress them per request.
+
+In production nginx serves STATIC_ROOT directly (see README, "Static
+Assets"). serve() does the same for deployments without a front server.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional; gzip copies are still written
+    brotli = None
+
+# Extensions worth compressing; images and web fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.map', '.txt', '.xml', '.html', '.ico', '.ttf', '.eot'}
+
+# Compressed copies that save less than this fraction are not kept
+MIN_SAVING = 0.05
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def compress_file(path):
+    """
+    Write .gz (and .br if brotli is installed) copies of a file
+
+    Args:
+        path (str): Absolute path of the file
+
+    Returns:
+        list: Paths of the compressed copies written
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    variants = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+
+    written = []
+    for suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            continue
+        with open(path + suffix, 'wb') as f:
+            f.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes precompressed copies of hashed files"""
+
+    def stored_name(self, name):
+        # Until collectstatic has written a manifest (a development checkout,
+        # or a test run, which turns DEBUG off) there are no hashed names, so
+        # pages link the plain names like StaticFilesStorage would
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if posixpath.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                compress_file(self.path(name))
+
+
+_hashed_names = None
+
+
+def _is_hashed(name):
+    """Whether a static path is a content-hashed name from the manifest"""
+    global _hashed_names
+    if _hashed_names is None:
+        _hashed_names = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    return name in _hashed_names
+
+
+def _accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return {part.split(';')[0].strip().lower() for part in header.split(',')}
+
+
+def serve(request, path):
+    """
+    Serve a collected static file with its precompressed copy and long caching
+
+    Hashed names get a one year immutable Cache-Control; other names (e.g.
+    files referenced without the static tag) must be revalidated.
+
+    Args:
+        request: HttpRequest
+        path (str): Path relative to STATIC_ROOT
+
+    Returns:
+        FileResponse or HttpResponseNotModified
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found.")
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    serve_path, encoding = full_path, None
+    if posixpath.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        accepted = _accepted_encodings(request)
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in accepted and os.path.isfile(full_path + suffix):
+                serve_path, encoding = full_path + suffix, candidate
+                break
+
+    response = FileResponse(
+        open(serve_path, 'rb'),
+        content_type=content_type or 'application/octet-stream',
+        filename=os.path.basename(full_path),
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if posixpath.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        response['Vary'] = 'Accept-Encoding'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if _is_hashed(path) else 'public, max-age=0, must-revalidate'
+    return response
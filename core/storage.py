@@ -0,0 +1,135 @@
+"""
+Content-addressed file storage for the Wedding Management System
+
+Files are stored under the SHA-256 of their bytes instead of their upload
+name, e.g. ``wedding_media/3f/a2/3fa2...c9.jpg``. The two levels of
+subdirectories keep any one directory small even with tens of thousands of
+guest photos. A file uploaded a second time, by another guest or to another
+wedding, resolves to the same name and is never written again.
+
+A Blob row per file counts the rows referring to it: every save adds a
+reference and every delete drops one, and the file is only removed with its
+last reference. Uploads are hashed while they stream in (see the upload
+handlers below), so storing them needs no extra pass over the bytes.
+
+Use it by passing ``storage=content_addressed_storage`` to a FileField.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(content):
+    """
+    Hash a file without writing it anywhere
+
+    Args:
+        content: Django File
+
+    Returns:
+        str: Hex SHA-256 of its bytes
+    """
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(name, digest):
+    """Storage name of the blob holding a file uploaded as name"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest[2:4], f"{digest}{extension}").replace(os.sep, '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct file once, by its SHA-256"""
+
+    def __init__(self, **kwargs):
+        # Two uploads of the same bytes may race to write one blob; either
+        # copy is correct, so the later one may overwrite the earlier one
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        # Files that arrived through the hashing upload handlers carry their hash
+        digest = getattr(content, 'sha256', None) or file_sha256(content)
+        name = blob_name(name, digest)
+
+        # The row lock orders this against a delete of the same blob, so a
+        # file is never removed after this save decided not to write it
+        with transaction.atomic():
+            blob, created = Blob.objects.select_for_update().get_or_create(
+                name=name, defaults={'sha256': digest, 'size': content.size},
+            )
+            Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+            if created or not self.exists(name):
+                name = super()._save(name, content)
+        return name
+
+    def delete(self, name):
+        from .models import Blob
+
+        if not name:
+            return
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refcount > 1:
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            # The last reference, or a file stored before content addressing
+            super().delete(name)
+
+
+_storage = None
+
+
+def content_addressed_storage():
+    """Storage callable for FileField(storage=...)"""
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
+
+
+class _HashingUploadHandlerMixin:
+    """Hash uploaded files chunk by chunk as they are received"""
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler stops the other handlers by raising
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # An inactive memory handler passes the data on to the next handler
+        if getattr(self, 'activated', True):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(_HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    """MemoryFileUploadHandler that also records the SHA-256 of small uploads"""
+
+
+class HashingTemporaryFileUploadHandler(_HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    """TemporaryFileUploadHandler that also records the SHA-256 of large uploads"""
@@ -0,0 +1,327 @@
+"""
+Incremental sync for offline-capable clients
+
+Devices keep a local copy of the weddings their user works on and bring it up
+to date in one request: they send the cursor of their last sync plus any
+changes made offline, and get back every row changed since the cursor and
+the ids of deleted rows.
+
+- Changed rows are found through each model's updated_at column.
+- Deletions are recorded as Tombstone rows by post_delete handlers, since a
+  deleted row cannot be found by its updated_at any more.
+- Client changes ("mutations") carry an id chosen by the device. The result
+  of each one is stored in SyncMutation, so a batch that is sent again after
+  a dropped connection is not applied twice.
+
+Models take part by registering with register() from their app's sync
+module, like the search index (see core/search.py); their deletions are
+recorded by the app's signals module.
+"""
+import datetime
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.forms import model_to_dict, modelform_factory
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SyncMutation, Tombstone
+
+# Rows changed shortly before a cursor was issued may not have been committed
+# yet when it was, so every sync re-reads this many seconds before the cursor
+CURSOR_OVERLAP = datetime.timedelta(seconds=5)
+
+# Tombstones and stored mutation results are kept this long; a device whose
+# cursor is older gets a full copy instead of changes
+RETENTION = datetime.timedelta(days=getattr(settings, 'SYNC_RETENTION_DAYS', 90))
+
+MAX_MUTATIONS = 500
+
+SyncType = namedtuple('SyncType', 'name model wedding_field fields writable choices prepare wedding_of')
+
+_registry = {}
+
+
+def register(name, model, wedding_field, fields, writable=(), choices=None, prepare=None, wedding_of=None):
+    """
+    Register a model with delta sync
+
+    Args:
+        name (str): Type name used by clients, e.g. 'task'
+        model: Model class; must have an updated_at field
+        wedding_field (str): Lookup path to the wedding, e.g. 'checklist__wedding'
+        fields (tuple): Fields sent to clients (besides id, wedding and updated_at)
+        writable (tuple): Fields clients may set in mutations
+        choices (dict): Maps foreign key fields in writable to a function
+            that returns the allowed objects for a wedding
+        prepare (callable): Called as prepare(instance, changed_fields, user)
+            before a client change is saved, to fill in derived fields
+        wedding_of (callable): Returns the wedding ID of an instance (default:
+            the wedding foreign key); used when recording deletions
+    """
+    _registry[name] = SyncType(
+        name, model, wedding_field, tuple(fields), tuple(writable), choices or {}, prepare, wedding_of,
+    )
+
+
+def _type_for(model):
+    for sync_type in _registry.values():
+        if issubclass(model, sync_type.model):
+            return sync_type
+    return None
+
+
+def _wedding_id(sync_type, instance):
+    return sync_type.wedding_of(instance) if sync_type.wedding_of else instance.wedding_id
+
+
+def record_deletion(instance, origin=None):
+    """
+    Leave a tombstone for a deleted object (call from post_delete)
+
+    Deleting a whole wedding leaves no tombstones for its contents: devices
+    drop weddings that are no longer in their sync response.
+    """
+    from weddings.models import Wedding
+
+    sync_type = _type_for(type(instance))
+    if sync_type is None or isinstance(origin, Wedding):
+        return
+    wedding_id = _wedding_id(sync_type, instance)
+    if wedding_id is not None:
+        Tombstone.objects.create(model=sync_type.name, object_id=instance.pk, wedding_id=wedding_id)
+
+
+def encode_cursor(moment):
+    return str(int(moment.timestamp() * 1000))
+
+
+def decode_cursor(cursor):
+    """The time a cursor stands for, or None for a missing or malformed cursor"""
+    try:
+        return datetime.datetime.fromtimestamp(int(cursor) / 1000, tz=datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _columns(sync_type):
+    wedding_column = sync_type.wedding_field if '__' in sync_type.wedding_field else f"{sync_type.wedding_field}_id"
+    return ['id', wedding_column, *sync_type.fields, 'updated_at']
+
+
+def changes_since(wedding_ids, since=None):
+    """
+    Rows and deletions of some weddings since a point in time
+
+    Args:
+        wedding_ids (list): Wedding IDs
+        since (datetime): Changes after this time; None for everything
+
+    Returns:
+        tuple: (changes, deleted). changes maps type names to
+        {"fields": [...], "rows": [[...], ...]}; deleted maps type names to
+        lists of IDs.
+    """
+    changes = {}
+    for name, sync_type in _registry.items():
+        queryset = sync_type.model._default_manager.filter(**{f"{sync_type.wedding_field}__in": wedding_ids})
+        if since is not None:
+            queryset = queryset.filter(updated_at__gt=since)
+        columns = _columns(sync_type)
+        rows = [list(row) for row in queryset.order_by('id').values_list(*columns)]
+        if rows:
+            changes[name] = {'fields': ['id', 'wedding', *columns[2:]], 'rows': rows}
+
+    deleted = {}
+    if since is not None:
+        tombstones = Tombstone.objects.filter(wedding_id__in=wedding_ids, deleted_at__gt=since)
+        for model, object_id in tombstones.values_list('model', 'object_id'):
+            deleted.setdefault(model, []).append(object_id)
+
+    return changes, deleted
+
+
+def _row(sync_type, instance):
+    """The row of an object as sent to clients, as a dict"""
+    columns = _columns(sync_type)
+    values = sync_type.model._default_manager.filter(pk=instance.pk).values_list(*columns).get()
+    return dict(zip(['id', 'wedding', *columns[2:]], values))
+
+
+def _to_milliseconds(moment):
+    # Clients see times at millisecond precision (DjangoJSONEncoder)
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+
+def _parse_base(value):
+    try:
+        base = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+    if base is not None and timezone.is_naive(base):
+        base = timezone.make_aware(base, datetime.timezone.utc)
+    return base
+
+
+def _apply(mutation, sync_type, wedding_ids, user):
+    """Apply one mutation; returns its result dict (without the id)"""
+    from weddings.models import Wedding
+
+    op = mutation.get('op')
+    data = mutation.get('data') if isinstance(mutation.get('data'), dict) else {}
+    manager = sync_type.model._default_manager
+    scoped = manager.filter(**{f"{sync_type.wedding_field}__in": wedding_ids})
+
+    if op == 'delete':
+        if not isinstance(mutation.get('object_id'), int):
+            return {'status': 'invalid', 'errors': {'object_id': ["Must be an integer."]}}
+        # Deleting something that is already gone counts as done
+        scoped.filter(pk=mutation['object_id']).delete()
+        return {'status': 'applied', 'object_id': mutation['object_id']}
+
+    if op == 'create':
+        wedding_id = mutation.get('wedding')
+        if wedding_id not in wedding_ids:
+            return {'status': 'not_found', 'message': 'Unknown wedding.'}
+        instance = sync_type.model()
+        if '__' not in sync_type.wedding_field:
+            setattr(instance, f"{sync_type.wedding_field}_id", wedding_id)
+        current = {}
+    elif op == 'update':
+        try:
+            instance = scoped.get(pk=mutation.get('object_id'))
+        except (ObjectDoesNotExist, ValueError, TypeError):
+            return {'status': 'not_found', 'object_id': mutation.get('object_id')}
+        wedding_id = _wedding_id(sync_type, instance)
+
+        # The client says which version it changed; refuse to overwrite newer edits
+        base = _parse_base(mutation.get('base'))
+        if base is not None and _to_milliseconds(instance.updated_at) > base:
+            return {'status': 'conflict', 'object_id': instance.pk, 'row': _row(sync_type, instance)}
+        current = model_to_dict(instance, fields=sync_type.writable)
+    else:
+        return {'status': 'invalid', 'errors': {'op': ["Must be create, update or delete."]}}
+
+    # Validate the values with a model form, so clients get the same checks
+    # as the web pages. The form only has the fields the client sent plus the
+    # required ones (filled from the row on updates): a form field bound to
+    # nothing would overwrite untouched values, e.g. NULL text with ''.
+    required = modelform_factory(sync_type.model, fields=sync_type.writable).base_fields
+    fields = [field for field in sync_type.writable if field in data or required[field].required]
+    form_class = modelform_factory(sync_type.model, fields=fields)
+    values = {field: data[field] if field in data else current.get(field) for field in fields}
+    form = form_class({field: '' if value is None else value for field, value in values.items()}, instance=instance)
+    wedding = Wedding(id=wedding_id)
+    for field, allowed in sync_type.choices.items():
+        if field in form.fields:
+            form.fields[field].queryset = allowed(wedding)
+    if not form.is_valid():
+        return {'status': 'invalid', 'errors': form.errors.get_json_data()}
+
+    instance = form.save(commit=False)
+    # Forms turn empty text into ''; keep a null the client sent as NULL
+    for field, value in values.items():
+        if value is None and sync_type.model._meta.get_field(field).null:
+            setattr(instance, sync_type.model._meta.get_field(field).attname, None)
+    if sync_type.prepare:
+        sync_type.prepare(instance, set(form.changed_data), user)
+    instance.save()
+    return {'status': 'applied', 'object_id': instance.pk, 'updated_at': instance.updated_at}
+
+
+def apply_mutations(mutations, wedding_ids, user):
+    """
+    Apply changes sent by a device, each at most once
+
+    Args:
+        mutations (list): Dicts with id (unique per device change), type, op
+            ('create', 'update' or 'delete'), object_id (update/delete),
+            wedding (create), data (field values) and optionally base (the
+            updated_at the device last saw, to detect conflicting edits)
+        wedding_ids (list): Weddings the user may change
+        user: User sending the changes
+
+    Returns:
+        list: One result per mutation with id, status ('applied', 'conflict',
+        'invalid' or 'not_found') and details
+    """
+    ids = [str(mutation['id'])[:64] for mutation in mutations if isinstance(mutation, dict) and mutation.get('id')]
+    done = dict(SyncMutation.objects.filter(user=user, mutation_id__in=ids).values_list('mutation_id', 'result'))
+
+    results = []
+    for mutation in mutations:
+        if not isinstance(mutation, dict) or not mutation.get('id'):
+            results.append({'id': None, 'status': 'invalid', 'errors': {'id': ["Every mutation needs an id."]}})
+            continue
+        mutation_id = str(mutation['id'])[:64]
+        if mutation_id in done:
+            results.append({'id': mutation_id, **done[mutation_id]})
+            continue
+
+        sync_type = _registry.get(mutation.get('type'))
+        if sync_type is None or (mutation.get('op') != 'delete' and not sync_type.writable):
+            result = {'status': 'invalid', 'errors': {'type': ["Unknown or read-only type."]}}
+            results.append({'id': mutation_id, **result})
+            continue
+
+        try:
+            with transaction.atomic():
+                # Stored and returned as JSON, with dates as strings
+                result = json.loads(json.dumps(_apply(mutation, sync_type, wedding_ids, user), cls=DjangoJSONEncoder))
+                SyncMutation.objects.create(user=user, mutation_id=mutation_id, result=result)
+        except IntegrityError:
+            # The same mutation arrived twice at once; the other request applied it
+            result = SyncMutation.objects.get(user=user, mutation_id=mutation_id).result
+        done[mutation_id] = result
+        results.append({'id': mutation_id, **result})
+
+    return results
+
+
+def sync(user, wedding_ids, cursor=None, mutations=()):
+    """
+    Apply a device's changes and return everything it is missing
+
+    Args:
+        user: Syncing user
+        wedding_ids (list): Weddings to sync
+        cursor (str): Cursor returned by the previous sync, if any
+        mutations (list): Changes made on the device (see apply_mutations)
+
+    Returns:
+        dict: cursor, full (True if the device should replace its copy),
+        weddings, changes, deleted and mutations
+    """
+    now = timezone.now()
+    results = apply_mutations(list(mutations)[:MAX_MUTATIONS], wedding_ids, user) if mutations else []
+
+    since = decode_cursor(cursor)
+    # Tombstones older than the retention period are gone, so old devices start over
+    full = since is None or since < now - RETENTION
+    changes, deleted = changes_since(wedding_ids, None if full else since - CURSOR_OVERLAP)
+
+    return {
+        'cursor': encode_cursor(now),
+        'full': full,
+        'weddings': list(wedding_ids),
+        'changes': changes,
+        'deleted': deleted,
+        'mutations': results,
+    }
+
+
+def prune_sync_log(now=None):
+    """
+    Delete tombstones and mutation results past the retention period
+
+    Returns:
+        tuple: (tombstones deleted, mutations deleted)
+    """
+    cutoff = (now or timezone.now()) - RETENTION
+    tombstones, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    mutations, _ = SyncMutation.objects.filter(created_at__lt=cutoff).delete()
+    return tombstones, mutations
@@ -1,4 +1,5 @@
 from django import template
+from django.conf import settings
 
 register = template.Library()
 
@@ -6,3 +7,15 @@ register = template.Library()
 def add_class(field, css_class):
     """Add a CSS class to a form field"""
     return field.as_widget(attrs={"class": css_class})
+
+
+@register.simple_tag
+def static_assets():
+    """Where page assets come from: 'local' (built by build_assets) or 'cdn'"""
+    return getattr(settings, 'STATIC_ASSETS', 'cdn')
+
+
+@register.filter(name='webcal')
+def webcal(url):
+    """Turn a calendar feed URL into a webcal:// link that opens calendar apps"""
+    return 'webcal://' + url.split('://', 1)[-1]
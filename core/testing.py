@@ -0,0 +1,57 @@
+"""
+Helpers shared by the tests of every app
+
+WeddingTestCase starts each test with a wedding and its admin logged in, and
+stores files in a temporary MEDIA_ROOT so tests never touch the development
+media. Users are created with the cheap MD5 hasher; the strong hashers of
+the settings would make every create_user() take a noticeable fraction of a
+second.
+"""
+import datetime
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from core.models import UserProfile
+from weddings.models import Wedding
+
+FAST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def create_user(username, role='admin', **kwargs):
+    """Create a user with a profile; the password is 'x'"""
+    user = User.objects.create_user(username, password='x', **kwargs)
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def create_wedding(admin, **kwargs):
+    """Create a wedding on 1 June 2030 run by admin"""
+    fields = {
+        'title': 'Test Wedding', 'bride_name': 'Ann', 'groom_name': 'Bob', 'date': datetime.date(2030, 6, 1),
+        'time': datetime.time(15, 0), 'location': 'Hall', 'address': '1 Main St',
+    }
+    return Wedding.objects.create(admin=admin, **{**fields, **kwargs})
+
+
+class TempMediaMixin:
+    """Store files in a temporary MEDIA_ROOT that is removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class WeddingTestCase(TempMediaMixin, TestCase):
+    """A wedding with its admin (self.admin) logged in"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('planner')
+        self.wedding = create_wedding(self.admin)
+        self.client.force_login(self.admin)
@@ -1,3 +1,407 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth.hashers import MD5PasswordHasher, identify_hasher
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import admin_utils, background, guest_session, snapshots
+from core.models import Blob, Tombstone
+from core.passwords import make_account_password
+from core.search import search_wedding
+from core.storage import ContentAddressedStorage
+from core.sync import sync
+from core.testing import (
+    FAST_PASSWORD_HASHERS, TempMediaMixin, WeddingTestCase, create_user, create_wedding,
+)
+from guests.models import Guest, GuestCredential, Invitation
+from tasks.models import Task
+from weddings.models import Wedding
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage()
+
+    def test_identical_files_share_one_blob(self):
+        first = self.storage.save('wedding_media/a.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('wedding_media/b.JPG', ContentFile(b'same bytes'))
+
+        self.assertEqual(first, second)
+        blob = Blob.objects.get(name=first)
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(blob.size, len(b'same bytes'))
+        self.assertTrue(self.storage.exists(first))
+
+    def test_different_files_get_different_blobs(self):
+        first = self.storage.save('wedding_media/a.jpg', ContentFile(b'one'))
+        second = self.storage.save('wedding_media/a.jpg', ContentFile(b'two'))
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_file_is_removed_with_its_last_reference(self):
+        name = self.storage.save('wedding_media/a.jpg', ContentFile(b'same bytes'))
+        self.storage.save('wedding_media/b.jpg', ContentFile(b'same bytes'))
+
+        self.storage.delete(name)
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+        self.assertTrue(self.storage.exists(name))
+
+        self.storage.delete(name)
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+
+class PasswordSettingsTests(SimpleTestCase):
+    def test_md5_is_opt_in(self):
+        if settings.FAST_SEED_PASSWORDS:
+            self.skipTest("WMS_FAST_SEED_PASSWORDS is set")
+        self.assertNotIn('django.contrib.auth.hashers.MD5PasswordHasher', settings.PASSWORD_HASHERS)
+        self.assertEqual(settings.SEED_PASSWORD_HASHER, 'default')
+
+
+class PasswordPolicyTests(WeddingTestCase):
+    def test_account_classes(self):
+        self.assertEqual(identify_hasher(make_account_password('secret', 'staff')).algorithm, 'md5')
+        self.assertFalse(make_account_password('secret', 'guest').startswith('md5$'))
+        with override_settings(SEED_PASSWORD_HASHER='md5'):
+            self.assertTrue(make_account_password('secret', 'seed').startswith('md5$'))
+        with self.assertRaises(ValueError):
+            make_account_password('secret', 'robot')
+
+    def test_guest_logs_in_without_hashing(self):
+        self.client.logout()
+        guest = Guest.objects.create(wedding=self.wedding, name='Guest One')
+        GuestCredential.objects.create(
+            guest=guest, username='guest1', password='letmein', expiry_date=timezone.now() + datetime.timedelta(days=1),
+        )
+
+        with mock.patch.object(MD5PasswordHasher, 'encode', side_effect=AssertionError('hashed')), \
+                mock.patch.object(MD5PasswordHasher, 'verify', side_effect=AssertionError('hashed')):
+            response = self.client.post('/login/', {'username': 'guest1', 'password': 'letmein'})
+
+        self.assertEqual(response.status_code, 302)
+        guest.refresh_from_db()
+        self.assertFalse(guest.user.has_usable_password())
+        self.assertEqual(guest.user.profile.role, 'guest')
+
+    def test_wrong_guest_password_is_refused(self):
+        self.client.logout()
+        guest = Guest.objects.create(wedding=self.wedding, name='Guest One')
+        GuestCredential.objects.create(
+            guest=guest, username='guest1', password='letmein', expiry_date=timezone.now() + datetime.timedelta(days=1),
+        )
+        response = self.client.post('/login/', {'username': 'guest1', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Guest.objects.get(id=guest.id).user)
+
+
+class EstimatedCountPaginatorTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        Guest.objects.bulk_create(Guest(wedding=self.wedding, name=f'Guest {i}') for i in range(5))
+
+    def test_small_tables_are_counted_exactly(self):
+        paginator = admin_utils.EstimatedCountPaginator(Guest.objects.order_by('id'), 2)
+        self.assertEqual((paginator.count, paginator.num_pages), (5, 3))
+
+    def test_counts_stop_at_the_limit(self):
+        with mock.patch.object(admin_utils, 'COUNT_LIMIT', 3):
+            for queryset in [Guest.objects.order_by('id'), Guest.objects.filter(wedding=self.wedding)]:
+                self.assertEqual(admin_utils.EstimatedCountPaginator(queryset, 2).count, 3)
+
+    def test_changelist_works_with_the_paginator(self):
+        self.client.force_login(create_user('root', is_staff=True, is_superuser=True))
+        response = self.client.get('/admin/guests/guest/', {'status': 'invited'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+
+class APITests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.guests = [Guest.objects.create(wedding=self.wedding, name=f'Guest {i}', plus_ones=i) for i in range(5)]
+        other = create_wedding(create_user('other'))
+        self.hidden = Guest.objects.create(wedding=other, name='Hidden')
+
+    def get(self, path, **params):
+        return self.client.get(f'/api/v1/{path}', params)
+
+    def test_fields(self):
+        response = self.get('guests/', fields='name,plus_ones', limit=1)
+        self.assertEqual(response.json()['data'], [{'id': self.guests[0].id, 'name': 'Guest 0', 'plus_ones': 0}])
+
+        response = self.get('guests/', fields='name,password')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Unknown fields: password.'}))
+
+    def test_cursor_pages_through_visible_rows(self):
+        ids = []
+        params = {'fields': 'name', 'limit': 2}
+        while True:
+            page = self.get('guests/', **params).json()
+            self.assertLessEqual(len(page['data']), 2)
+            ids += [row['id'] for row in page['data']]
+            if not page['next']:
+                break
+            params['cursor'] = page['next']
+        self.assertEqual(ids, [guest.id for guest in self.guests])
+
+        self.assertEqual(self.get('guests/', cursor='not a cursor!').status_code, 400)
+        self.assertEqual(self.get(f'guests/{self.hidden.id}/').status_code, 404)
+
+    def test_include_costs_one_query_per_page(self):
+        for guest in self.guests:
+            Invitation.objects.create(wedding=self.wedding, guest=guest, message='Come')
+        Invitation.objects.filter(guest=self.guests[0]).update(viewed=True)
+
+        def fetch(limit):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get('guests/', fields='name', include='invitations',
+                                    **{'fields[invitations]': 'viewed', 'limit': limit})
+            return response.json()['data'], len(queries)
+
+        rows, few = fetch(1)
+        self.assertEqual(rows[0]['invitations'], [{'id': Invitation.objects.get(guest=self.guests[0]).id, 'viewed': True}])
+        rows, many = fetch(5)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(few, many)
+
+        response = self.get('guests/', include='events')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_staff_may_use_the_api(self):
+        self.assertEqual(self.get('unknown/').status_code, 404)
+        self.client.force_login(create_user('guest1', role='guest'))
+        self.assertEqual(self.get('guests/').status_code, 403)
+
+
+class BackgroundTests(SimpleTestCase):
+    def test_failures_are_logged(self):
+        def build_archive():
+            raise RuntimeError('disk full')
+
+        with self.assertLogs('core.background', 'ERROR') as logs:
+            background._run(build_archive, (), {})
+        self.assertIn('build_archive', logs.output[0])
+        self.assertIn('disk full', logs.output[0])
+
+
+class SearchTests(WeddingTestCase):
+    def test_saved_objects_are_found_without_creating_the_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', notes='Vegetarian')
+        self.assertFalse([q for q in queries if q['sql'].upper().startswith('CREATE')])
+
+        results = search_wedding(self.wedding.id, 'veget', include_staff_only=True)
+        self.assertEqual([(r['type'], r['id']) for r in results], [('guest', guest.id)])
+        self.assertIn('<mark>', results[0]['snippet'])
+
+        self.assertEqual(search_wedding(self.wedding.id, 'veget'), [])
+        guest.delete()
+        self.assertEqual(search_wedding(self.wedding.id, 'veget', include_staff_only=True), [])
+
+
+class StaticFilesTests(TestCase):
+    def test_pages_render_without_collected_manifest(self):
+        response = self.client.get('/login/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(GUEST_SESSION_MODE='signed')
+class GuestSessionTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Guests only have the signed cookie
+        self.client.logout()
+
+        user = create_user('guest1', role='guest')
+        guest = Guest.objects.create(wedding=self.wedding, user=user, name='Guest One')
+        self.credential = GuestCredential.objects.create(
+            guest=guest, username='guest1', expiry_date=timezone.now() + datetime.timedelta(days=1),
+        )
+
+    def sign_in(self):
+        self.client.cookies[guest_session.COOKIE_NAME] = signing.dumps(
+            str(self.credential.token), salt=guest_session.SALT,
+        )
+
+    def test_signed_guest_reaches_sync_view(self):
+        self.sign_in()
+        self.assertEqual(self.client.get('/gallery/').status_code, 200)
+
+    def test_signed_guest_reaches_async_upload_view(self):
+        self.sign_in()
+        response = self.client.get(f'/gallery/upload/?wedding={self.wedding.id}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_signed_guest_with_stale_session_cookie(self):
+        self.sign_in()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'expired-session'
+        response = self.client.get('/gallery/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.credential.guest.user)
+
+    def test_signed_guest_with_anonymous_session(self):
+        session = self.client.session
+        session['seen_intro'] = True
+        session.save()
+        self.sign_in()
+        response = self.client.get(f'/gallery/upload/?wedding={self.wedding.id}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_login_wins_over_guest_cookie(self):
+        self.client.force_login(self.admin)
+        self.sign_in()
+        response = self.client.get('/gallery/')
+        self.assertEqual(response.wsgi_request.user, self.admin)
+
+    def test_without_cookie_upload_requires_login(self):
+        response = self.client.get('/gallery/upload/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login/', response['Location'])
+
+
+class SyncTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.wedding_ids = [self.wedding.id]
+        self.guest = Guest.objects.create(wedding=self.wedding, name='Guest One')
+        self.task = Task.objects.create(
+            wedding=self.wedding, title='Book band', created_by=self.admin, due_date=datetime.date(2030, 5, 1),
+        )
+
+    def sync(self, *mutations, cursor=None):
+        return sync(self.admin, self.wedding_ids, cursor, list(mutations))
+
+    def test_update_leaves_fields_it_does_not_send(self):
+        result = self.sync(
+            {'id': 'm1', 'type': 'guest', 'op': 'update', 'object_id': self.guest.id, 'data': {'status': 'confirmed'}},
+            {'id': 'm2', 'type': 'task', 'op': 'update', 'object_id': self.task.id, 'data': {'status': 'in_progress'}},
+        )
+        self.assertEqual([m['status'] for m in result['mutations']], ['applied', 'applied'])
+
+        self.guest.refresh_from_db()
+        self.task.refresh_from_db()
+        self.assertEqual(self.guest.status, 'confirmed')
+        self.assertIsNone(self.guest.notes)
+        self.assertIsNone(self.guest.email)
+        self.assertIsNotNone(self.guest.rsvp_date)
+        self.assertEqual(self.task.status, 'in_progress')
+        self.assertIsNone(self.task.description)
+
+    def test_update_can_clear_a_nullable_field(self):
+        Guest.objects.filter(id=self.guest.id).update(notes='Vegetarian')
+        self.sync({'id': 'm1', 'type': 'guest', 'op': 'update', 'object_id': self.guest.id, 'data': {'notes': None}})
+
+        self.guest.refresh_from_db()
+        self.assertIsNone(self.guest.notes)
+
+    def test_repeated_mutation_is_applied_once(self):
+        mutation = {
+            'id': 'create-1', 'type': 'guest', 'op': 'create', 'wedding': self.wedding.id,
+            'data': {'name': 'New Guest', 'status': 'invited', 'plus_ones': 0},
+        }
+        first = self.sync(mutation)['mutations'][0]
+        second = self.sync(mutation)['mutations'][0]
+
+        self.assertEqual(first['status'], 'applied')
+        self.assertEqual(first, second)
+        self.assertEqual(Guest.objects.filter(name='New Guest').count(), 1)
+
+    def test_stale_update_is_a_conflict(self):
+        base = '2000-01-01T00:00:00Z'
+        result = self.sync({
+            'id': 'm1', 'type': 'guest', 'op': 'update', 'object_id': self.guest.id, 'base': base,
+            'data': {'name': 'Renamed'},
+        })['mutations'][0]
+
+        self.assertEqual(result['status'], 'conflict')
+        self.assertEqual(result['row']['name'], 'Guest One')
+        self.guest.refresh_from_db()
+        self.assertEqual(self.guest.name, 'Guest One')
+
+    def test_current_update_is_applied(self):
+        base = self.guest.updated_at.isoformat()
+        result = self.sync({
+            'id': 'm1', 'type': 'guest', 'op': 'update', 'object_id': self.guest.id, 'base': base,
+            'data': {'name': 'Renamed'},
+        })['mutations'][0]
+        self.assertEqual(result['status'], 'applied')
+
+    def test_deletions_reach_devices_as_tombstones(self):
+        cursor = self.sync()['cursor']
+        guest_id, task_id = self.guest.id, self.task.id
+        result = self.sync({'id': 'd1', 'type': 'guest', 'op': 'delete', 'object_id': guest_id})
+        self.assertEqual(result['mutations'][0]['status'], 'applied')
+        self.task.delete()
+
+        changes = self.sync(cursor=cursor)
+        self.assertFalse(changes['full'])
+        self.assertEqual(changes['deleted'], {'guest': [guest_id], 'task': [task_id]})
+
+    def test_deleting_a_wedding_leaves_no_tombstones(self):
+        self.wedding.delete()
+        self.assertEqual(Tombstone.objects.count(), 0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class SnapshotTestMixinTests(TransactionTestCase):
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.enterContext(mock.patch.object(snapshots, 'SNAPSHOT_ROOT', root))
+
+        # A snapshot holding one wedding and one media file
+        admin = create_user('planner')
+        wedding = create_wedding(admin)
+        snapshot = root / 'fixture'
+        os.makedirs(snapshot / snapshots.MEDIA_DIRNAME / 'wedding_media')
+        (snapshot / snapshots.MEDIA_DIRNAME / 'wedding_media' / 'photo.jpg').write_bytes(b'jpeg')
+        target = sqlite3.connect(snapshot / snapshots.DB_FILENAME)
+        connection.connection.backup(target)
+        target.close()
+        wedding.delete()
+        admin.delete()
+
+    def test_snapshot_is_loaded_for_the_class_and_undone_afterwards(self):
+        real_media_root = settings.MEDIA_ROOT
+        seen = {}
+
+        class FixtureTests(snapshots.SnapshotTestMixin, TestCase):
+            snapshot_name = 'fixture'
+            snapshot_media = True
+
+            def test_fixture(self):
+                seen['weddings'] = Wedding.objects.count()
+                seen['media_root'] = settings.MEDIA_ROOT
+                seen['photo'] = os.path.exists(os.path.join(settings.MEDIA_ROOT, 'wedding_media', 'photo.jpg'))
+
+        result = unittest.TestResult()
+        unittest.defaultTestLoader.loadTestsFromTestCase(FixtureTests).run(result)
+        self.assertTrue(result.wasSuccessful(), result.errors + result.failures)
+
+        self.assertEqual(seen['weddings'], 1)
+        self.assertTrue(seen['photo'])
+        self.assertNotEqual(seen['media_root'], real_media_root)
+
+        # Later test classes start from the database and media they had before
+        self.assertEqual(Wedding.objects.count(), 0)
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(settings.MEDIA_ROOT, real_media_root)
+        self.assertFalse(os.path.exists(seen['media_root']))
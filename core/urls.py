@@ -9,4 +9,7 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
     path('settings/', views.settings, name='settings'),
+    path('api/sync/', views.sync_api, name='sync_api'),
+    path('api/v1/<str:resource>/', views.api_list, name='api_list'),
+    path('api/v1/<str:resource>/<int:object_id>/', views.api_detail, name='api_detail'),
 ]
@@ -7,7 +7,14 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
 import random
+import re
 import string
 
 def send_email(subject, to_email, template_name, context, attachments=None):
@@ -65,66 +72,48 @@ def send_email(subject, to_email, template_name, context, attachments=None):
         print(f"Error sending email: {e}")
         return False
 
-def send_guest_invitation_email(invitation, credential):
+def guest_invitation_email(invitation, credential):
     """
-    Send an invitation email to a guest with their login credentials
+    Prepare the invitation email of a guest with their login credentials
+
+    Creates the credential's QR code if it has none, so it must run where the
+    database may be used. Sending the result does not touch the database.
 
     Args:
-        invitation: Invitation object
+        invitation: Invitation object, with its guest and wedding loaded
         credential: GuestCredential object
 
     Returns:
-        bool: True if email was sent successfully, False otherwise
+        tuple: send_email() arguments, or None if the guest has no email
     """
+    import base64
+
     guest = invitation.guest
     wedding = invitation.wedding
 
     # Skip if guest has no email
     if not guest.email:
-        return False
+        return None
 
     # Generate a temporary password if the credential doesn't have one
     password = credential.password if hasattr(credential, 'password') else generate_random_password(8)
+    qr_content = credential.get_qr_code_png()
 
     # Prepare context for email template
     context = {
-        'guest': guest,
-        'wedding': wedding,
-        'invitation': invitation,
-        'credential': credential,
-        'qr_code_base64': credential.get_qr_code_base64(),
+        'guest': {'name': guest.name},
+        'wedding': {
+            field: getattr(wedding, field)
+            for field in ('bride_name', 'groom_name', 'date', 'time', 'location', 'address')
+        },
+        'invitation': {'message': invitation.message},
+        'qr_code_base64': base64.b64encode(qr_content).decode('utf-8'),
         'login_url': f"http://localhost:8000/guests/qr/{credential.token}/",
         'direct_login_url': f"http://localhost:8000/guests/login/",
         'username': credential.username,
         'password': password,
     }
 
-    # Prepare QR code as attachment
-    from io import BytesIO
-
-    # Get QR code image
-    if credential.qr_code and hasattr(credential.qr_code, 'path') and os.path.exists(credential.qr_code.path):
-        # Use existing QR code file
-        with open(credential.qr_code.path, 'rb') as f:
-            qr_content = f.read()
-    else:
-        # Generate QR code on the fly
-        import qrcode
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(f"http://localhost:8000/guests/qr/{credential.token}/")
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        qr_content = buffer.getvalue()
-
     # Create attachment
     attachments = [{
         'name': 'qr_code.png',
@@ -133,9 +122,22 @@ def send_guest_invitation_email(invitation, credential):
         'inline': True  # Mark as inline for embedding in HTML
     }]
 
-    # Send email
     subject = f"You're invited to {wedding.bride_name} & {wedding.groom_name}'s Wedding"
-    return send_email(subject, guest.email, 'emails/guest_invitation.html', context, attachments=attachments)
+    return (subject, guest.email, 'emails/guest_invitation.html', context, attachments)
+
+def send_guest_invitation_email(invitation, credential):
+    """
+    Send an invitation email to a guest with their login credentials
+
+    Args:
+        invitation: Invitation object
+        credential: GuestCredential object
+
+    Returns:
+        bool: True if email was sent successfully, False otherwise
+    """
+    email = guest_invitation_email(invitation, credential)
+    return send_email(*email) if email else False
 
 def generate_random_password(length=10):
     """
@@ -150,50 +152,126 @@ def generate_random_password(length=10):
     characters = string.ascii_letters + string.digits + string.punctuation
     return ''.join(random.choice(characters) for _ in range(length))
 
-def create_team_member_user(email, first_name, last_name):
+def unique_usernames(base_names):
     """
-    Create a new user with team_member role
+    Pick an unused username for each base name with a single query
+
+    Taken names get a number appended (jane, jane1, jane2, ...), also when the
+    same base name appears more than once in base_names.
 
     Args:
-        email (str): Email address
-        first_name (str): First name
-        last_name (str): Last name
+        base_names (list): Wanted usernames
 
     Returns:
-        tuple: (User object, password) if created successfully, (None, None) otherwise
+        list: Unique usernames in the same order
     """
-    try:
-        # Check if user already exists
-        if User.objects.filter(email=email).exists():
-            return None, None
-
-        # Generate username from email
-        username = email.split('@')[0]
-        base_username = username
+    bases = [re.sub(r'[^\w.@+-]', '', name)[:140] or 'user' for name in base_names]
+    if not bases:
+        return []
+
+    taken = set(
+        User.objects.filter(reduce(or_, [Q(username__istartswith=base) for base in set(bases)]))
+        .values_list('username', flat=True)
+    )
+    taken = {username.lower() for username in taken}
+
+    usernames = []
+    for base in bases:
+        username = base
         counter = 1
-
-        # Make sure username is unique
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}{counter}"
+        while username.lower() in taken:
+            username = f"{base}{counter}"
             counter += 1
+        taken.add(username.lower())
+        usernames.append(username)
+    return usernames
+
+def hash_passwords(passwords):
+    """
+    Hash several passwords in parallel
+
+    The PBKDF2 hasher releases the GIL, so a small thread pool hashes a batch
+    of new accounts several times faster than doing it one by one.
+
+    Args:
+        passwords (list): Plain text passwords
+
+    Returns:
+        list: Password hashes in the same order
+    """
+    if len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    workers = min(len(passwords), getattr(settings, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_password, passwords))
+
+def create_team_member_users(people):
+    """
+    Create team_member users in bulk
 
-        # Generate random password
-        password = generate_random_password()
+    Args:
+        people (list): Dicts with email, first_name and last_name
+
+    Returns:
+        list: (User object, password) tuples for the created users, in order.
+        People whose email address already belongs to a user are skipped.
+    """
+    from .models import UserProfile
 
-        # Create user
-        user = User.objects.create_user(
+    existing = {
+        email.lower()
+        for email in User.objects.filter(
+            reduce(or_, [Q(email__iexact=person['email']) for person in people], Q(pk__in=[]))
+        ).values_list('email', flat=True)
+    }
+    people = [person for person in people if person['email'].lower() not in existing]
+    if not people:
+        return []
+
+    usernames = unique_usernames([person['email'].split('@')[0] for person in people])
+    passwords = [generate_random_password() for _ in people]
+    # Hashed before the rows are written, so an account never exists without
+    # the password it is about to be emailed
+    hashes = hash_passwords(passwords)
+
+    users = [
+        User(
             username=username,
-            email=email,
-            password=password,
-            first_name=first_name,
-            last_name=last_name
+            email=person['email'],
+            first_name=person['first_name'],
+            last_name=person['last_name'],
+            password=password_hash,
         )
+        for person, username, password_hash in zip(people, usernames, hashes)
+    ]
+
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        if any(user.pk is None for user in users):
+            # Databases that do not return primary keys from bulk inserts
+            by_username = User.objects.in_bulk(usernames, field_name='username')
+            users = [by_username[username] for username in usernames]
+        UserProfile.objects.bulk_create([UserProfile(user=user, role='team_member') for user in users])
+
+    return list(zip(users, passwords))
+
+def create_team_member_user(email, first_name, last_name):
+    """
+    Create a new user with team_member role
 
-        # Set user profile role to team_member
-        user.profile.role = 'team_member'
-        user.profile.save()
+    Args:
+        email (str): Email address
+        first_name (str): First name
+        last_name (str): Last name
 
-        return user, password
+    Returns:
+        tuple: (User object, password) if created successfully, (None, None) otherwise
+    """
+    try:
+        created = create_team_member_users([{'email': email, 'first_name': first_name, 'last_name': last_name}])
+        if not created:
+            return None, None
+        return created[0]
     except Exception as e:
         print(f"Error creating team member user: {e}")
         return None, None
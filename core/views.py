@@ -3,14 +3,23 @@ from django.contrib.auth import authenticate, login, logout, update_session_auth
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
+from django.http import JsonResponse
 from django.db.models import Count, Q
 from django.utils import timezone
+import json
+import uuid
 
 from .models import UserProfile
 from .forms import UserUpdateForm, ProfileUpdateForm, CustomPasswordChangeForm
+from .cache import cached_for_wedding
+from .passwords import check_guest_credential, create_guest_user
+from .guest_session import guest_login_redirect, end_guest_session
+from .sync import sync
+from . import api
+from weddings.calendar import feed_url
 from weddings.models import Wedding, WeddingEvent
 from tasks.models import Task
-from guests.models import Guest
+from guests.models import Guest, GuestCredential
 
 def home(request):
     """Home page view"""
@@ -103,16 +112,24 @@ def dashboard(request):
     # Guest dashboard
     else:
         # Get guest profiles for this user
-        guest_profiles = user.guest_profiles.all()
+        guest_profiles = user.guest_profiles.select_related('wedding', 'credential')
 
         # Get weddings for these guest profiles
         weddings = [guest.wedding for guest in guest_profiles]
 
-        # Get upcoming events for these weddings
-        upcoming_events = WeddingEvent.objects.filter(
-            wedding__in=weddings,
-            date__gte=timezone.now().date()
-        ).order_by('date', 'start_time')[:5]
+        # Get upcoming events for these weddings, served per wedding from the cache
+        today = timezone.now().date()
+        upcoming_events = []
+        for wedding in weddings:
+            upcoming_events += cached_for_wedding(
+                wedding.id, 'upcoming_events',
+                lambda: list(WeddingEvent.objects.filter(
+                    wedding=wedding,
+                    date__gte=today
+                ).select_related('wedding').order_by('date', 'start_time')[:5]),
+                today,
+            )
+        upcoming_events = sorted(upcoming_events, key=lambda event: (event.date, event.start_time))[:5]
 
         context.update({
             'guest_profiles': guest_profiles,
@@ -131,69 +148,32 @@ def login_view(request):
         username = request.POST.get('username')
         password = request.POST.get('password')
 
-        # First try to authenticate as a regular user
+        # Guest credentials are checked first: they are plain comparisons,
+        # while authenticate() always runs the (slow) password hasher
+        credential = GuestCredential.objects.select_related('guest__user').filter(username=username).first()
+
+        if credential is not None and check_guest_credential(credential, password):
+            # Check if credential is valid
+            if not credential.is_valid:
+                messages.error(request, "Your login credentials have expired.")
+                return redirect('login')
+
+            # Guest accounts have no usable password of their own
+            guest = credential.guest
+            user = guest.user or create_guest_user(guest, f"guest_{uuid.uuid4().hex[:8]}")
+
+            messages.success(request, f"Welcome, {guest.name}!")
+            return guest_login_redirect(request, credential, user)
+
+        # Otherwise authenticate as a regular user
         user = authenticate(username=username, password=password)
 
         if user is not None:
-            # Regular user authentication successful
             login(request, user)
             messages.success(request, f"Welcome back, {username}!")
             return redirect('dashboard')
         else:
-            # If regular authentication fails, try guest credentials
-            try:
-                from guests.models import GuestCredential
-                # Find the guest credential with this username
-                credential = GuestCredential.objects.get(username=username)
-
-                # Check if credential is valid
-                if not credential.is_valid:
-                    messages.error(request, "Your login credentials have expired.")
-                    return redirect('login')
-
-                # Get the guest associated with this credential
-                guest = credential.guest
-
-                # Check if the password matches the stored plain text password
-                if credential.password == password:
-                    # If guest already has a user, log them in
-                    if guest.user:
-                        user = guest.user
-                        # Update the user's password if it might have changed
-                        user.set_password(password)
-                        user.save()
-                    else:
-                        # Create a new user for this guest
-                        from django.contrib.auth.models import User
-                        import uuid
-
-                        # Create a unique username if needed
-                        user_username = f"guest_{uuid.uuid4().hex[:8]}"
-
-                        # Create the user
-                        user = User.objects.create_user(
-                            username=user_username,
-                            password=password,  # This will hash the password
-                            email=guest.email
-                        )
-
-                        # Set user profile to guest role
-                        from core.models import UserProfile
-                        UserProfile.objects.create(user=user, role='guest')
-
-                        # Associate guest with user
-                        guest.user = user
-                        guest.save()
-
-                    # Log the user in
-                    login(request, user)
-                    messages.success(request, f"Welcome, {guest.name}!")
-                    return redirect('dashboard')
-                else:
-                    messages.error(request, "Invalid username or password.")
-            except GuestCredential.DoesNotExist:
-                # Neither regular user nor guest credential found
-                messages.error(request, "Invalid username or password.")
+            messages.error(request, "Invalid username or password.")
 
     # For GET requests or failed authentication
     return render(request, 'auth/login.html', {'unified_login': True})
@@ -202,7 +182,7 @@ def logout_view(request):
     """Logout view"""
     logout(request)
     messages.success(request, "You have been logged out successfully.")
-    return redirect('home')
+    return end_guest_session(redirect('home'))
 
 def register(request):
     """User registration view"""
@@ -242,6 +222,7 @@ def profile(request):
     context = {
         'user_form': user_form,
         'profile_form': profile_form,
+        'calendar_url': feed_url(request),
         'active_tab': 'profile'
     }
 
@@ -268,3 +249,82 @@ def settings(request):
     }
 
     return render(request, 'core/settings.html', context)
+
+@login_required
+def sync_api(request):
+    """
+    Delta sync for offline clients (JSON)
+
+    GET ?cursor= returns changes since the cursor; POST {"cursor": ..., "mutations": [...]}
+    also applies the device's changes first. ?wedding=1,2 limits the weddings.
+    """
+    user = request.user
+
+    # Only admins and team members work offline
+    if user.profile.role == 'admin':
+        weddings = Wedding.objects.filter(admin=user)
+    elif user.profile.role == 'team_member':
+        weddings = Wedding.objects.filter(team_members__member=user)
+    else:
+        return JsonResponse({'error': "You don't have permission to sync."}, status=403)
+
+    wedding_ids = list(weddings.order_by('id').values_list('id', flat=True))
+    if request.GET.get('wedding'):
+        requested = {part.strip() for part in request.GET['wedding'].split(',')}
+        wedding_ids = [wedding_id for wedding_id in wedding_ids if str(wedding_id) in requested]
+
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(payload, dict) or not isinstance(payload.get('mutations', []), list):
+            return JsonResponse({'error': 'Expected {"cursor": ..., "mutations": [...]}'}, status=400)
+        data = sync(user, wedding_ids, payload.get('cursor'), payload.get('mutations') or [])
+    else:
+        data = sync(user, wedding_ids, request.GET.get('cursor'))
+
+    return JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+
+
+
+def _api_wedding_ids(user):
+    """Weddings whose data a user may read through the API, or None"""
+    if user.profile.role == 'admin':
+        weddings = Wedding.objects.filter(admin=user)
+    elif user.profile.role == 'team_member':
+        weddings = Wedding.objects.filter(team_members__member=user)
+    else:
+        return None
+    return list(weddings.values_list('id', flat=True))
+
+@login_required
+def api_list(request, resource):
+    """
+    Read-only JSON list of a resource (see core/api.py)
+
+    Supports ?fields=, ?include=, ?fields[<include>]=, ?wedding=1,2, ?limit= and ?cursor=.
+    """
+    return _api_response(request, resource)
+
+@login_required
+def api_detail(request, resource, object_id):
+    """Read-only JSON for one object of a resource; supports ?fields= and ?include="""
+    return _api_response(request, resource, object_id)
+
+def _api_response(request, resource, object_id=None):
+    resource = api.get_resource(resource)
+    if resource is None:
+        return api.json_response({'error': 'Unknown resource.'}, status=404)
+
+    wedding_ids = _api_wedding_ids(request.user)
+    if wedding_ids is None:
+        return api.json_response({'error': "You don't have permission to use the API."}, status=403)
+
+    try:
+        data = api.query(resource, wedding_ids, request.GET, object_id)
+    except api.APIError as e:
+        return api.json_response({'error': str(e)}, status=400)
+    if object_id is not None and data['data'] is None:
+        return api.json_response({'error': 'Not found.'}, status=404)
+    return api.json_response(data)
@@ -8,6 +8,7 @@ django.setup()
 
 from django.contrib.auth.models import User
 from core.models import UserProfile
+from core.passwords import make_account_password
 
 def create_team_members():
     """Create users with team_member role if none exist"""
@@ -72,10 +73,10 @@ def create_team_members():
             continue
             
         # Create user
-        user = User.objects.create_user(
+        user = User.objects.create(
             username=data['username'],
             email=data['email'],
-            password=data['password'],
+            password=make_account_password(data['password'], 'seed'),
             first_name=data['first_name'],
             last_name=data['last_name']
         )
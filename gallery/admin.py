@@ -1,36 +1,82 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import MediaCategory, Media, MediaComment, MediaLike
+from core.admin_utils import LargeTableAdmin
+from core.cache import bump_wedding_cache_versions
+from core.search import index_queryset
 
 class MediaCommentInline(admin.TabularInline):
     model = MediaComment
     extra = 0
+    autocomplete_fields = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('media', 'user')
 
 class MediaLikeInline(admin.TabularInline):
     model = MediaLike
     extra = 0
+    autocomplete_fields = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('media', 'user')
 
 @admin.register(MediaCategory)
 class MediaCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'wedding', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('wedding',)
     search_fields = ('name', 'description', 'wedding__title')
+    autocomplete_fields = ('wedding',)
 
 @admin.register(Media)
-class MediaAdmin(admin.ModelAdmin):
+class MediaAdmin(LargeTableAdmin):
     list_display = ('title', 'wedding', 'category', 'media_type', 'uploaded_by', 'is_featured', 'is_private', 'upload_date')
     list_filter = ('media_type', 'is_featured', 'is_private', 'upload_date')
+    list_select_related = ('wedding', 'category__wedding', 'uploaded_by')
     search_fields = ('title', 'description', 'wedding__title')
-    date_hierarchy = 'upload_date'
+    autocomplete_fields = ('wedding', 'category', 'uploaded_by')
+    # No date_hierarchy: it runs a DISTINCT over the dates of the whole table on every page
     inlines = [MediaCommentInline, MediaLikeInline]
+    actions = ['make_private', 'make_public', 'mark_featured', 'unmark_featured']
+
+    def _update(self, request, queryset, message, **fields):
+        ids = list(queryset.values_list('id', flat=True))
+        updated = Media.objects.filter(id__in=ids).update(**fields)
+        # update() skips the post_save signals that normally invalidate cached
+        # galleries and keep the search index in sync
+        changed = Media.objects.filter(id__in=ids)
+        bump_wedding_cache_versions(changed.values_list('wedding_id', flat=True))
+        index_queryset(changed)
+        self.message_user(request, f"{updated} {message}", messages.SUCCESS)
+
+    @admin.action(description='Make selected media private')
+    def make_private(self, request, queryset):
+        self._update(request, queryset.filter(is_private=False), "media items made private.", is_private=True)
+
+    @admin.action(description='Make selected media public')
+    def make_public(self, request, queryset):
+        self._update(request, queryset.filter(is_private=True), "media items made public.", is_private=False)
+
+    @admin.action(description='Feature selected media')
+    def mark_featured(self, request, queryset):
+        self._update(request, queryset.filter(is_featured=False), "media items featured.", is_featured=True)
+
+    @admin.action(description='Stop featuring selected media')
+    def unmark_featured(self, request, queryset):
+        self._update(request, queryset.filter(is_featured=True), "media items no longer featured.", is_featured=False)
 
 @admin.register(MediaComment)
-class MediaCommentAdmin(admin.ModelAdmin):
+class MediaCommentAdmin(LargeTableAdmin):
     list_display = ('media', 'user', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('media__wedding', 'user')
     search_fields = ('media__title', 'user__username', 'comment')
+    autocomplete_fields = ('media', 'user')
 
 @admin.register(MediaLike)
-class MediaLikeAdmin(admin.ModelAdmin):
+class MediaLikeAdmin(LargeTableAdmin):
     list_display = ('media', 'user', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('media__wedding', 'user')
     search_fields = ('media__title', 'user__username')
+    autocomplete_fields = ('media', 'user')
@@ -0,0 +1,13 @@
+"""Media resources of the JSON API (see core/api.py)"""
+from .models import Media, MediaComment, MediaLike
+from core import api
+
+api.register(
+    'media', Media, 'wedding',
+    ('wedding', 'category', 'title', 'description', 'media_type', 'file', 'thumbnail', 'uploaded_by',
+     'is_featured', 'is_private', 'upload_date'),
+    includes=(
+        api.Include('comments', MediaComment, 'media', ('user', 'comment', 'created_at')),
+        api.Include('likes', MediaLike, 'media', ('user', 'created_at')),
+    ),
+)
@@ -0,0 +1,252 @@
+"""
+ZIP export of wedding galleries
+
+stream_gallery_zip() builds the archive on the fly while it is being sent:
+zipfile writes into a small buffer that is drained after every chunk, so
+neither the whole archive nor any single file is ever held in memory or
+written to disk. Photos and videos are already compressed and are stored as
+is; everything else is deflated.
+
+For very large galleries build_gallery_archive() writes the same archive to
+disk in the background, and later downloads are served straight from that
+file until the gallery changes.
+"""
+import hashlib
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.text import get_valid_filename
+
+from .models import Media
+from core.background import run_in_background
+
+CHUNK_SIZE = 64 * 1024
+
+# File types that do not get smaller when deflated
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif',
+    '.mp4', '.mov', '.m4v', '.webm', '.avi', '.mkv', '.zip',
+}
+
+ARCHIVE_DIR = 'archives'
+
+
+class _StreamBuffer:
+    """Write-only file object that hands written bytes back to the caller"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Having tell() but no seek() makes zipfile write data descriptors
+        # instead of seeking back to patch local headers
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def gallery_media(wedding, category=None, include_private=False):
+    """
+    Media items that belong in a wedding's archive
+
+    Args:
+        wedding: Wedding object
+        category: MediaCategory object to limit the archive to (optional)
+        include_private (bool): Whether to include private media
+
+    Returns:
+        QuerySet: Media with their categories, oldest first
+    """
+    media = Media.objects.filter(wedding=wedding).select_related('category').order_by('upload_date', 'id')
+    if category is not None:
+        media = media.filter(category=category)
+    if not include_private:
+        media = media.filter(is_private=False)
+    return media
+
+
+def _entry_name(media):
+    try:
+        return get_valid_filename(media.title)
+    except SuspiciousFileOperation:
+        return str(media.id)
+
+
+def _archive_entries(media_items):
+    """Yield (arcname, path) pairs with unique names, grouped by category"""
+    used_names = set()
+    for media in media_items:
+        if not media.file:
+            continue
+        path = media.file.path
+        if not os.path.exists(path):
+            continue
+
+        folder = media.category.name if media.category else 'Uncategorized'
+        folder = folder.replace('/', '-').strip() or 'Uncategorized'
+        # Stored names are content hashes, so entries are named after the title
+        extension = os.path.splitext(media.file.name)[1]
+        arcname = f"{folder}/{_entry_name(media)}{extension}"
+        if arcname in used_names:
+            base, ext = os.path.splitext(arcname)
+            arcname = f"{base}-{media.id}{ext}"
+        used_names.add(arcname)
+
+        yield arcname, path
+
+
+def _zip_info(arcname, path):
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+
+def stream_gallery_zip(media_items):
+    """
+    Generate a ZIP archive of media files chunk by chunk
+
+    Args:
+        media_items: Iterable of Media objects
+
+    Yields:
+        bytes: Consecutive pieces of the archive
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for arcname, path in _archive_entries(media_items):
+            zinfo = _zip_info(arcname, path)
+            with open(path, 'rb') as source, \
+                    archive.open(zinfo, 'w', force_zip64=zinfo.file_size >= zipfile.ZIP64_LIMIT) as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # Central directory
+    yield buffer.drain()
+
+
+def archive_name(wedding, category=None, include_private=False):
+    """Download name of a wedding's archive"""
+    name = f"{wedding.bride_name} & {wedding.groom_name}"
+    if category is not None:
+        name += f" - {category.name}"
+    if include_private:
+        name += " (all)"
+    return f"{name}.zip"
+
+
+def _archive_prefix(wedding, category, include_private):
+    scope = f"c{category.id}" if category is not None else 'all'
+    visibility = 'private' if include_private else 'public'
+    return f"wedding_{wedding.id}_{scope}_{visibility}_"
+
+
+def _fingerprint(media_items):
+    """
+    Hash of the entries of an archive
+
+    It changes whenever a file is added or removed, and whenever a title or
+    category name that entries are named after changes.
+    """
+    digest = hashlib.sha256()
+    rows = media_items.values_list('id', 'file', 'title', 'category_id', 'category__name')
+    for media_id, file_name, title, category_id, category_name in rows:
+        digest.update(f"{media_id}:{file_name}:{title}:{category_id}:{category_name};".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def cached_archive_path(wedding, category=None, include_private=False):
+    """
+    Path of the up-to-date cached archive of a gallery
+
+    Returns:
+        str: Absolute path of the archive file (which may not exist yet)
+    """
+    media_items = gallery_media(wedding, category, include_private)
+    filename = _archive_prefix(wedding, category, include_private) + _fingerprint(media_items) + '.zip'
+    return os.path.join(settings.MEDIA_ROOT, ARCHIVE_DIR, filename)
+
+
+def build_gallery_archive(wedding, category=None, include_private=False):
+    """
+    Write a gallery archive to disk, replacing older copies of it
+
+    Args:
+        wedding: Wedding object
+        category: MediaCategory object (optional)
+        include_private (bool): Whether to include private media
+
+    Returns:
+        str: Path of the archive
+    """
+    path = cached_archive_path(wedding, category, include_private)
+    if os.path.exists(path):
+        return path
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            for data in stream_gallery_zip(gallery_media(wedding, category, include_private)):
+                f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    # Remove archives of earlier states of the same gallery
+    prefix = _archive_prefix(wedding, category, include_private)
+    current = os.path.basename(path)
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.name.endswith('.zip') and entry.name != current:
+            os.remove(entry.path)
+
+    return path
+
+
+def _build_and_release(wedding, category, include_private, lock_key):
+    try:
+        build_gallery_archive(wedding, category, include_private)
+    finally:
+        cache.delete(lock_key)
+
+
+def schedule_gallery_archive(wedding, category=None, include_private=False):
+    """
+    Build a gallery archive in the background unless a build is already running
+
+    Returns:
+        bool: True if a new build was scheduled
+    """
+    lock_key = 'gallery_archive_build:' + _archive_prefix(wedding, category, include_private)
+    if not cache.add(lock_key, True, 60 * 60):
+        return False
+    run_in_background(_build_and_release, wedding, category, include_private, lock_key)
+    return True
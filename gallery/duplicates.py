@@ -0,0 +1,327 @@
+"""
+Near-duplicate photo detection
+
+Guests upload the same pictures from several phones, often re-encoded or
+resized on the way. Every photo gets two 64-bit perceptual hashes when it is
+uploaded (or by the hash_gallery_media command):
+
+- aHash: each pixel of an 8x8 grayscale thumbnail compared to the mean;
+- dHash: each pixel of a 9x8 thumbnail compared to its right neighbour.
+
+Copies of one picture have hashes a few bits apart, so near-duplicates are
+photos within a small Hamming distance of each other on both hashes. JPEGs are
+decoded at reduced size (Pillow's draft mode), so hashing a 12 megapixel photo
+takes a few milliseconds; the bit twiddling uses NumPy when it is installed.
+
+Each process keeps a BK-tree of the dHashes of recently checked weddings,
+which answers "which photos are within distance d?" by visiting only a small
+part of the tree. Like the guest lookup index, it is rebuilt when the
+wedding's cache version changes (every Media save or delete bumps it).
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Media, MediaComment, MediaLike
+from .reactions import recount_feedback
+from core.cache import bump_wedding_cache_version, get_wedding_cache_version
+
+try:
+    import numpy
+except ImportError:  # optional; the hashes are computed in pure Python instead
+    numpy = None
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _signed(value):
+    """Store an unsigned 64-bit hash in a (signed) BigIntegerField"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def distance(a, b):
+    """Number of differing bits of two hashes"""
+    return (_unsigned(a) ^ _unsigned(b)).bit_count()
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _hashes(gray8, gray9):
+    """(aHash, dHash) of an 8x8 and a 9x8 grayscale image"""
+    if numpy is not None:
+        pixels = numpy.asarray(gray8, dtype=numpy.float32)
+        ahash = numpy.packbits(pixels > pixels.mean()).view('>u8')[0]
+        pixels = numpy.asarray(gray9, dtype=numpy.int16)
+        dhash = numpy.packbits(pixels[:, 1:] > pixels[:, :-1]).view('>u8')[0]
+        return int(ahash), int(dhash)
+
+    pixels = list(gray8.getdata())
+    mean = sum(pixels) / len(pixels)
+    ahash = _bits_to_int(pixel > mean for pixel in pixels)
+    pixels = list(gray9.getdata())
+    dhash = _bits_to_int(
+        pixels[row * 9 + col + 1] > pixels[row * 9 + col] for row in range(8) for col in range(8)
+    )
+    return ahash, dhash
+
+
+def image_hashes(file):
+    """
+    Compute the perceptual hashes of an image
+
+    Args:
+        file: Open file or path of the image; a file is rewound afterwards
+
+    Returns:
+        tuple: (ahash, dhash) as signed 64-bit integers, or None if the file
+        is not an image Pillow can read
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(file) as image:
+            # JPEGs are decoded straight to a small grayscale image
+            image.draft('L', (64, 64))
+            image = ImageOps.exif_transpose(image).convert('L')
+            gray8 = image.resize((8, 8), Image.Resampling.LANCZOS)
+            gray9 = image.resize((9, 8), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    finally:
+        if hasattr(file, 'seek'):
+            file.seek(0)
+
+    ahash, dhash = _hashes(gray8, gray9)
+    return _signed(ahash), _signed(dhash)
+
+
+def hash_media(media):
+    """
+    Set the hashes of a photo from its file (does not save it)
+
+    Returns:
+        bool: Whether the file could be hashed
+    """
+    if not media.is_photo or not media.file:
+        return False
+    try:
+        with media.file.open('rb') as f:
+            hashes = image_hashes(f)
+    except (FileNotFoundError, OSError):
+        hashes = None
+    if hashes is None:
+        return False
+    media.ahash, media.dhash = hashes
+    return True
+
+
+class BKTree:
+    """Burkhard-Keller tree of 64-bit hashes under the Hamming distance"""
+
+    def __init__(self):
+        # Node: [hash, [(item, other hash), ...], {distance: child}]
+        self.root = None
+
+    def add(self, value, item, other=None):
+        if self.root is None:
+            self.root = [value, [(item, other)], {}]
+            return
+        node = self.root
+        while True:
+            d = distance(value, node[0])
+            if d == 0:
+                node[1].append((item, other))
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [(item, other)], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Items within radius of value
+
+        Returns:
+            list: (distance, item, other hash) tuples
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = distance(value, node[0])
+            if d <= radius:
+                found += [(d, item, other) for item, other in node[1]]
+            # By the triangle inequality only children at distance
+            # d - radius .. d + radius can hold matches
+            for child_distance, child in node[2].items():
+                if d - radius <= child_distance <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def _build_index(wedding_id):
+    tree = BKTree()
+    rows = Media.objects.filter(wedding_id=wedding_id, dhash__isnull=False).values_list('id', 'dhash', 'ahash')
+    for media_id, dhash, ahash in rows.iterator():
+        tree.add(dhash, media_id, ahash)
+    return tree
+
+
+def get_duplicate_index(wedding_id):
+    """
+    Get the BK-tree of a wedding's photos, building it on first use or after a change
+
+    Args:
+        wedding_id (int): Wedding ID
+
+    Returns:
+        BKTree: dHashes of the wedding's photos, with media IDs and aHashes
+    """
+    version = get_wedding_cache_version(wedding_id)
+    with _lock:
+        entry = _indexes.get(wedding_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(wedding_id)
+            return entry[1]
+
+    index = _build_index(wedding_id)
+    # Number of weddings whose index is kept in memory per process
+    max_weddings = getattr(settings, 'GALLERY_DUPLICATE_MAX_WEDDINGS', 16)
+    with _lock:
+        _indexes[wedding_id] = (version, index)
+        _indexes.move_to_end(wedding_id)
+        while len(_indexes) > max_weddings:
+            _indexes.popitem(last=False)
+    return index
+
+
+def find_duplicates(wedding_id, ahash, dhash, exclude=None, max_distance=None, index=None):
+    """
+    Photos of a wedding that look like the given hashes
+
+    Args:
+        wedding_id (int): Wedding ID
+        ahash (int): aHash of the photo
+        dhash (int): dHash of the photo
+        exclude (int): Media ID to leave out (the photo itself)
+        max_distance (int): Largest Hamming distance on either hash
+            (default: the GALLERY_DUPLICATE_DISTANCE setting, 6)
+        index (BKTree): Index to search (default: the wedding's)
+
+    Returns:
+        list: Media IDs, closest first
+    """
+    if max_distance is None:
+        max_distance = getattr(settings, 'GALLERY_DUPLICATE_DISTANCE', 6)
+    if index is None:
+        index = get_duplicate_index(wedding_id)
+    matches = [
+        (d + distance(ahash, other), media_id)
+        for d, media_id, other in index.search(dhash, max_distance)
+        if media_id != exclude and other is not None and distance(ahash, other) <= max_distance
+    ]
+    return [media_id for _, media_id in sorted(matches)]
+
+
+def duplicate_groups(wedding_id, include_reviewed=False):
+    """
+    Groups of near-duplicate photos of a wedding
+
+    Args:
+        wedding_id (int): Wedding ID
+        include_reviewed (bool): Also return groups whose photos were all
+            already reviewed and kept
+
+    Returns:
+        list: Lists of Media objects, oldest upload first in each group
+    """
+    index = get_duplicate_index(wedding_id)
+    rows = list(Media.objects.filter(wedding_id=wedding_id, dhash__isnull=False).values_list('id', 'ahash', 'dhash'))
+
+    # Union-find over every near-duplicate pair
+    parent = {media_id: media_id for media_id, _, _ in rows}
+
+    def find(media_id):
+        while parent[media_id] != media_id:
+            parent[media_id] = parent[parent[media_id]]
+            media_id = parent[media_id]
+        return media_id
+
+    for media_id, ahash, dhash in rows:
+        for other_id in find_duplicates(wedding_id, ahash, dhash, exclude=media_id, index=index):
+            if other_id in parent:
+                parent[find(media_id)] = find(other_id)
+
+    members = defaultdict(list)
+    for media_id in parent:
+        members[find(media_id)].append(media_id)
+    grouped = [ids for ids in members.values() if len(ids) > 1]
+    if not grouped:
+        return []
+
+    media = Media.objects.select_related('uploaded_by').in_bulk([media_id for ids in grouped for media_id in ids])
+    groups = []
+    for ids in grouped:
+        items = sorted((media[media_id] for media_id in ids if media_id in media), key=lambda item: item.upload_date)
+        if len(items) > 1 and (include_reviewed or not all(item.duplicates_reviewed for item in items)):
+            groups.append(items)
+    groups.sort(key=lambda items: items[0].upload_date)
+    return groups
+
+
+def mark_reviewed(wedding_id, media_ids):
+    """Keep a group of photos that are not really duplicates out of the review list"""
+    Media.objects.filter(wedding_id=wedding_id, id__in=media_ids).update(duplicates_reviewed=True)
+    bump_wedding_cache_version(wedding_id)
+
+
+def merge_duplicates(keep, duplicates):
+    """
+    Merge duplicate photos into one
+
+    Comments and likes move to the photo that is kept (a user who liked
+    several copies keeps one like), it stays featured if any copy was, and the
+    copies are deleted.
+
+    Args:
+        keep (Media): Photo to keep
+        duplicates (list): Media objects of the same wedding to merge into it
+
+    Returns:
+        int: Number of photos removed
+    """
+    duplicates = [media for media in duplicates if media.pk != keep.pk and media.wedding_id == keep.wedding_id]
+    if not duplicates:
+        return 0
+    ids = [media.pk for media in duplicates]
+
+    with transaction.atomic():
+        MediaComment.objects.filter(media_id__in=ids).update(media=keep)
+        liked = set(keep.likes.values_list('user_id', flat=True))
+        for like in MediaLike.objects.filter(media_id__in=ids).exclude(user_id__in=liked).order_by('created_at'):
+            if like.user_id not in liked:
+                MediaLike.objects.filter(pk=like.pk).update(media=keep)
+                liked.add(like.user_id)
+        # update() skips the signals that keep the counts
+        recount_feedback([keep.pk])
+
+        keep.duplicates_reviewed = True
+        keep.is_featured = keep.is_featured or any(media.is_featured for media in duplicates)
+        keep.save(update_fields=['duplicates_reviewed', 'is_featured'])
+
+        # Their files go too, unless other photos share them (gallery/signals.py)
+        Media.objects.filter(id__in=ids).delete()
+    return len(ids)
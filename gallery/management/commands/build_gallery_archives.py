@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from gallery.archive import build_gallery_archive
+from gallery.models import MediaCategory
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = "Build the cached ZIP archives served for large wedding galleries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wedding', type=int, action='append', dest='weddings',
+                            help='Only build archives for this wedding ID (can be repeated)')
+        parser.add_argument('--categories', action='store_true',
+                            help='Also build one archive per media category')
+
+    def handle(self, *args, **options):
+        weddings = Wedding.objects.all().order_by('id')
+        if options['weddings']:
+            weddings = weddings.filter(id__in=options['weddings'])
+
+        for wedding in weddings:
+            categories = [None]
+            if options['categories']:
+                categories += list(MediaCategory.objects.filter(wedding=wedding))
+
+            for category in categories:
+                # Guests download the public archive, admins and team members the full one
+                for include_private in (False, True):
+                    path = build_gallery_archive(wedding, category, include_private)
+                    self.stdout.write(f"  ✓ {path}")
+
+        self.stdout.write(self.style.SUCCESS("Gallery archives are up to date."))
@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from gallery.metadata import METADATA_FIELDS, metadata_values, read_metadata
+from gallery.models import Media
+from core.cache import bump_wedding_cache_versions
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = "Read capture times and other EXIF metadata of photos, in parallel worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wedding', type=int, action='append', dest='weddings',
+                            help='Only read photos of this wedding ID (can be repeated)')
+        parser.add_argument('--all', action='store_true',
+                            help='Also re-read photos whose metadata was already read')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        photos = Media.objects.filter(media_type='photo').exclude(file='').order_by('id')
+        if options['weddings']:
+            photos = photos.filter(wedding_id__in=options['weddings'])
+        if not options['all']:
+            photos = photos.filter(metadata_extracted=False)
+
+        read = dated = 0
+        weddings = set()
+        # Workers only parse files; all database work stays in this process
+        with ProcessPoolExecutor(max_workers=max(options['workers'] or 1, 1), initializer=django.setup) as pool:
+            rows = photos.values_list('id', 'wedding_id', 'file').iterator(chunk_size=BATCH_SIZE)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    dated += self._process(pool, batch)
+                    read += len(batch)
+                    weddings.update(wedding_id for _, wedding_id, _ in batch)
+                    batch = []
+            if batch:
+                dated += self._process(pool, batch)
+                read += len(batch)
+                weddings.update(wedding_id for _, wedding_id, _ in batch)
+
+        # bulk_update() skips the signals that refresh cached galleries
+        bump_wedding_cache_versions(weddings)
+
+        self.stdout.write(f"  ✓ {read} photos read, {dated} with a capture time")
+        self.stdout.write(self.style.SUCCESS("Photo metadata is up to date."))
+
+    def _process(self, pool, batch):
+        storage = Media._meta.get_field('file').storage
+        paths = [storage.path(name) for _, _, name in batch]
+        updates = []
+        for (media_id, _, _), metadata in zip(batch, pool.map(read_metadata, paths, chunksize=16)):
+            media = Media(id=media_id, **metadata_values(metadata))
+            updates.append(media)
+        Media.objects.bulk_update(updates, METADATA_FIELDS)
+        return sum(1 for media in updates if media.captured_at is not None)
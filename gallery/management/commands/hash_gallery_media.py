@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from gallery.duplicates import hash_media
+from gallery.models import Media
+from core.cache import bump_wedding_cache_versions
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = "Compute the perceptual hashes used to find duplicate photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wedding', type=int, action='append', dest='weddings',
+                            help='Only hash photos of this wedding ID (can be repeated)')
+        parser.add_argument('--rehash', action='store_true',
+                            help='Also hash photos that already have hashes')
+
+    def handle(self, *args, **options):
+        photos = Media.objects.filter(media_type='photo').only('id', 'wedding_id', 'media_type', 'file').order_by('id')
+        if options['weddings']:
+            photos = photos.filter(wedding_id__in=options['weddings'])
+        if not options['rehash']:
+            photos = photos.filter(dhash__isnull=True)
+
+        hashed = failed = 0
+        batch = []
+        weddings = set()
+        for media in photos.iterator(chunk_size=BATCH_SIZE):
+            if hash_media(media):
+                batch.append(media)
+                weddings.add(media.wedding_id)
+                hashed += 1
+            else:
+                failed += 1
+            if len(batch) >= BATCH_SIZE:
+                Media.objects.bulk_update(batch, ['ahash', 'dhash'])
+                batch = []
+        if batch:
+            Media.objects.bulk_update(batch, ['ahash', 'dhash'])
+
+        # bulk_update() skips the signals that refresh the duplicate index
+        bump_wedding_cache_versions(weddings)
+
+        self.stdout.write(f"  ✓ {hashed} photos hashed")
+        if failed:
+            self.stdout.write(f"  ✗ {failed} photos could not be read")
+        self.stdout.write(self.style.SUCCESS("Duplicate detection is up to date."))
@@ -0,0 +1,107 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.template.defaultfilters import filesizeformat
+
+from gallery.models import Media, StorageUsage
+from gallery.quotas import media_usage_totals
+from core.models import Blob
+
+BATCH_SIZE = 500
+
+
+def _walk(path):
+    """Yield the size of every file below path without listing whole trees in memory"""
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.stat(follow_symlinks=False).st_size
+
+
+class Command(BaseCommand):
+    help = "Recompute the storage usage counters behind gallery quotas and compare them with the disk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-disk', action='store_true',
+                            help='Do not scan the media directory')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"  ✓ {self._backfill()} media sizes and types filled in")
+
+        with transaction.atomic():
+            fixed = self._reconcile('wedding_id', 'wedding_id') + self._reconcile('user_id', 'uploaded_by_id')
+        self.stdout.write(f"  ✓ {fixed} usage counters corrected")
+
+        if not options['skip_disk']:
+            self._compare_with_disk()
+
+        self.stdout.write(self.style.SUCCESS("Storage usage is up to date."))
+
+    def _backfill(self):
+        """Fill in the size and type of media uploaded before they were recorded"""
+        sizes = dict(Blob.objects.values_list('name', 'size'))
+        rows = Media.objects.filter(file_size=0).exclude(file='').only('id', 'file', 'content_type').order_by('id')
+        batch, filled = [], 0
+        for media in rows.iterator(chunk_size=BATCH_SIZE):
+            size = sizes.get(media.file.name)
+            if size is None:
+                try:
+                    size = media.file.size
+                except OSError:
+                    self.stdout.write(f"  ✗ Media {media.id}: {media.file.name} is missing")
+                    continue
+            media.file_size = size
+            media.content_type = media.content_type or mimetypes.guess_type(media.file.name)[0] or ''
+            batch.append(media)
+            if len(batch) >= BATCH_SIZE:
+                filled += Media.objects.bulk_update(batch, ['file_size', 'content_type'])
+                batch = []
+        if batch:
+            filled += Media.objects.bulk_update(batch, ['file_size', 'content_type'])
+        return filled
+
+    def _reconcile(self, owner, media_field):
+        """Make the counters of weddings or users match the sums over their media"""
+        totals = media_usage_totals(media_field)
+        fixed = 0
+        for usage in StorageUsage.objects.filter(**{f"{owner}__isnull": False}).select_for_update():
+            size, files = totals.pop(getattr(usage, owner), (0, 0))
+            if (usage.bytes_used, usage.file_count) != (size, files):
+                StorageUsage.objects.filter(pk=usage.pk).update(bytes_used=size, file_count=files)
+                fixed += 1
+        StorageUsage.objects.bulk_create([
+            StorageUsage(**{owner: owner_id}, bytes_used=size, file_count=files)
+            for owner_id, (size, files) in totals.items()
+        ], batch_size=BATCH_SIZE)
+        return fixed + len(totals)
+
+    def _compare_with_disk(self):
+        """Report how the bytes on disk compare with what the rows account for"""
+        root = os.path.join(settings.MEDIA_ROOT, Media._meta.get_field('file').upload_to)
+        disk_bytes = disk_files = 0
+        for size in _walk(root):
+            disk_bytes += size
+            disk_files += 1
+
+        counted = sum(size for size, _ in media_usage_totals('wedding_id').values())
+        unique = Blob.objects.filter(name__in=Media.objects.values('file')).aggregate(size=Sum('size'))['size'] or 0
+        tracked = Blob.objects.aggregate(size=Sum('size'))['size'] or 0
+        self.stdout.write(
+            f"  ✓ {disk_files} files, {filesizeformat(disk_bytes)} on disk; {filesizeformat(counted)} uploaded, "
+            f"{filesizeformat(max(counted - unique, 0))} saved by storing identical files once"
+        )
+        if disk_bytes > tracked:
+            self.stdout.write(
+                f"  ✗ {filesizeformat(disk_bytes - tracked)} on disk not tracked as stored files "
+                "(older files or orphans); see rebuild_blobs"
+            )
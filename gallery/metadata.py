@@ -0,0 +1,127 @@
+"""
+Photo metadata (EXIF) for the gallery timeline
+
+When a photo was taken matters more than when it was uploaded: photographers
+bulk-upload the day after and guests upload from the train home. The capture
+time, camera, displayed dimensions and orientation are read from the photo's
+EXIF data in the background after upload (or by the extract_media_metadata
+command) and stored in columns on Media, so the timeline can select photos
+by time with indexed range queries.
+
+Camera clocks are set to local time without a time zone, just like event
+times, so capture times are stored as that wall-clock time in the site's time
+zone and compare directly with event start and end times.
+"""
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Media
+from core.cache import bump_wedding_cache_version
+
+# EXIF tags (see the EXIF 2.3 specification)
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+
+# Orientations that rotate the picture by 90 degrees, swapping width and height
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+METADATA_FIELDS = ['captured_at', 'camera', 'width', 'height', 'orientation', 'metadata_extracted']
+
+# What is stored for files without readable metadata
+NO_METADATA = {'captured_at': None, 'camera': '', 'width': None, 'height': None, 'orientation': None}
+
+
+def _parse_datetime(value):
+    """Parse an EXIF 'YYYY:MM:DD HH:MM:SS' value"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.datetime.strptime(value.strip().rstrip('\x00')[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return str(value or '').strip().rstrip('\x00').strip()
+
+
+def read_metadata(path):
+    """
+    Read the metadata of a photo
+
+    Runs without the database, so it can be used from worker processes.
+
+    Args:
+        path (str): Path of the photo
+
+    Returns:
+        dict: captured_at (naive datetime or None), camera (str), width and height
+        as displayed, and orientation (1-8 or None); None if the file is not
+        an image Pillow can read
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            exif = image.getexif()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    details = exif.get_ifd(TAG_EXIF_IFD) if exif else {}
+    orientation = exif.get(TAG_ORIENTATION)
+    if orientation not in range(1, 9):
+        orientation = None
+    if orientation in ROTATED_ORIENTATIONS:
+        width, height = height, width
+
+    make, model = _text(exif.get(TAG_MAKE)), _text(exif.get(TAG_MODEL))
+    # Models usually repeat the make ("Canon" / "Canon EOS R5")
+    camera = model if model.lower().startswith(make.lower()) else f"{make} {model}".strip()
+
+    captured_at = None
+    for value in (details.get(TAG_DATETIME_ORIGINAL), details.get(TAG_DATETIME_DIGITIZED), exif.get(TAG_DATETIME)):
+        captured_at = _parse_datetime(value)
+        if captured_at is not None:
+            break
+
+    return {
+        'captured_at': captured_at,
+        'camera': camera[:100],
+        'width': width,
+        'height': height,
+        'orientation': orientation,
+    }
+
+
+def metadata_values(metadata):
+    """Field values to store for the result of read_metadata()"""
+    values = {**NO_METADATA, **(metadata or {}), 'metadata_extracted': True}
+    if values['captured_at'] is not None and settings.USE_TZ:
+        values['captured_at'] = timezone.make_aware(values['captured_at'])
+    return values
+
+
+def extract_media_metadata(media_id):
+    """
+    Read and store the metadata of one photo; meant for run_in_background()
+
+    Args:
+        media_id (int): Media ID
+    """
+    media = Media.objects.filter(id=media_id, media_type='photo').only('id', 'wedding_id', 'file').first()
+    if media is None or not media.file:
+        return
+    # update() leaves the other fields alone and skips the post_save signals,
+    # so the wedding's cached pages are refreshed by hand
+    Media.objects.filter(id=media.id).update(**metadata_values(read_metadata(media.file.path)))
+    bump_wedding_cache_version(media.wedding_id)
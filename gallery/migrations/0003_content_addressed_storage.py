@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:43
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0002_media_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='file',
+            field=models.FileField(max_length=255, storage=core.storage.content_addressed_storage, upload_to='wedding_media/'),
+        ),
+        migrations.AlterField(
+            model_name='media',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, null=True, storage=core.storage.content_addressed_storage, upload_to='wedding_media/thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:51
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_feedback(apps, schema_editor):
+    Media = apps.get_model('gallery', 'Media')
+
+    def count(model_name):
+        model = apps.get_model('gallery', model_name)
+        rows = model.objects.filter(media=OuterRef('pk')).order_by().values('media').annotate(n=Count('id'))
+        return Coalesce(Subquery(rows.values('n'), output_field=IntegerField()), Value(0))
+
+    Media.objects.update(like_count=count('MediaLike'), comment_count=count('MediaComment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0005_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_feedback, migrations.RunPython.noop),
+    ]
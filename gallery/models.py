@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 
 from weddings.models import Wedding
+from core.storage import content_addressed_storage
 
 class MediaCategory(models.Model):
     """Categories for organizing media files"""
@@ -29,15 +30,34 @@ class Media(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     media_type = models.CharField(max_length=10, choices=MEDIA_TYPES, default='photo')
-    file = models.FileField(upload_to='wedding_media/')
-    thumbnail = models.ImageField(upload_to='wedding_media/thumbnails/', blank=True, null=True)
+    file = models.FileField(upload_to='wedding_media/', storage=content_addressed_storage, max_length=255)
+    thumbnail = models.ImageField(upload_to='wedding_media/thumbnails/', storage=content_addressed_storage,
+                                  max_length=255, blank=True, null=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_media')
     is_featured = models.BooleanField(default=False)
     is_private = models.BooleanField(default=False)
     upload_date = models.DateTimeField(auto_now_add=True)
+    # Perceptual hashes of photos for finding near-duplicates (gallery/duplicates.py)
+    ahash = models.BigIntegerField(null=True, blank=True, editable=False)
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False)
+    duplicates_reviewed = models.BooleanField(default=False)
+    # Read from the photo's EXIF data after upload (gallery/metadata.py)
+    captured_at = models.DateTimeField(null=True, blank=True)
+    camera = models.CharField(max_length=100, blank=True, default='')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    orientation = models.PositiveSmallIntegerField(null=True, blank=True)
+    metadata_extracted = models.BooleanField(default=False)
+    # Captured at upload; counted in StorageUsage (gallery/quotas.py)
+    file_size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    # Kept up to date by gallery/signals.py (see gallery/reactions.py)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name_plural = "Media"
+        indexes = [models.Index(fields=['wedding', 'captured_at'])]
 
     def __str__(self):
         return f"{self.title} - {self.wedding}"
@@ -50,6 +70,26 @@ class Media(models.Model):
     def is_video(self):
         return self.media_type == 'video'
 
+class StorageUsage(models.Model):
+    """Running totals of the media stored for a wedding or uploaded by a user"""
+    wedding = models.OneToOneField(Wedding, on_delete=models.CASCADE, related_name='storage_usage', null=True, blank=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='storage_usage', null=True, blank=True)
+    bytes_used = models.PositiveBigIntegerField(default=0)
+    file_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Storage usage"
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(wedding__isnull=False, user__isnull=True) | models.Q(wedding__isnull=True, user__isnull=False),
+                name='storage_usage_wedding_or_user',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.wedding or self.user}: {self.bytes_used} bytes"
+
 class MediaComment(models.Model):
     """Comments on media items"""
     media = models.ForeignKey(Media, on_delete=models.CASCADE, related_name='comments')
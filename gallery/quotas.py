@@ -0,0 +1,152 @@
+"""
+Media storage quotas
+
+Every wedding, and every guest uploading to it, may store a limited amount of
+media (WEDDING_MEDIA_QUOTA_MB and GUEST_MEDIA_QUOTA_MB; 0 means unlimited).
+Summing the sizes of thousands of rows on each upload would get slower as
+the gallery grows, so StorageUsage keeps running totals: the signals in
+gallery/signals.py add a file when its Media row is created and subtract it
+when the row is deleted, in the same transaction. Reading a wedding's usage
+is then a single-row lookup.
+
+Usage counts the bytes each row was uploaded with, even when content-addressed
+storage keeps only one copy of a file uploaded twice: a wedding pays for what
+its guests uploaded, not for what happened to be shared with another wedding.
+The reconcile_storage_usage command recomputes the totals from the rows and
+compares them with the files on disk.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest
+
+from .models import Media, StorageUsage
+
+MB = 1024 * 1024
+
+
+def wedding_quota():
+    """Bytes a wedding may store, 0 if unlimited"""
+    return getattr(settings, 'WEDDING_MEDIA_QUOTA_MB', 0) * MB
+
+
+def guest_quota():
+    """Bytes a guest may upload, 0 if unlimited"""
+    return getattr(settings, 'GUEST_MEDIA_QUOTA_MB', 0) * MB
+
+
+class QuotaExceeded(Exception):
+    """An upload would take a wedding or a guest over their storage quota"""
+
+
+def _add(lookup, size, files):
+    updated = StorageUsage.objects.filter(**lookup).update(
+        bytes_used=Greatest(F('bytes_used') + size, Value(0)),
+        file_count=Greatest(F('file_count') + files, Value(0)),
+    )
+    # Removals never create a row: when a wedding or user is deleted, its
+    # usage row may already be gone by the time its media rows are
+    if updated or size < 0 or files < 0:
+        return
+    try:
+        # The first file of a wedding or user creates its row
+        with transaction.atomic():
+            StorageUsage.objects.create(**lookup, bytes_used=size, file_count=files)
+    except IntegrityError:
+        # Created by a concurrent upload in the meantime
+        _add(lookup, size, files)
+
+
+def record_usage(wedding_id, user_id, size, files=1):
+    """
+    Add stored bytes to the usage of a wedding and of the user who uploaded them
+
+    Args:
+        wedding_id (int): Wedding ID
+        user_id (int): Uploader's user ID, or None
+        size (int): Bytes added (negative when files are removed)
+        files (int): Files added (negative when files are removed)
+    """
+    with transaction.atomic():
+        _add({'wedding_id': wedding_id}, size, files)
+        if user_id is not None:
+            _add({'user_id': user_id}, size, files)
+
+
+def wedding_usage(wedding_id):
+    """Bytes stored for a wedding"""
+    return StorageUsage.objects.filter(wedding_id=wedding_id).values_list('bytes_used', flat=True).first() or 0
+
+
+def user_usage(user_id):
+    """Bytes uploaded by a user"""
+    return StorageUsage.objects.filter(user_id=user_id).values_list('bytes_used', flat=True).first() or 0
+
+
+def quota_error(wedding_id, user, size=0):
+    """
+    Check an upload against the wedding's and the uploader's quotas
+
+    Args:
+        wedding_id (int): Wedding ID
+        user: Uploading user (with profile)
+        size (int): Bytes about to be added
+
+    Returns:
+        str: Message for the user if the upload does not fit, otherwise None
+    """
+    limit = wedding_quota()
+    if limit and wedding_usage(wedding_id) + size > limit:
+        return "This wedding's gallery is full. Ask the wedding team to make room before uploading more."
+    limit = guest_quota()
+    if limit and user.profile.role == 'guest' and user_usage(user.id) + size > limit:
+        return f"You have used your {limit // MB} MB of uploads. Delete some of your media to upload more."
+    return None
+
+
+def save_within_quota(media):
+    """
+    Create a media row unless that takes its wedding or uploader over quota
+
+    The usage is added first and checked afterwards, in one transaction, so
+    two uploads racing for the last free space cannot both get in.
+
+    Raises:
+        QuotaExceeded: with the message for the user; nothing was saved
+    """
+    with transaction.atomic():
+        media.save()
+        error = quota_error(media.wedding_id, media.uploaded_by)
+        if error:
+            raise QuotaExceeded(error)
+
+
+def usage_summary(wedding_id):
+    """
+    Usage of a wedding's storage for display
+
+    Returns:
+        dict: bytes_used, file_count, quota (bytes, 0 if unlimited) and
+        percent of the quota used (None if unlimited)
+    """
+    usage = StorageUsage.objects.filter(wedding_id=wedding_id).values('bytes_used', 'file_count').first()
+    usage = usage or {'bytes_used': 0, 'file_count': 0}
+    quota = wedding_quota()
+    percent = min(100, round(usage['bytes_used'] * 100 / quota)) if quota else None
+    return {**usage, 'quota': quota, 'percent': percent}
+
+
+def media_usage_totals(field):
+    """
+    Recompute usage from the media rows
+
+    Args:
+        field (str): 'wedding_id' or 'uploaded_by_id'
+
+    Returns:
+        dict: {id: (bytes, files)}
+    """
+    rows = Media.objects.exclude(**{f"{field}__isnull": True}).values(field).annotate(
+        size=Sum('file_size'), files=Count('id'),
+    ).order_by()
+    return {row[field]: (row['size'] or 0, row['files']) for row in rows}
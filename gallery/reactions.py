@@ -0,0 +1,97 @@
+"""
+Likes and comments on gallery media
+
+Gallery pages show how many likes and comments each item has. Counting them
+on every render means a join over every like of the wedding, so Media keeps
+like_count and comment_count columns instead. The signals in
+gallery/signals.py add or subtract one with an F() expression whenever a like
+or comment row is created or deleted, so the counts stay right whichever code
+path (views, admin, seeding) changed the rows.
+
+Liking happens in bursts, e.g. while photos are shown on the screen at the
+reception, and the same guest may tap twice before the first request returns.
+set_like() and toggle_like() therefore never check for a like before writing:
+they insert and treat the unique (media, user) constraint firing as "already
+liked", and lock the row before deleting it, so racing requests can neither
+fail nor count a like twice.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Media, MediaComment, MediaLike
+
+
+def _like(media, user):
+    """Insert a like; returns False if the user already liked the media"""
+    try:
+        with transaction.atomic():
+            MediaLike.objects.create(media=media, user=user)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _unlike(media, user):
+    """Delete a like; returns False if there was none"""
+    like = MediaLike.objects.select_for_update().filter(media=media, user=user).first()
+    if like is None:
+        return False
+    # Spares the signal handlers a query for the media
+    like.media = media
+    like.delete()
+    return True
+
+
+def _like_count(media):
+    return Media.objects.filter(pk=media.pk).values_list('like_count', flat=True).first() or 0
+
+
+def set_like(media, user, liked):
+    """
+    Like or unlike media; doing it twice has the same effect as once
+
+    Args:
+        media (Media): Liked media
+        user: User who likes it
+        liked (bool): Whether the user should like it afterwards
+
+    Returns:
+        tuple: (liked, like_count) after the change
+    """
+    with transaction.atomic():
+        if liked:
+            _like(media, user)
+        else:
+            _unlike(media, user)
+        return liked, _like_count(media)
+
+
+def toggle_like(media, user):
+    """
+    Like media the user has not liked yet, and unlike it otherwise
+
+    Returns:
+        tuple: (liked, like_count) after the change
+    """
+    with transaction.atomic():
+        liked = _like(media, user)
+        if not liked:
+            _unlike(media, user)
+        return liked, _like_count(media)
+
+
+def recount_feedback(media_ids):
+    """
+    Recompute like_count and comment_count of media from their rows
+
+    For changes that bypass the signals, e.g. likes moved with update().
+
+    Args:
+        media_ids (list): Media IDs
+    """
+    def count(model):
+        rows = model.objects.filter(media=OuterRef('pk')).order_by().values('media').annotate(n=Count('id'))
+        return Coalesce(Subquery(rows.values('n'), output_field=IntegerField()), Value(0))
+
+    Media.objects.filter(id__in=media_ids).update(like_count=count(MediaLike), comment_count=count(MediaComment))
@@ -0,0 +1,16 @@
+"""Media documents of the search index (see core/search.py)"""
+from django.urls import reverse
+
+from .models import Media
+from core import search
+
+def _media_document(media):
+    return {
+        'wedding_id': media.wedding_id,
+        'title': media.title,
+        'body': [media.description],
+        'url': reverse('media_detail', args=[media.id]),
+        'staff_only': media.is_private,
+    }
+
+search.register('media', 4, Media, 'wedding', ('title', 'description'), _media_document)
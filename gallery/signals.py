@@ -0,0 +1,90 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import MediaCategory, Media, MediaComment, MediaLike
+from .quotas import record_usage
+from core import live, search
+from core.cache import bump_wedding_cache_version
+
+logger = logging.getLogger(__name__)
+
+@receiver([post_save, post_delete], sender=Media)
+@receiver([post_save, post_delete], sender=MediaCategory)
+def invalidate_wedding_cache_for_media(sender, instance, **kwargs):
+    """Drop cached data of a wedding when its media or categories change"""
+    bump_wedding_cache_version(instance.wedding_id)
+
+@receiver([post_save, post_delete], sender=MediaComment)
+@receiver([post_save, post_delete], sender=MediaLike)
+def invalidate_wedding_cache_for_feedback(sender, instance, **kwargs):
+    """Cached gallery pages show like and comment counts, so refresh them too"""
+    try:
+        bump_wedding_cache_version(instance.media.wedding_id)
+    except Media.DoesNotExist:
+        # The media item itself is being deleted and has already bumped the version
+        pass
+
+@receiver(post_save, sender=MediaLike)
+@receiver(post_save, sender=MediaComment)
+def add_feedback_count(sender, instance, created, **kwargs):
+    """Keep Media.like_count and comment_count up to date (gallery/reactions.py)"""
+    if created:
+        field = 'like_count' if sender is MediaLike else 'comment_count'
+        Media.objects.filter(pk=instance.media_id).update(**{field: F(field) + 1})
+
+@receiver(post_delete, sender=MediaLike)
+@receiver(post_delete, sender=MediaComment)
+def remove_feedback_count(sender, instance, **kwargs):
+    field = 'like_count' if sender is MediaLike else 'comment_count'
+    Media.objects.filter(pk=instance.media_id).update(**{field: Greatest(F(field) - 1, Value(0))})
+
+@receiver(post_delete, sender=Media)
+def release_media_files(sender, instance, **kwargs):
+    """Drop the media's references to its stored files once the delete commits"""
+    files = [field for field in (instance.file, instance.thumbnail) if field]
+
+    def release():
+        for field in files:
+            try:
+                field.storage.delete(field.name)
+            except OSError:
+                logger.exception("Error deleting media file %s", field.name)
+
+    transaction.on_commit(release)
+
+@receiver(post_save, sender=Media)
+def add_storage_usage(sender, instance, created, **kwargs):
+    """Count a new media file against its wedding's and uploader's storage"""
+    if created:
+        record_usage(instance.wedding_id, instance.uploaded_by_id, instance.file_size)
+
+@receiver(post_delete, sender=Media)
+def remove_storage_usage(sender, instance, **kwargs):
+    record_usage(instance.wedding_id, instance.uploaded_by_id, -instance.file_size, files=-1)
+
+@receiver(post_save, sender=Media)
+def index_media(sender, instance, **kwargs):
+    search.index_object(instance)
+
+@receiver(post_delete, sender=Media)
+def unindex_media(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+@receiver(post_save, sender=Media)
+def publish_new_media(sender, instance, created, **kwargs):
+    """Tell live dashboards about new uploads"""
+    if created:
+        live.publish_on_commit(instance.wedding_id, 'media', {
+            'id': instance.id,
+            'title': instance.title,
+            'media_type': instance.media_type,
+            'is_private': instance.is_private,
+            'url': reverse('media_detail', args=[instance.id]),
+            'uploaded_by': instance.uploaded_by.get_full_name() or instance.uploaded_by.username,
+        })
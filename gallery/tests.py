@@ -1,3 +1,493 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import random
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core.cache import get_wedding_cache_version
+from core.models import Blob
+from core.testing import WeddingTestCase, create_user, create_wedding
+from gallery import archive, duplicates, metadata, quotas
+from guests.models import Guest
+from gallery.models import Media, MediaCategory, MediaComment, MediaLike, StorageUsage
+from gallery.reactions import set_like, toggle_like
+
+
+def jpeg(color='red', size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class GalleryTestCase(WeddingTestCase):
+    """Uploads through the upload view"""
+
+    def upload(self, title, data, name='photo.jpg'):
+        return self.client.post('/gallery/upload/', {
+            'title': title,
+            'wedding': self.wedding.id,
+            'media_type': 'photo',
+            'file': SimpleUploadedFile(name, data, 'image/jpeg'),
+        })
+
+
+class UploadStorageTests(GalleryTestCase):
+    def test_duplicate_uploads_share_a_blob(self):
+        data = jpeg()
+        self.upload('First', data)
+        self.upload('Second', data, name='copy.jpg')
+
+        first, second = Media.objects.order_by('id')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get(name=first.file.name).refcount, 2)
+
+    def test_deleting_media_releases_its_blob(self):
+        data = jpeg()
+        self.upload('First', data)
+        self.upload('Second', data, name='copy.jpg')
+        first, second = Media.objects.order_by('id')
+        name = first.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(second.file.storage.exists(name))
+
+    def test_file_cleanup_failures_are_logged(self):
+        self.upload('First', jpeg())
+        media = Media.objects.get()
+
+        storage = type(media.file.storage)
+        with mock.patch.object(storage, 'delete', side_effect=OSError('read-only')), \
+                self.assertLogs('gallery.signals', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            media.delete()
+        self.assertIn(media.file.name, logs.output[0])
+
+
+class StorageQuotaTests(GalleryTestCase):
+    def usage(self):
+        wedding = StorageUsage.objects.filter(wedding=self.wedding).values_list('bytes_used', 'file_count').first()
+        user = StorageUsage.objects.filter(user=self.admin).values_list('bytes_used', 'file_count').first()
+        return wedding, user
+
+    def test_uploads_and_deletes_update_usage(self):
+        data = jpeg()
+        self.upload('First', data)
+        self.upload('Second', jpeg('blue'))
+        first, second = Media.objects.order_by('id')
+        self.assertEqual(first.file_size, len(data))
+        self.assertEqual(first.content_type, 'image/jpeg')
+        total = first.file_size + second.file_size
+        self.assertEqual(self.usage(), ((total, 2), (total, 2)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.usage(), ((second.file_size, 1), (second.file_size, 1)))
+
+    def fill_wedding_quota(self):
+        """Leave 10 bytes of a 1 MB wedding quota free; returns the bytes used"""
+        used = quotas.wedding_usage(self.wedding.id)
+        quotas.record_usage(self.wedding.id, None, quotas.MB - 10 - used, files=0)
+        return quotas.MB - 10
+
+    def test_upload_over_quota_is_refused_before_storing(self):
+        self.upload('First', jpeg())
+        used = self.fill_wedding_quota()
+
+        with self.settings(WEDDING_MEDIA_QUOTA_MB=1):
+            response = self.upload('Second', jpeg('blue'))
+
+        self.assertRedirects(response, f'/gallery/upload/?wedding={self.wedding.id}', fetch_redirect_response=False)
+        self.assertEqual(Media.objects.count(), 1)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(quotas.wedding_usage(self.wedding.id), used)
+
+    def test_quota_race_rolls_back_the_row_and_releases_the_file(self):
+        self.upload('First', jpeg())
+        uploaded = quotas.user_usage(self.admin.id)
+        used = self.fill_wedding_quota()
+        stored = set(Blob.objects.values_list('name', flat=True))
+
+        # Another upload took the space between the check and the insert
+        with self.settings(WEDDING_MEDIA_QUOTA_MB=1), mock.patch('gallery.views.quota_error', return_value=None):
+            self.upload('Second', jpeg('blue'))
+
+        self.assertFalse(Media.objects.filter(title='Second').exists())
+        self.assertEqual(self.usage(), ((used, 1), (uploaded, 1)))
+        self.assertEqual(set(Blob.objects.values_list('name', flat=True)), stored)
+        files = {
+            os.path.relpath(os.path.join(path, name), settings.MEDIA_ROOT)
+            for path, _, names in os.walk(settings.MEDIA_ROOT) for name in names
+        }
+        self.assertEqual(files, stored)
+
+    def test_guest_quota_only_applies_to_guests(self):
+        self.upload('First', jpeg())
+        with self.settings(GUEST_MEDIA_QUOTA_MB=1):
+            self.assertIsNone(quotas.quota_error(self.wedding.id, self.admin, quotas.MB + 1))
+            guest = create_user('guest1', role='guest')
+            self.assertIsNone(quotas.quota_error(self.wedding.id, guest, quotas.MB))
+            self.assertIsNotNone(quotas.quota_error(self.wedding.id, guest, quotas.MB + 1))
+
+    def test_usage_summary_follows_the_quota_setting(self):
+        quotas.record_usage(self.wedding.id, None, quotas.MB // 4)
+        with self.settings(WEDDING_MEDIA_QUOTA_MB=1):
+            self.assertEqual(quotas.usage_summary(self.wedding.id)['percent'], 25)
+        with self.settings(WEDDING_MEDIA_QUOTA_MB=0):
+            self.assertIsNone(quotas.usage_summary(self.wedding.id)['percent'])
+
+
+class DuplicateTests(GalleryTestCase):
+    def setUp(self):
+        super().setUp()
+        # The per-process indexes would outlive the test database
+        self.addCleanup(duplicates._indexes.clear)
+        duplicates._indexes.clear()
+
+    def pattern(self, seed, size=(640, 480), quality=90):
+        """JPEG of random blocks; the same seed gives the same picture at any size"""
+        rng = random.Random(seed)
+        image = Image.new('L', (8, 6))
+        image.putdata([rng.randrange(256) for _ in range(48)])
+        buffer = io.BytesIO()
+        image.resize(size, Image.Resampling.BILINEAR).convert('RGB').save(buffer, 'JPEG', quality=quality)
+        return buffer.getvalue()
+
+    def test_copies_hash_alike(self):
+        original = duplicates.image_hashes(io.BytesIO(self.pattern(1)))
+        copy = duplicates.image_hashes(io.BytesIO(self.pattern(1, size=(320, 240), quality=40)))
+        other = duplicates.image_hashes(io.BytesIO(self.pattern(2)))
+
+        for a, b in zip(original, copy):
+            self.assertLessEqual(duplicates.distance(a, b), 6)
+        self.assertGreater(duplicates.distance(original[1], other[1]), 12)
+
+        file = io.BytesIO(b'not an image')
+        self.assertIsNone(duplicates.image_hashes(file))
+        self.assertEqual(file.tell(), 0)
+
+    def test_tree_search_matches_a_full_scan(self):
+        rng = random.Random(7)
+        values = [duplicates._signed(rng.getrandbits(64)) for _ in range(300)]
+        # Near copies of some values
+        values += [duplicates._signed(duplicates._unsigned(value) ^ (1 << rng.randrange(64))) for value in values[:50]]
+        tree = duplicates.BKTree()
+        for item, value in enumerate(values):
+            tree.add(value, item)
+
+        for query in values[:40] + [duplicates._signed(rng.getrandbits(64)) for _ in range(10)]:
+            for radius in (0, 3, 12):
+                expected = {item for item, value in enumerate(values) if duplicates.distance(query, value) <= radius}
+                self.assertEqual({item for _, item, _ in tree.search(query, radius)}, expected)
+
+    def test_uploaded_copies_are_grouped_and_merged(self):
+        self.upload('Original', self.pattern(1))
+        response = self.upload('Copy', self.pattern(1, size=(320, 240), quality=40))
+        self.upload('Other', self.pattern(2))
+        original, copy, other = Media.objects.order_by('id')
+        set_like(copy, self.admin, True)
+
+        self.assertIn('looks like one already in the gallery', [str(m) for m in get_messages(response.wsgi_request)][-1])
+        self.assertEqual(duplicates.find_duplicates(self.wedding.id, original.ahash, original.dhash, exclude=original.id), [copy.id])
+        self.assertEqual(duplicates.duplicate_groups(self.wedding.id), [[original, copy]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(duplicates.merge_duplicates(original, [copy]), 1)
+        self.assertEqual(list(Media.objects.order_by('id')), [original, other])
+        original.refresh_from_db()
+        self.assertEqual(original.like_count, 1)
+        self.assertEqual(duplicates.duplicate_groups(self.wedding.id), [])
+
+    def test_distance_follows_the_setting(self):
+        index = duplicates.BKTree()
+        index.add(0b1111, 'near', 0b1111)
+        with self.settings(GALLERY_DUPLICATE_DISTANCE=4):
+            self.assertEqual(duplicates.find_duplicates(self.wedding.id, 0, 0, index=index), ['near'])
+        with self.settings(GALLERY_DUPLICATE_DISTANCE=3):
+            self.assertEqual(duplicates.find_duplicates(self.wedding.id, 0, 0, index=index), [])
+
+    def test_cached_indexes_follow_the_setting(self):
+        other = create_wedding(self.admin, title='Other Wedding')
+        with self.settings(GALLERY_DUPLICATE_MAX_WEDDINGS=1):
+            duplicates.get_duplicate_index(self.wedding.id)
+            duplicates.get_duplicate_index(other.id)
+        self.assertEqual(list(duplicates._indexes), [other.id])
+
+
+class MediaFileTests(GalleryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload('First', jpeg())
+        self.media = Media.objects.get()
+        self.url = reverse('media_file', args=[self.media.id])
+        with self.media.file.open('rb') as f:
+            self.data = f.read()
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_ranges(self):
+        size = len(self.data)
+        for header, start, end in [
+            ('bytes=0-9', 0, 9), ('bytes=10-', 10, size - 1), ('bytes=-5', size - 5, size - 1),
+            (f'bytes=5-{size + 100}', 5, size - 1),
+        ]:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(b''.join(response.streaming_content), self.data[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_nginx_serves_the_file(self):
+        with self.settings(SENDFILE_BACKEND='nginx', SENDFILE_ROOT=settings.MEDIA_ROOT):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.media.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_private_media_is_hidden_from_guests(self):
+        guest = create_user('guest1', role='guest')
+        Guest.objects.create(wedding=self.wedding, user=guest, name='Guest One')
+        self.client.force_login(guest)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.media.is_private = True
+        self.media.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class MediaAdminActionTests(GalleryTestCase):
+    def test_bulk_visibility_changes_refresh_caches(self):
+        self.upload('First', jpeg())
+        media = Media.objects.get()
+        version = get_wedding_cache_version(self.wedding.id)
+        self.client.force_login(create_user('root', is_staff=True, is_superuser=True))
+
+        for action, private in [('make_private', True), ('make_public', False)]:
+            self.client.post('/admin/gallery/media/', {'action': action, '_selected_action': [media.id]})
+            media.refresh_from_db()
+            self.assertEqual(media.is_private, private)
+            self.assertNotEqual(get_wedding_cache_version(self.wedding.id), version)
+            version = get_wedding_cache_version(self.wedding.id)
+
+        self.client.post('/admin/gallery/media/', {'action': 'mark_featured', '_selected_action': [media.id]})
+        self.assertTrue(Media.objects.get().is_featured)
+
+
+class MetadataTests(GalleryTestCase):
+    def photo(self, tags=(), details=(), size=(64, 48)):
+        exif = Image.Exif()
+        exif.update(tags)
+        if details:
+            exif.get_ifd(metadata.TAG_EXIF_IFD).update(details)
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        path = os.path.join(settings.MEDIA_ROOT, 'photo.jpg')
+        with open(path, 'wb') as f:
+            f.write(buffer.getvalue())
+        return path
+
+    def test_exif_is_read(self):
+        path = self.photo(
+            {metadata.TAG_MAKE: 'Canon', metadata.TAG_MODEL: 'Canon EOS R5', metadata.TAG_ORIENTATION: 6,
+             metadata.TAG_DATETIME: '2030:06:02 09:00:00'},
+            {metadata.TAG_DATETIME_ORIGINAL: '2030:06:01 17:45:12'},
+        )
+        self.assertEqual(metadata.read_metadata(path), {
+            'captured_at': datetime.datetime(2030, 6, 1, 17, 45, 12),
+            'camera': 'Canon EOS R5',
+            # Rotated by 90 degrees when displayed
+            'width': 48, 'height': 64,
+            'orientation': 6,
+        })
+
+    def test_fallbacks(self):
+        path = self.photo(
+            {metadata.TAG_MAKE: 'Apple', metadata.TAG_MODEL: 'iPhone 15\x00', metadata.TAG_ORIENTATION: 9,
+             metadata.TAG_DATETIME: '2030:06:02 09:00:00'},
+            {metadata.TAG_DATETIME_ORIGINAL: '0000:00:00 00:00:00'},
+        )
+        self.assertEqual(metadata.read_metadata(path), {
+            'captured_at': datetime.datetime(2030, 6, 2, 9, 0), 'camera': 'Apple iPhone 15',
+            'width': 64, 'height': 48, 'orientation': None,
+        })
+
+        self.assertEqual(metadata.read_metadata(self.photo()), {
+            'captured_at': None, 'camera': '', 'width': 64, 'height': 48, 'orientation': None,
+        })
+
+        path = os.path.join(settings.MEDIA_ROOT, 'notes.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'not an image')
+        self.assertIsNone(metadata.read_metadata(path))
+
+    def test_uploaded_photo_gets_its_metadata(self):
+        with open(self.photo({metadata.TAG_MODEL: 'Pixel 8'}, {metadata.TAG_DATETIME_ORIGINAL: '2030:06:01 17:45:12'}), 'rb') as f:
+            data = f.read()
+        with mock.patch('gallery.views.run_in_background'):
+            self.upload('First', data)
+        media = Media.objects.get()
+        self.assertFalse(media.metadata_extracted)
+
+        metadata.extract_media_metadata(media.id)
+        media.refresh_from_db()
+        self.assertTrue(media.metadata_extracted)
+        self.assertEqual(media.camera, 'Pixel 8')
+        self.assertEqual(timezone.localtime(media.captured_at).replace(tzinfo=None), datetime.datetime(2030, 6, 1, 17, 45, 12))
+
+
+class ArchiveTests(GalleryTestCase):
+    def read_zip(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            return {info.filename: (info.compress_type, archive.read(info)) for info in archive.infolist()}
+
+    def test_streamed_download_is_a_valid_archive(self):
+        category = MediaCategory.objects.create(wedding=self.wedding, name='Ceremony')
+        self.upload('Kiss', jpeg('red'))
+        self.upload('Kiss', jpeg('blue'))
+        self.upload('Rings', jpeg('green'))
+        first, second, third = Media.objects.order_by('id')
+        Media.objects.filter(id=third.id).update(category=category, is_private=True)
+
+        response = self.client.get(reverse('gallery_export', args=[self.wedding.id]))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        entries = self.read_zip(b''.join(response.streaming_content))
+
+        self.assertEqual(set(entries), {
+            'Uncategorized/Kiss.jpg', f'Uncategorized/Kiss-{second.id}.jpg', 'Ceremony/Rings.jpg',
+        })
+        with first.file.open('rb') as f:
+            self.assertEqual(entries['Uncategorized/Kiss.jpg'], (zipfile.ZIP_STORED, f.read()))
+
+        # Guests do not get private media
+        guest = create_user('guest1', role='guest')
+        Guest.objects.create(wedding=self.wedding, user=guest, name='Guest One')
+        self.client.force_login(guest)
+        response = self.client.get(reverse('gallery_export', args=[self.wedding.id]))
+        self.assertNotIn('Ceremony/Rings.jpg', self.read_zip(b''.join(response.streaming_content)))
+
+    def test_cached_archive_is_built_once_and_replaced_after_changes(self):
+        self.upload('Kiss', jpeg())
+        url = reverse('gallery_export', args=[self.wedding.id]) + '?cached=1'
+
+        # The build lock would outlive the test
+        self.addCleanup(cache.clear)
+        with mock.patch('gallery.archive.run_in_background') as run:
+            response = self.client.get(url)
+        self.assertRedirects(response, reverse('wedding_gallery', args=[self.wedding.id]), fetch_redirect_response=False)
+        run.assert_called_once()
+
+        old_path = archive.build_gallery_archive(self.wedding, include_private=True)
+        response = self.client.get(url)
+        self.assertEqual(set(self.read_zip(b''.join(response.streaming_content))), {'Uncategorized/Kiss.jpg'})
+
+        self.upload('Rings', jpeg('green'))
+        path = archive.build_gallery_archive(self.wedding, include_private=True)
+        self.assertNotEqual(path, old_path)
+        self.assertFalse(os.path.exists(old_path))
+        with open(path, 'rb') as f:
+            self.assertEqual(set(self.read_zip(f.read())), {'Uncategorized/Kiss.jpg', 'Uncategorized/Rings.jpg'})
+
+    def test_cached_archive_changes_when_entries_are_renamed(self):
+        category = MediaCategory.objects.create(wedding=self.wedding, name='Ceremony')
+        self.upload('First', jpeg())
+        media = Media.objects.get()
+        media.category = category
+        media.save()
+
+        paths = [archive.cached_archive_path(self.wedding)]
+        media.title = 'Renamed'
+        media.save()
+        paths.append(archive.cached_archive_path(self.wedding))
+        category.name = 'Reception'
+        category.save()
+        paths.append(archive.cached_archive_path(self.wedding))
+
+        self.assertEqual(len(set(paths)), 3)
+        self.assertEqual(archive.cached_archive_path(self.wedding), paths[-1])
+
+
+class LikeTests(GalleryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload('First', jpeg())
+        self.media = Media.objects.get()
+        self.guest = create_user('guest1', role='guest')
+
+    def like_count(self):
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.like_count, MediaLike.objects.filter(media=self.media).count())
+        return self.media.like_count
+
+    def test_set_like_is_idempotent(self):
+        self.assertEqual(set_like(self.media, self.admin, True), (True, 1))
+        self.assertEqual(set_like(self.media, self.admin, True), (True, 1))
+        self.assertEqual(set_like(self.media, self.guest, True), (True, 2))
+        self.assertEqual(self.like_count(), 2)
+
+        self.assertEqual(set_like(self.media, self.admin, False), (False, 1))
+        self.assertEqual(set_like(self.media, self.admin, False), (False, 1))
+        self.assertEqual(self.like_count(), 1)
+
+    def test_toggle_like(self):
+        self.assertEqual(toggle_like(self.media, self.admin), (True, 1))
+        self.assertEqual(toggle_like(self.media, self.guest), (True, 2))
+        self.assertEqual(toggle_like(self.media, self.admin), (False, 1))
+        self.assertEqual(self.like_count(), 1)
+
+    def test_comments_are_counted(self):
+        comment = MediaComment.objects.create(media=self.media, user=self.guest, comment='Lovely')
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.comment_count, 1)
+        comment.delete()
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.comment_count, 0)
+
+    def test_like_endpoint(self):
+        url = reverse('media_like', args=[self.media.id])
+
+        response = self.client.post(url, '{"liked": true}', content_type='application/json')
+        self.assertEqual(response.json(), {'status': 'success', 'liked': True, 'like_count': 1})
+        response = self.client.post(url, '{"liked": true}', content_type='application/json')
+        self.assertEqual(response.json()['like_count'], 1)
+        response = self.client.post(url, '', content_type='application/json')
+        self.assertEqual(response.json(), {'status': 'success', 'liked': False, 'like_count': 0})
+        self.assertEqual(self.like_count(), 0)
+
+    def test_like_endpoint_rejects_bad_requests(self):
+        url = reverse('media_like', args=[self.media.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, '{"liked": "yes"}', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(reverse('media_like', args=[self.media.id + 1]), '{}',
+                                          content_type='application/json').status_code, 404)
+        self.assertEqual(self.like_count(), 0)
@@ -6,5 +6,10 @@ urlpatterns = [
     path('upload/', views.gallery_upload, name='gallery_upload'),
     path('<int:media_id>/', views.media_detail, name='media_detail'),
     path('<int:media_id>/delete/', views.media_delete, name='media_delete'),
+    path('<int:media_id>/like/', views.media_like, name='media_like'),
+    path('<int:media_id>/file/', views.media_file, name='media_file'),
     path('wedding/<int:wedding_id>/', views.wedding_gallery, name='wedding_gallery'),
+    path('wedding/<int:wedding_id>/download/', views.gallery_export, name='gallery_export'),
+    path('wedding/<int:wedding_id>/timeline/', views.gallery_timeline, name='gallery_timeline'),
+    path('wedding/<int:wedding_id>/duplicates/', views.gallery_duplicates, name='gallery_duplicates'),
 ]
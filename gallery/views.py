@@ -1,11 +1,36 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+import mimetypes
+import os
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from django.utils import timezone
-
-from .models import MediaCategory, Media, MediaComment, MediaLike
-from weddings.models import Wedding
+from django.db import transaction
+from django.db.models import Q
+
+from .models import MediaCategory, Media, MediaComment
+from .metadata import extract_media_metadata
+from .reactions import set_like, toggle_like
+from .quotas import QuotaExceeded, quota_error, save_within_quota, usage_summary
+from .duplicates import image_hashes, find_duplicates, duplicate_groups, mark_reviewed, merge_duplicates
+from .archive import (
+    gallery_media, archive_name, stream_gallery_zip, cached_archive_path, schedule_gallery_archive,
+)
+from weddings.models import Wedding, WeddingEvent
+from core.cache import cached_for_wedding, get_wedding_cache_version
+from core.sendfile import sendfile_response
+from core.background import run_in_background
+from core.aio import get_user_with_profile, run_blocking
+
+# Photos shown per event on the timeline before "show all"
+TIMELINE_PREVIEW_ITEMS = 12
 
 @login_required
 def gallery_list(request):
@@ -63,6 +88,24 @@ def gallery_list(request):
 
     return render(request, 'gallery/gallery_list.html', context)
 
+def user_can_view_media(user, media):
+    """
+    Check whether a user may see a media item
+
+    Admins see media of weddings they administer, team members see media of
+    weddings they work on and guests see the public media of weddings they are
+    invited to.
+    """
+    role = user.profile.role
+
+    if role == 'admin':
+        return media.wedding.admin_id == user.id
+    if role == 'team_member':
+        return media.wedding.team_members.filter(member=user).exists()
+    if role == 'guest':
+        return not media.is_private and user.guest_profiles.filter(wedding_id=media.wedding_id).exists()
+    return False
+
 @login_required
 def media_detail(request, media_id):
     """View media details"""
@@ -70,21 +113,11 @@ def media_detail(request, media_id):
 
     # Check if user has access to this media
     user = request.user
-    has_access = False
-
-    if user.profile.role == 'admin' and media.wedding.admin == user:
-        has_access = True
-    elif user.profile.role == 'team_member' and media.wedding.team_members.filter(member=user).exists():
-        has_access = True
-    elif user.profile.role == 'guest' and user.guest_profiles.filter(wedding=media.wedding).exists():
-        if not media.is_private:
-            has_access = True
-
-    if not has_access:
+    if not user_can_view_media(user, media):
         return HttpResponseForbidden("You don't have permission to view this media.")
 
     # Get comments
-    comments = media.comments.all().order_by('created_at')
+    comments = media.comments.select_related('user').order_by('created_at')
 
     # Check if user has liked this media
     user_liked = media.likes.filter(user=user).exists()
@@ -97,27 +130,20 @@ def media_detail(request, media_id):
             comment_text = request.POST.get('comment')
 
             if comment_text:
-                MediaComment.objects.create(
-                    media=media,
-                    user=user,
-                    comment=comment_text
-                )
+                # The comment and its count (gallery/signals.py) go in together
+                with transaction.atomic():
+                    MediaComment.objects.create(
+                        media=media,
+                        user=user,
+                        comment=comment_text
+                    )
 
                 messages.success(request, "Comment added successfully.")
 
         elif action == 'like':
-            # Toggle like status
-            if user_liked:
-                media.likes.filter(user=user).delete()
-                messages.success(request, "You unliked this media.")
-                user_liked = False
-            else:
-                MediaLike.objects.create(
-                    media=media,
-                    user=user
-                )
-                messages.success(request, "You liked this media.")
-                user_liked = True
+            # Without JavaScript the like button posts here (see media_like)
+            user_liked, _ = toggle_like(media, user)
+            messages.success(request, "You liked this media." if user_liked else "You unliked this media.")
 
         return redirect('media_detail', media_id=media.id)
 
@@ -130,26 +156,140 @@ def media_detail(request, media_id):
     return render(request, 'gallery/media_detail.html', context)
 
 @login_required
-def gallery_upload(request):
+def media_like(request, media_id):
+    """Like or unlike media (JSON); the body may set {"liked": true/false}, otherwise it toggles"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method is allowed'}, status=405)
+
+    media = get_object_or_404(Media.objects.select_related('wedding'), id=media_id)
+    if not user_can_view_media(request.user, media):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    if not isinstance(payload, dict) or not isinstance(payload.get('liked', False), bool):
+        return JsonResponse({'status': 'error', 'message': 'Expected {"liked": true or false}'}, status=400)
+
+    # Setting the state is safe to repeat, e.g. after a double tap or a retry
+    if 'liked' in payload:
+        liked, like_count = set_like(media, request.user, payload['liked'])
+    else:
+        liked, like_count = toggle_like(media, request.user)
+
+    return JsonResponse({'status': 'success', 'liked': liked, 'like_count': like_count})
+
+@login_required
+def media_file(request, media_id):
+    """Serve the file of a media item after checking the user may see it"""
+    media = get_object_or_404(Media.objects.select_related('wedding'), id=media_id)
+
+    if not user_can_view_media(request.user, media):
+        return HttpResponseForbidden("You don't have permission to view this media.")
+
+    if not media.file:
+        raise Http404("This media item has no file.")
+
+    response = sendfile_response(request, media.file.path)
+    # Only the user's own browser may keep a copy of private wedding media
+    patch_cache_control(response, private=True, max_age=3600)
+    return response
+
+@login_required
+def gallery_export(request, wedding_id):
+    """Download all media of a wedding, optionally of one category, as a ZIP archive"""
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+
+    # Check if user has access to this wedding
+    user = request.user
+    has_access = False
+
+    if user.profile.role == 'admin' and wedding.admin == user:
+        has_access = True
+    elif user.profile.role == 'team_member' and wedding.team_members.filter(member=user).exists():
+        has_access = True
+    elif user.profile.role == 'guest' and user.guest_profiles.filter(wedding=wedding).exists():
+        has_access = True
+
+    if not has_access:
+        return HttpResponseForbidden("You don't have permission to download this gallery.")
+
+    category = None
+    category_id = request.GET.get('category')
+    if category_id:
+        category = get_object_or_404(MediaCategory, id=category_id, wedding=wedding)
+
+    include_private = user.profile.role in ['admin', 'team_member']
+    media_items = gallery_media(wedding, category, include_private)
+    filename = archive_name(wedding, category, include_private)
+
+    # Large galleries are zipped once in the background and then served from disk
+    use_cached = request.GET.get('cached') == '1' or media_items.count() > settings.GALLERY_EXPORT_STREAM_MAX_ITEMS
+    if use_cached:
+        path = cached_archive_path(wedding, category, include_private)
+        if os.path.exists(path):
+            return sendfile_response(request, path, content_type='application/zip', filename=filename, attachment=True)
+
+        schedule_gallery_archive(wedding, category, include_private)
+        messages.info(request, "The archive of this gallery is being prepared. Please try the download again in a few minutes.")
+        return redirect('wedding_gallery', wedding_id=wedding.id)
+
+    response = StreamingHttpResponse(stream_gallery_zip(media_items.iterator()), content_type='application/zip')
+    response['Content-Disposition'] = f"attachment; filename*=utf-8''{quote(filename)}"
+    return response
+
+async def _can_upload(user, wedding):
+    """Whether a user may upload media to a wedding"""
+    role = user.profile.role
+    if role == 'admin':
+        return wedding.admin_id == user.id
+    if role == 'team_member':
+        return await wedding.team_members.filter(member=user).aexists()
+    return await user.guest_profiles.filter(wedding=wedding).aexists()
+
+def _gallery_upload_page(request, wedding):
+    """Render the upload form (synchronous: the template reads querysets)"""
+    # Get available weddings based on user role
+    if request.user.profile.role == 'admin':
+        available_weddings = Wedding.objects.filter(admin=request.user)
+    elif request.user.profile.role == 'team_member':
+        wedding_teams = request.user.wedding_teams.select_related('wedding')
+        available_weddings = [team.wedding for team in wedding_teams]
+    else:
+        guest_profiles = request.user.guest_profiles.select_related('wedding')
+        available_weddings = [guest.wedding for guest in guest_profiles]
+
+    # Get categories for the selected wedding
+    categories = []
+    if wedding:
+        categories = MediaCategory.objects.filter(wedding=wedding)
+
+    context = {
+        'available_weddings': available_weddings,
+        'selected_wedding': wedding,
+        'categories': categories,
+    }
+
+    return render(request, 'gallery/gallery_upload.html', context)
+
+@login_required
+async def gallery_upload(request):
     """Upload media to gallery"""
+    user = await get_user_with_profile(request)
+
     # Only admins, team members, and guests can upload media
-    if request.user.profile.role not in ['admin', 'team_member', 'guest']:
+    if user.profile.role not in ['admin', 'team_member', 'guest']:
         messages.error(request, "You don't have permission to upload media.")
         return redirect('dashboard')
 
     # Get wedding if provided in query params
     wedding_id = request.GET.get('wedding')
     if wedding_id:
-        wedding = get_object_or_404(Wedding, id=wedding_id)
+        wedding = await aget_object_or_404(Wedding, id=wedding_id)
 
         # Check if user has access to this wedding
-        if request.user.profile.role == 'admin' and wedding.admin != request.user:
-            return HttpResponseForbidden("You don't have permission to upload media to this wedding.")
-
-        if request.user.profile.role == 'team_member' and not wedding.team_members.filter(member=request.user).exists():
-            return HttpResponseForbidden("You don't have permission to upload media to this wedding.")
-
-        if request.user.profile.role == 'guest' and not request.user.guest_profiles.filter(wedding=wedding).exists():
+        if not await _can_upload(user, wedding):
             return HttpResponseForbidden("You don't have permission to upload media to this wedding.")
     else:
         wedding = None
@@ -168,51 +308,54 @@ def gallery_upload(request):
             messages.error(request, "Title, wedding, media type, and file are required fields.")
             return redirect('gallery_upload')
 
-        wedding = get_object_or_404(Wedding, id=wedding_id)
+        wedding = await aget_object_or_404(Wedding, id=wedding_id)
+        if not await _can_upload(user, wedding):
+            return HttpResponseForbidden("You don't have permission to upload media to this wedding.")
         file = request.FILES['file']
 
-        # Create media
-        media = Media.objects.create(
+        # Refuse uploads that cannot fit before writing them anywhere
+        error = await sync_to_async(quota_error)(wedding.id, user, file.size)
+        if error:
+            messages.error(request, error)
+            return redirect(f"{reverse('gallery_upload')}?wedding={wedding.id}")
+
+        media = Media(
             wedding=wedding,
             title=title,
             description=description,
             media_type=media_type,
-            file=file,
-            uploaded_by=request.user,
+            category_id=category_id or None,
+            uploaded_by=user,
             is_private=is_private,
-            is_featured=is_featured
+            is_featured=is_featured,
+            file_size=file.size,
+            content_type=(file.content_type or mimetypes.guess_type(file.name)[0] or '')[:100],
         )
 
-        # Set category if provided
-        if category_id:
-            media.category_id = category_id
-            media.save()
+        # Hash photos for duplicate detection in a worker thread. Storing the
+        # file records its Blob row, so it runs where the ORM does, like the
+        # row insert
+        hashes = await run_blocking(image_hashes, file) if media.is_photo else None
+        if hashes is not None:
+            media.ahash, media.dhash = hashes
+        await sync_to_async(media.file.save)(file.name, file, save=False)
+        try:
+            await sync_to_async(save_within_quota)(media)
+        except QuotaExceeded as e:
+            # Another upload took the space meanwhile; drop this file's reference
+            await sync_to_async(media.file.storage.delete)(media.file.name)
+            messages.error(request, str(e))
+            return redirect(f"{reverse('gallery_upload')}?wedding={wedding.id}")
+        if media.is_photo:
+            # Capture time, camera and dimensions are read after the response
+            await sync_to_async(run_in_background)(extract_media_metadata, media.id)
 
         messages.success(request, f"Media '{title}' uploaded successfully.")
+        if hashes is not None and await sync_to_async(find_duplicates)(wedding.id, *hashes, exclude=media.id):
+            messages.info(request, "This photo looks like one already in the gallery. The wedding team can review duplicates.")
         return redirect('media_detail', media_id=media.id)
 
-    # Get available weddings based on user role
-    if request.user.profile.role == 'admin':
-        available_weddings = Wedding.objects.filter(admin=request.user)
-    elif request.user.profile.role == 'team_member':
-        wedding_teams = request.user.wedding_teams.all()
-        available_weddings = [team.wedding for team in wedding_teams]
-    else:
-        guest_profiles = request.user.guest_profiles.all()
-        available_weddings = [guest.wedding for guest in guest_profiles]
-
-    # Get categories for the selected wedding
-    categories = []
-    if wedding:
-        categories = MediaCategory.objects.filter(wedding=wedding)
-
-    context = {
-        'available_weddings': available_weddings,
-        'selected_wedding': wedding,
-        'categories': categories,
-    }
-
-    return render(request, 'gallery/gallery_upload.html', context)
+    return await sync_to_async(_gallery_upload_page)(request, wedding)
 
 @login_required
 def media_delete(request, media_id):
@@ -243,6 +386,20 @@ def media_delete(request, media_id):
 
     return render(request, 'gallery/media_confirm_delete.html', context)
 
+def _wedding_gallery_data(wedding, include_private):
+    """Query the media items and categories shown on a wedding's gallery page"""
+    media = Media.objects.filter(wedding=wedding).order_by('-upload_date')
+
+    # Public media first, followed by private media
+    media_items = list(media.filter(is_private=False))
+    if include_private:
+        media_items += list(media.filter(is_private=True))
+
+    return {
+        'media_items': media_items,
+        'categories': list(MediaCategory.objects.filter(wedding=wedding)),
+    }
+
 @login_required
 def wedding_gallery(request, wedding_id):
     """View gallery for a specific wedding"""
@@ -262,21 +419,150 @@ def wedding_gallery(request, wedding_id):
     if not has_access:
         return HttpResponseForbidden("You don't have permission to view gallery for this wedding.")
 
-    # Get media for this wedding
-    media_items = Media.objects.filter(wedding=wedding, is_private=False).order_by('-upload_date')
-
-    # If admin or team member, also show private media
-    if user.profile.role in ['admin', 'team_member']:
-        private_media = Media.objects.filter(wedding=wedding, is_private=True).order_by('-upload_date')
-        media_items = list(media_items) + list(private_media)
+    # Admins and team members also see private media
+    include_private = user.profile.role in ['admin', 'team_member']
 
-    # Get categories for this wedding
-    categories = MediaCategory.objects.filter(wedding=wedding)
+    # The media list and categories only change through saves that bump the
+    # wedding's cache version, so they are served from the cache
+    data = cached_for_wedding(
+        wedding.id, 'gallery',
+        lambda: _wedding_gallery_data(wedding, include_private),
+        include_private,
+    )
 
     context = {
-        'media_items': media_items,
-        'categories': categories,
-        'wedding': wedding
+        'wedding': wedding,
+        'cache_version': get_wedding_cache_version(wedding.id),
+        'include_private': include_private,
+        'storage': usage_summary(wedding.id) if include_private else None,
+        **data,
     }
 
     return render(request, 'gallery/wedding_gallery.html', context)
+
+def _can_manage_gallery(user, wedding):
+    """Admins of a wedding and its team members manage its gallery"""
+    if user.profile.role == 'admin':
+        return wedding.admin_id == user.id
+    if user.profile.role == 'team_member':
+        return wedding.team_members.filter(member=user).exists()
+    return False
+
+@login_required
+def gallery_duplicates(request, wedding_id):
+    """Review groups of near-duplicate photos and merge them"""
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+
+    if not _can_manage_gallery(request.user, wedding):
+        return HttpResponseForbidden("You don't have permission to manage this gallery.")
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        group = Media.objects.filter(wedding=wedding, id__in=request.POST.getlist('media'))
+
+        if action == 'merge':
+            keep = group.filter(id=request.POST.get('keep')).first()
+            if keep is None:
+                messages.error(request, "Choose the photo to keep.")
+            else:
+                removed = merge_duplicates(keep, list(group.exclude(id=keep.id)))
+                messages.success(request, f"Merged {removed} duplicate{'s' if removed != 1 else ''} into '{keep.title}'.")
+        elif action == 'dismiss':
+            mark_reviewed(wedding.id, list(group.values_list('id', flat=True)))
+            messages.success(request, "These photos will not be suggested as duplicates again.")
+
+        return redirect('gallery_duplicates', wedding_id=wedding.id)
+
+    context = {
+        'wedding': wedding,
+        'groups': duplicate_groups(wedding.id),
+        'unhashed': Media.objects.filter(wedding=wedding, media_type='photo', dhash__isnull=True).count(),
+    }
+
+    return render(request, 'gallery/gallery_duplicates.html', context)
+
+def _event_window(event):
+    """[start, end) of an event; events ending before they start run past midnight"""
+    start, end = event.start_datetime, event.end_datetime
+    if settings.USE_TZ:
+        start, end = timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+def _gallery_timeline_data(wedding, include_private, event_id=None):
+    """Query the photos taken during each event of a wedding, by capture time"""
+    media = Media.objects.filter(wedding=wedding)
+    if not include_private:
+        media = media.filter(is_private=False)
+
+    sections = []
+    during_events = Q()
+    for event in WeddingEvent.objects.filter(wedding=wedding).order_by('date', 'start_time'):
+        start, end = _event_window(event)
+        window = Q(captured_at__gte=start, captured_at__lt=end)
+        during_events |= window
+        if event_id is not None and event.id != event_id:
+            continue
+        items = media.filter(window).order_by('captured_at', 'id')
+        sections.append({
+            'event': event,
+            'count': items.count(),
+            'items': list(items if event_id is not None else items[:TIMELINE_PREVIEW_ITEMS]),
+        })
+
+    if event_id is not None:
+        return {'sections': sections}
+
+    # Photos taken outside every event window
+    between = media.filter(captured_at__isnull=False)
+    if during_events:
+        between = between.exclude(during_events)
+    between_count = between.count()
+    if between_count:
+        sections.append({
+            'event': None,
+            'count': between_count,
+            'items': list(between.order_by('captured_at', 'id')[:TIMELINE_PREVIEW_ITEMS]),
+        })
+
+    return {
+        'sections': sections,
+        'undated_count': media.filter(captured_at__isnull=True).count(),
+    }
+
+@login_required
+def gallery_timeline(request, wedding_id):
+    """Photos of a wedding grouped by the event they were taken at"""
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+
+    # Check if user has access to this wedding
+    user = request.user
+    has_access = False
+
+    if user.profile.role == 'admin' and wedding.admin == user:
+        has_access = True
+    elif user.profile.role == 'team_member' and wedding.team_members.filter(member=user).exists():
+        has_access = True
+    elif user.profile.role == 'guest' and user.guest_profiles.filter(wedding=wedding).exists():
+        has_access = True
+
+    if not has_access:
+        return HttpResponseForbidden("You don't have permission to view gallery for this wedding.")
+
+    include_private = user.profile.role in ['admin', 'team_member']
+    event_id = request.GET.get('event')
+    event_id = int(event_id) if event_id and event_id.isdigit() else None
+
+    data = cached_for_wedding(
+        wedding.id, 'timeline',
+        lambda: _gallery_timeline_data(wedding, include_private, event_id),
+        include_private, event_id,
+    )
+
+    context = {
+        'wedding': wedding,
+        'event_id': event_id,
+        'preview_items': TIMELINE_PREVIEW_ITEMS,
+        **data,
+    }
+
+    return render(request, 'gallery/gallery_timeline.html', context)
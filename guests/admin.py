@@ -1,5 +1,13 @@
-from django.contrib import admin
-from .models import Guest, GuestCredential, Invitation
+from django.contrib import admin, messages
+from django.db.models import Max
+from django.db.models.functions import Now
+
+from .models import Guest, GuestCredential, Invitation, SeatingTable, SeatingConstraint
+from .signals import publish_guest_status
+from core.admin_utils import LargeTableAdmin
+from core.background import run_in_background
+from core.cache import bump_wedding_cache_versions
+from core.utils import send_guest_invitation_email
 
 class GuestCredentialInline(admin.StackedInline):
     model = GuestCredential
@@ -10,25 +18,78 @@ class InvitationInline(admin.TabularInline):
     model = Invitation
     extra = 0
     readonly_fields = ('sent_date', 'viewed', 'viewed_date')
+    autocomplete_fields = ('wedding',)
+
+def _resend_invitations(invitation_ids):
+    """Email invitations again (runs in a background thread)"""
+    invitations = Invitation.objects.filter(id__in=invitation_ids).select_related(
+        'wedding', 'guest__credential'
+    )
+    for invitation in invitations:
+        send_guest_invitation_email(invitation, invitation.guest.credential)
 
 @admin.register(Guest)
-class GuestAdmin(admin.ModelAdmin):
+class GuestAdmin(LargeTableAdmin):
     list_display = ('name', 'wedding', 'email', 'status', 'invitation_sent', 'is_checked_in')
     list_filter = ('status', 'invitation_sent', 'wedding')
+    list_select_related = ('wedding',)
     search_fields = ('name', 'email', 'phone')
+    autocomplete_fields = ('wedding', 'user', 'table')
     readonly_fields = ('check_in_date',)
     inlines = [GuestCredentialInline, InvitationInline]
+    actions = ['mark_checked_in', 'resend_invitations']
 
     def is_checked_in(self, obj):
         return obj.is_checked_in
     is_checked_in.boolean = True
     is_checked_in.short_description = 'Checked In'
 
+    @admin.action(description='Mark selected guests as checked in')
+    def mark_checked_in(self, request, queryset):
+        wedding_ids = list(queryset.values_list('wedding_id', flat=True).distinct())
+        arriving = list(queryset.exclude(status='attended').only('id', 'wedding_id', 'name', 'status', 'plus_ones'))
+        updated = queryset.exclude(status='attended').update(status='attended', check_in_date=Now(), updated_at=Now())
+        # update() skips the post_save signals that normally invalidate cached
+        # pages and notify live dashboards
+        bump_wedding_cache_versions(wedding_ids)
+        for guest in arriving:
+            previous, guest.status = guest.status, 'attended'
+            publish_guest_status(guest, previous)
+        self.message_user(request, f"{updated} guests marked as checked in.", messages.SUCCESS)
+
+    @admin.action(description='Resend invitations to selected guests')
+    def resend_invitations(self, request, queryset):
+        # Latest invitation of every selected guest that can receive one
+        sendable = queryset.exclude(email__isnull=True).exclude(email='').filter(credential__isnull=False)
+        invitation_ids = list(
+            sendable.filter(invitations__isnull=False)
+            .values('id')
+            .annotate(invitation_id=Max('invitations__id'))
+            .values_list('invitation_id', flat=True)
+        )
+        if not invitation_ids:
+            self.message_user(request, "None of the selected guests has an invitation and email address.", messages.WARNING)
+            return
+
+        guests = Guest.objects.filter(invitations__id__in=invitation_ids)
+        wedding_ids = list(guests.values_list('wedding_id', flat=True).distinct())
+        guests.update(invitation_sent=True, invitation_sent_date=Now(), updated_at=Now())
+        bump_wedding_cache_versions(wedding_ids)
+
+        run_in_background(_resend_invitations, invitation_ids)
+        skipped = queryset.count() - len(invitation_ids)
+        message = f"Resending {len(invitation_ids)} invitations in the background."
+        if skipped:
+            message += f" {skipped} guests were skipped (no invitation or email address)."
+        self.message_user(request, message, messages.SUCCESS)
+
 @admin.register(GuestCredential)
-class GuestCredentialAdmin(admin.ModelAdmin):
+class GuestCredentialAdmin(LargeTableAdmin):
     list_display = ('guest', 'username', 'token', 'expiry_date', 'is_valid')
     list_filter = ('created_at', 'expiry_date')
+    list_select_related = ('guest__wedding',)
     search_fields = ('guest__name', 'username')
+    autocomplete_fields = ('guest',)
     readonly_fields = ('token', 'qr_code')
 
     def is_valid(self, obj):
@@ -37,8 +98,31 @@ class GuestCredentialAdmin(admin.ModelAdmin):
     is_valid.short_description = 'Valid'
 
 @admin.register(Invitation)
-class InvitationAdmin(admin.ModelAdmin):
+class InvitationAdmin(LargeTableAdmin):
     list_display = ('guest', 'wedding', 'sent_date', 'viewed', 'viewed_date')
     list_filter = ('viewed', 'sent_date')
+    list_select_related = ('guest__wedding', 'wedding')
     search_fields = ('guest__name', 'wedding__title')
+    autocomplete_fields = ('guest', 'wedding')
     readonly_fields = ('sent_date', 'viewed_date')
+    actions = ['mark_viewed']
+
+    @admin.action(description='Mark selected invitations as viewed')
+    def mark_viewed(self, request, queryset):
+        updated = queryset.filter(viewed=False).update(viewed=True, viewed_date=Now())
+        self.message_user(request, f"{updated} invitations marked as viewed.", messages.SUCCESS)
+
+@admin.register(SeatingTable)
+class SeatingTableAdmin(LargeTableAdmin):
+    list_display = ('name', 'wedding', 'capacity')
+    list_select_related = ('wedding',)
+    search_fields = ('name', 'wedding__title')
+    autocomplete_fields = ('wedding',)
+
+@admin.register(SeatingConstraint)
+class SeatingConstraintAdmin(LargeTableAdmin):
+    list_display = ('guest', 'kind', 'other_guest', 'wedding')
+    list_filter = ('kind',)
+    list_select_related = ('guest__wedding', 'other_guest__wedding', 'wedding')
+    search_fields = ('guest__name', 'other_guest__name')
+    autocomplete_fields = ('wedding', 'guest', 'other_guest')
@@ -0,0 +1,12 @@
+"""Guest resources of the JSON API (see core/api.py)"""
+from .models import Guest, Invitation
+from core import api
+
+api.register(
+    'guests', Guest, 'wedding',
+    ('wedding', 'user', 'name', 'email', 'phone', 'address', 'status', 'invitation_sent', 'invitation_sent_date',
+     'rsvp_date', 'check_in_date', 'plus_ones', 'notes', 'group', 'table', 'created_at', 'updated_at'),
+    includes=(
+        api.Include('invitations', Invitation, 'guest', ('sent_date', 'viewed', 'viewed_date')),
+    ),
+)
@@ -0,0 +1,178 @@
+"""
+Typeahead guest lookup for check-in desks
+
+Each process keeps a small in-memory index of the guests of recently looked
+up weddings: a sorted list of name words for prefix matches and a trigram map
+over full names and phone digits for matches in the middle of a word or
+number. An index is built on the first lookup for a wedding and rebuilt when
+the wedding's cache version changes, which every Guest save or delete bumps
+(see guests/signals.py).
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .models import Guest
+from core.cache import get_wedding_cache_version
+
+# Number of weddings whose index is kept in memory per process
+MAX_WEDDINGS = getattr(settings, 'GUEST_LOOKUP_MAX_WEDDINGS', 32)
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _normalize(text):
+    """Lower-case text with accents removed, e.g. 'José' -> 'jose'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class GuestIndex:
+    """Prefix and trigram index over the names and phone numbers of one wedding's guests"""
+
+    def __init__(self, guests):
+        self.guests = []
+        self.names = []
+        self.phones = []
+        self.words = []
+        self.trigrams = defaultdict(set)
+
+        for position, guest in enumerate(guests):
+            name = _normalize(guest['name'])
+            phone = re.sub(r'\D', '', guest['phone'] or '')
+            self.guests.append(guest)
+            self.names.append(name)
+            self.phones.append(phone)
+
+            for word in re.findall(r'\w+', name):
+                self.words.append((word, position))
+            for trigram in _trigrams(name) | _trigrams(phone):
+                self.trigrams[trigram].add(position)
+
+        self.words.sort()
+
+    def _prefix_matches(self, term):
+        """Positions of guests with a name word starting with term"""
+        start = bisect.bisect_left(self.words, (term,))
+        matches = set()
+        for word, position in self.words[start:]:
+            if not word.startswith(term):
+                break
+            matches.add(position)
+        return matches
+
+    def _substring_matches(self, term, values):
+        """Positions whose value contains term, narrowed down by trigrams first"""
+        candidates = None
+        for trigram in _trigrams(term):
+            positions = self.trigrams.get(trigram, set())
+            candidates = positions if candidates is None else candidates & positions
+            if not candidates:
+                return set()
+        return {position for position in candidates if term in values[position]}
+
+    def search(self, query, limit=10):
+        """
+        Find guests by partial name or phone number
+
+        Args:
+            query (str): Name words (each matching the start of a word, or
+                anywhere in the name when 3+ characters), or 3+ phone digits
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Guest dicts, best matches first
+        """
+        query = _normalize(query).strip()
+        digits = re.sub(r'\D', '', query)
+        scores = {}
+
+        if len(digits) >= 3 and len(digits) >= len(re.sub(r'[\s\-+()]', '', query)):
+            # Looks like a phone number
+            for position in self._substring_matches(digits, self.phones):
+                scores[position] = 0 if self.phones[position].endswith(digits) else 1
+        else:
+            terms = re.findall(r'\w+', query)
+            if not terms:
+                return []
+            matches = None
+            word_matches = None
+            for term in terms:
+                prefixed = self._prefix_matches(term)
+                found = prefixed | self._substring_matches(term, self.names) if len(term) >= 3 else prefixed
+                matches = found if matches is None else matches & found
+                word_matches = prefixed if word_matches is None else word_matches & prefixed
+                if not matches:
+                    return []
+            for position in matches:
+                # Whole name starts with the query, then every word matches a
+                # word start, then matches inside words
+                if self.names[position].startswith(query):
+                    scores[position] = 0
+                elif position in word_matches:
+                    scores[position] = 1
+                else:
+                    scores[position] = 2
+
+        best = sorted(scores, key=lambda position: (scores[position], self.names[position]))[:limit]
+        return [self.guests[position] for position in best]
+
+
+def _build_index(wedding_id):
+    guests = Guest.objects.filter(wedding_id=wedding_id).order_by('name').values(
+        'id', 'name', 'phone', 'email', 'status', 'plus_ones'
+    )
+    return GuestIndex(list(guests))
+
+
+def get_guest_index(wedding_id):
+    """
+    Get the guest index of a wedding, building it on first use or after a change
+
+    Args:
+        wedding_id (int): Wedding ID
+
+    Returns:
+        GuestIndex
+    """
+    version = get_wedding_cache_version(wedding_id)
+    with _lock:
+        entry = _indexes.get(wedding_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(wedding_id)
+            return entry[1]
+
+    # Build outside the lock so lookups for other weddings are not held up
+    index = _build_index(wedding_id)
+    with _lock:
+        _indexes[wedding_id] = (version, index)
+        _indexes.move_to_end(wedding_id)
+        while len(_indexes) > MAX_WEDDINGS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def lookup_guests(wedding_id, query, limit=10):
+    """
+    Typeahead search of a wedding's guests by partial name or phone number
+
+    Args:
+        wedding_id (int): Wedding ID
+        query (str): What the user typed so far
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Guest dicts with id, name, phone, email, status and plus_ones
+    """
+    if not query or not query.strip():
+        return []
+    return get_guest_index(wedding_id).search(query, limit)
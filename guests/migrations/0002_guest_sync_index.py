@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guests', '0001_initial'),
+        ('weddings', '0002_weddingevent_sync_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['wedding', 'updated_at'], name='guests_gues_wedding_6fc129_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guests', '0002_guest_sync_index'),
+        ('weddings', '0002_weddingevent_sync_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='group',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='guest',
+            name='table_locked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SeatingConstraint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('together', 'Must sit together'), ('apart', 'Must not sit together')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('guest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seating_constraints', to='guests.guest')),
+                ('other_guest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='guests.guest')),
+                ('wedding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seating_constraints', to='weddings.wedding')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeatingTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('capacity', models.PositiveIntegerField(default=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('wedding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seating_tables', to='weddings.wedding')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='guest',
+            name='table',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='guests', to='guests.seatingtable'),
+        ),
+    ]
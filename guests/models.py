@@ -32,9 +32,16 @@ class Guest(models.Model):
     check_in_date = models.DateTimeField(blank=True, null=True)
     plus_ones = models.PositiveIntegerField(default=0)
     notes = models.TextField(blank=True, null=True)
+    # Seating: guests of the same group are seated together where possible
+    group = models.CharField(max_length=100, blank=True, default='')
+    table = models.ForeignKey('SeatingTable', on_delete=models.SET_NULL, related_name='guests', null=True, blank=True)
+    table_locked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['wedding', 'updated_at'])]
+
     def __str__(self):
         return f"{self.name} - {self.wedding}"
 
@@ -47,6 +54,36 @@ class Guest(models.Model):
         self.check_in_date = timezone.now()
         self.save()
 
+class SeatingTable(models.Model):
+    """A table at the reception"""
+    wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='seating_tables')
+    name = models.CharField(max_length=100)
+    capacity = models.PositiveIntegerField(default=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.name} ({self.capacity} seats) - {self.wedding}"
+
+class SeatingConstraint(models.Model):
+    """Two guests who must, or must not, sit at the same table"""
+    KIND_CHOICES = (
+        ('together', 'Must sit together'),
+        ('apart', 'Must not sit together'),
+    )
+
+    wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='seating_constraints')
+    guest = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name='seating_constraints')
+    other_guest = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.guest.name} / {self.other_guest.name}: {self.get_kind_display()}"
+
 class GuestCredential(models.Model):
     """Credentials for guest access"""
     guest = models.OneToOneField(Guest, on_delete=models.CASCADE, related_name='credential')
@@ -81,9 +118,8 @@ class GuestCredential(models.Model):
 
         super().save(*args, **kwargs)
 
-    def get_qr_code_base64(self):
-        """Get QR code as base64 string for embedding in email"""
-        import base64
+    def get_qr_code_png(self):
+        """Get QR code as PNG bytes, saving the credential first if it has none"""
         import os
 
         # If QR code doesn't exist, save to generate it
@@ -108,14 +144,16 @@ class GuestCredential(models.Model):
             img = qr.make_image(fill_color="black", back_color="white")
             buffer = BytesIO()
             img.save(buffer, format="PNG")
-            buffer.seek(0)
-
-            # Convert to base64
-            return base64.b64encode(buffer.getvalue()).decode('utf-8')
+            return buffer.getvalue()
 
-        # Read the file and convert to base64
         with open(file_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            return image_file.read()
+
+    def get_qr_code_base64(self):
+        """Get QR code as base64 string for embedding in email"""
+        import base64
+
+        return base64.b64encode(self.get_qr_code_png()).decode('utf-8')
 
     @property
     def is_valid(self):
@@ -0,0 +1,16 @@
+"""Guest documents of the search index (see core/search.py)"""
+from django.urls import reverse
+
+from .models import Guest
+from core import search
+
+def _guest_document(guest):
+    return {
+        'wedding_id': guest.wedding_id,
+        'title': guest.name,
+        'body': [guest.email, guest.phone, guest.notes],
+        'url': reverse('guest_detail', args=[guest.id]),
+        'staff_only': True,
+    }
+
+search.register('guest', 1, Guest, 'wedding', ('name', 'email', 'phone', 'notes'), _guest_document)
@@ -0,0 +1,397 @@
+"""
+Seating plan solver
+
+Seats a wedding's guests at its tables. Every guest comes with their
+plus-ones, so a guest is a "party" of 1 + plus_ones seats.
+
+Rules, in order of importance:
+
+- A table holds at most its capacity.
+- Guests with a must-not-sit-together constraint are at different tables.
+- Everyone who can be seated is seated.
+- Guests of the same group (family, college friends, ...) share as few
+  tables as possible.
+- When re-solving, as few people as possible change tables.
+
+Guests with a must-sit-together constraint are merged into one block that
+always moves as a whole, and guests whose table was fixed by hand (locked)
+never move.
+
+The plan is built greedily and then improved by simulated annealing, which
+keeps trying to move one block to another table or to swap two blocks and
+accepts changes that make the plan worse with a probability that shrinks
+over time, so it can get out of local optima. Every step only looks at the
+tables, groups and constraints of the blocks involved, which is what keeps
+500+ guests within a few seconds.
+
+An incremental solve starts from the current plan instead of from scratch:
+only newly confirmed guests are placed, declined guests are removed, and
+moving anybody else costs something.
+"""
+import math
+import random
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Costs of a plan; hard rules outweigh every preference
+OVER_CAPACITY_COST = 1000  # per seat over a table's capacity
+APART_COST = 1000  # per must-not-sit-together pair at one table
+UNSEATED_COST = 100  # per person without a table
+GROUP_SPLIT_COST = 10  # per table a group is spread over
+MOVE_COST = 5  # per person moved away from their table (incremental solves)
+
+# Seconds the local search may run for
+TIME_LIMIT = getattr(settings, 'SEATING_TIME_LIMIT', 3)
+
+# Guests seated by default; others (invited, declined, no-show) lose their table
+SEATED_STATUSES = ('confirmed', 'attended')
+
+Party = namedtuple('Party', 'guest_id size group table locked')
+SolveResult = namedtuple('SolveResult', 'assignment stats')
+
+
+class _Plan:
+    """Blocks of guests, the table of each and the running totals the costs need"""
+
+    def __init__(self, blocks, capacities, apart, incremental):
+        self.blocks = blocks
+        self.capacities = capacities
+        self.unseated = len(capacities)
+        self.apart = apart
+        self.incremental = incremental
+        self.table = [self.unseated] * len(blocks)
+        self.load = [0] * len(capacities)
+        self.group_tables = {}
+
+    def _over(self, table, load):
+        return max(load - self.capacities[table], 0) * OVER_CAPACITY_COST
+
+    def delta(self, b, target):
+        """Change in cost if block b moved to target"""
+        source = self.table[b]
+        if source == target:
+            return 0
+        block = self.blocks[b]
+        size = block.size
+        change = 0
+
+        if source == self.unseated:
+            change -= UNSEATED_COST * size
+        else:
+            change += self._over(source, self.load[source] - size) - self._over(source, self.load[source])
+        if target == self.unseated:
+            change += UNSEATED_COST * size
+        else:
+            change += self._over(target, self.load[target] + size) - self._over(target, self.load[target])
+
+        for other in self.apart[b]:
+            table = self.table[other]
+            if table == self.unseated:
+                continue
+            if table == source:
+                change -= APART_COST
+            elif table == target:
+                change += APART_COST
+
+        for group in block.groups:
+            counts = self.group_tables.get(group, {})
+            if source != self.unseated and counts.get(source) == 1:
+                change -= GROUP_SPLIT_COST
+            if target != self.unseated and not counts.get(target):
+                change += GROUP_SPLIT_COST
+
+        if self.incremental and block.origin is not None:
+            if block.origin == source:
+                change += MOVE_COST * size
+            elif block.origin == target:
+                change -= MOVE_COST * size
+        return change
+
+    def move(self, b, target):
+        source = self.table[b]
+        block = self.blocks[b]
+        if source != self.unseated:
+            self.load[source] -= block.size
+            for group in block.groups:
+                counts = self.group_tables[group]
+                counts[source] -= 1
+                if not counts[source]:
+                    del counts[source]
+        if target != self.unseated:
+            self.load[target] += block.size
+            for group in block.groups:
+                counts = self.group_tables.setdefault(group, {})
+                counts[target] = counts.get(target, 0) + 1
+        self.table[b] = target
+
+    def cost(self):
+        total = sum(self._over(table, load) for table, load in enumerate(self.load))
+        total += sum(UNSEATED_COST * block.size for b, block in enumerate(self.blocks) if self.table[b] == self.unseated)
+        total += sum(
+            APART_COST for b, others in enumerate(self.apart) for other in others
+            if other > b and self.table[b] != self.unseated and self.table[b] == self.table[other]
+        )
+        total += sum(GROUP_SPLIT_COST * len(counts) for counts in self.group_tables.values())
+        if self.incremental:
+            total += sum(
+                MOVE_COST * block.size for b, block in enumerate(self.blocks)
+                if block.origin is not None and self.table[b] != block.origin
+            )
+        return total
+
+
+class _Block:
+    __slots__ = ('guest_ids', 'size', 'groups', 'locked', 'origin')
+
+    def __init__(self):
+        self.guest_ids = []
+        self.size = 0
+        self.groups = set()
+        self.locked = False
+        self.origin = None
+
+
+def _build_blocks(parties, table_index, together):
+    """Merge parties that must sit together into blocks (union-find)"""
+    parent = {party.guest_id: party.guest_id for party in parties}
+
+    def find(guest_id):
+        while parent[guest_id] != guest_id:
+            parent[guest_id] = parent[parent[guest_id]]
+            guest_id = parent[guest_id]
+        return guest_id
+
+    for a, b in together:
+        if a in parent and b in parent:
+            parent[find(a)] = find(b)
+
+    blocks = {}
+    origins = {}
+    for party in parties:
+        root = find(party.guest_id)
+        block = blocks.setdefault(root, _Block())
+        block.guest_ids.append(party.guest_id)
+        block.size += party.size
+        if party.group:
+            block.groups.add(party.group)
+        table = table_index.get(party.table)
+        if table is not None:
+            origins.setdefault(root, Counter())[table] += party.size
+        if party.locked and table is not None:
+            block.locked = True
+            origins[root] = Counter({table: math.inf})
+
+    for root, block in blocks.items():
+        if root in origins:
+            block.origin = origins[root].most_common(1)[0][0]
+    return list(blocks.values())
+
+
+def _greedy(plan, order):
+    """Put each block where it adds the least cost, tightest fitting table first"""
+    tables = range(len(plan.capacities))
+    for b in order:
+        best, best_key = None, None
+        for table in tables:
+            change = plan.delta(b, table)
+            key = (change, plan.capacities[table] - plan.load[table])
+            if change < 0 and (best_key is None or key < best_key):
+                best, best_key = table, key
+        if best is not None:
+            plan.move(b, best)
+
+
+def _anneal(plan, movable, deadline, rng, max_iterations):
+    """Improve the plan by simulated annealing; returns iterations run"""
+    # Re-solving starts cool, so the search refines the current plan instead
+    # of shuffling it
+    start_temperature = 2.0 if plan.incremental else 20.0
+    end_temperature = 0.05
+    tables = len(plan.capacities)
+    cost = plan.cost()
+    best_cost, best_tables = cost, list(plan.table)
+
+    iteration = 0
+    while iteration < max_iterations:
+        if iteration % 512 == 0 and time.monotonic() > deadline:
+            break
+        temperature = start_temperature * (end_temperature / start_temperature) ** (iteration / max_iterations)
+        iteration += 1
+
+        a = rng.choice(movable)
+        if rng.random() < 0.5:
+            # Move one block, now and then off the plan entirely
+            target = plan.unseated if rng.random() < 0.02 else rng.randrange(tables)
+            change = plan.delta(a, target)
+            if change <= 0 or rng.random() < math.exp(-change / temperature):
+                plan.move(a, target)
+                cost += change
+            else:
+                continue
+        else:
+            # Swap two blocks at different tables
+            b = rng.choice(movable)
+            table_a, table_b = plan.table[a], plan.table[b]
+            if table_a == table_b:
+                continue
+            change = plan.delta(a, table_b)
+            plan.move(a, table_b)
+            change += plan.delta(b, table_a)
+            if change <= 0 or rng.random() < math.exp(-change / temperature):
+                plan.move(b, table_a)
+                cost += change
+            else:
+                plan.move(a, table_a)
+                continue
+
+        if cost < best_cost:
+            best_cost, best_tables = cost, list(plan.table)
+
+    for b, table in enumerate(best_tables):
+        if plan.table[b] != table:
+            plan.move(b, table)
+    return iteration
+
+
+def solve(parties, tables, together=(), apart=(), incremental=False, time_limit=None, seed=0):
+    """
+    Find a seating plan
+
+    Args:
+        parties (list): Party tuples (guest_id, size, group, table, locked);
+            table is the guest's current table ID or None
+        tables (list): (table_id, capacity) tuples
+        together (list): (guest_id, guest_id) pairs that must share a table
+        apart (list): (guest_id, guest_id) pairs that must not share a table
+        incremental (bool): Start from the parties' current tables and move
+            as few people as possible
+        time_limit (float): Seconds the local search may run (default
+            SEATING_TIME_LIMIT)
+        seed (int): Random seed, so the same input gives the same plan
+
+    Returns:
+        SolveResult: assignment maps guest IDs to table IDs (None for
+        unseated guests); stats holds seated, unseated, moved, over_capacity
+        (table IDs), apart_violations, split_groups, iterations and seconds
+    """
+    started = time.monotonic()
+    table_ids = [table_id for table_id, _ in tables]
+    table_index = {table_id: index for index, table_id in enumerate(table_ids)}
+    blocks = _build_blocks(parties, table_index, together)
+
+    block_of = {guest_id: b for b, block in enumerate(blocks) for guest_id in block.guest_ids}
+    apart_blocks = [[] for _ in blocks]
+    for a, b in apart:
+        if a in block_of and b in block_of and block_of[a] != block_of[b]:
+            apart_blocks[block_of[a]].append(block_of[b])
+            apart_blocks[block_of[b]].append(block_of[a])
+
+    plan = _Plan(blocks, [capacity for _, capacity in tables], apart_blocks, incremental)
+    for b, block in enumerate(blocks):
+        if block.origin is not None and (block.locked or incremental):
+            plan.move(b, block.origin)
+
+    # Biggest groups first and, within a group, biggest blocks first, so
+    # groups start at tables with room for all of them
+    group_sizes = Counter()
+    for block in blocks:
+        for group in block.groups:
+            group_sizes[group] += block.size
+    key_group = lambda block: max(block.groups, key=lambda group: (group_sizes[group], group), default='')
+    order = sorted(
+        (b for b in range(len(blocks)) if plan.table[b] == plan.unseated and not blocks[b].locked),
+        key=lambda b: (-group_sizes[key_group(blocks[b])], key_group(blocks[b]), -blocks[b].size),
+    )
+    _greedy(plan, order)
+
+    iterations = 0
+    movable = [b for b, block in enumerate(blocks) if not block.locked]
+    if movable and tables:
+        deadline = started + (TIME_LIMIT if time_limit is None else time_limit)
+        rng = random.Random(seed)
+        iterations = _anneal(plan, movable, deadline, rng, max_iterations=400 * len(movable))
+        # Seat anyone the search left out if there is now room
+        _greedy(plan, [b for b in movable if plan.table[b] == plan.unseated])
+
+    assignment = {}
+    for b, block in enumerate(blocks):
+        table = plan.table[b]
+        for guest_id in block.guest_ids:
+            assignment[guest_id] = None if table == plan.unseated else table_ids[table]
+
+    sizes = {party.guest_id: party.size for party in parties}
+    current = {party.guest_id: party.table for party in parties}
+    stats = {
+        'seated': sum(sizes[guest_id] for guest_id, table in assignment.items() if table is not None),
+        'unseated': sum(sizes[guest_id] for guest_id, table in assignment.items() if table is None),
+        'moved': sum(
+            sizes[guest_id] for guest_id, table in assignment.items()
+            if current[guest_id] is not None and table != current[guest_id]
+        ),
+        'over_capacity': [table_ids[t] for t, load in enumerate(plan.load) if load > plan.capacities[t]],
+        'apart_violations': sum(
+            1 for a, b in apart
+            if assignment.get(a) is not None and assignment.get(a) == assignment.get(b)
+        ),
+        'split_groups': sum(1 for counts in plan.group_tables.values() if len(counts) > 1),
+        'iterations': iterations,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+    return SolveResult(assignment, stats)
+
+
+def seat_wedding(wedding, incremental=True, statuses=SEATED_STATUSES, time_limit=None):
+    """
+    Solve and save the seating plan of a wedding
+
+    Guests whose status is not in statuses lose their table (unless it is
+    locked), so re-solving after RSVP changes frees the seats of guests who
+    declined and seats the ones who confirmed.
+
+    Args:
+        wedding: Wedding
+        incremental (bool): Keep the current plan as far as possible
+        statuses (tuple): Guest statuses to seat
+        time_limit (float): Seconds the local search may run
+
+    Returns:
+        dict: Solver stats (see solve()) plus 'changed', the number of
+        guests whose table changed
+    """
+    from .models import Guest, SeatingConstraint
+
+    tables = list(wedding.seating_tables.order_by('id').values_list('id', 'capacity'))
+    rows = list(Guest.objects.filter(wedding=wedding).values_list(
+        'id', 'plus_ones', 'group', 'table_id', 'table_locked', 'status',
+    ))
+    parties = [
+        Party(guest_id, 1 + plus_ones, group, table_id, locked)
+        for guest_id, plus_ones, group, table_id, locked, status in rows
+        if status in statuses or locked
+    ]
+    together, apart = [], []
+    for guest_id, other_id, kind in SeatingConstraint.objects.filter(wedding=wedding).values_list(
+        'guest_id', 'other_guest_id', 'kind',
+    ):
+        (together if kind == 'together' else apart).append((guest_id, other_id))
+
+    result = solve(parties, tables, together, apart, incremental=incremental, time_limit=time_limit)
+
+    current = {guest_id: table_id for guest_id, _, _, table_id, _, _ in rows}
+    now = timezone.now()
+    changed = [
+        Guest(id=guest_id, table_id=result.assignment.get(guest_id), updated_at=now)
+        for guest_id in current
+        if result.assignment.get(guest_id) != current[guest_id]
+    ]
+    with transaction.atomic():
+        Guest.objects.bulk_update(changed, ['table', 'updated_at'], batch_size=500)
+
+    if changed:
+        from core.cache import bump_wedding_cache_version
+        bump_wedding_cache_version(wedding.id)
+    return {**result.stats, 'changed': len(changed)}
@@ -0,0 +1,54 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import Guest, GuestCredential
+from core import live, search, sync
+from core.guest_session import forget_credential
+from core.cache import bump_wedding_cache_version
+
+@receiver([post_save, post_delete], sender=Guest)
+def invalidate_wedding_cache_for_guest(sender, instance, **kwargs):
+    """Drop cached data of a wedding when one of its guests changes"""
+    bump_wedding_cache_version(instance.wedding_id)
+
+@receiver(post_save, sender=Guest)
+def index_guest(sender, instance, **kwargs):
+    search.index_object(instance)
+
+@receiver(post_delete, sender=Guest)
+def unindex_guest(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+@receiver([post_save, post_delete], sender=GuestCredential)
+def invalidate_guest_session(sender, instance, **kwargs):
+    """Make signed guest sessions re-check a credential that changed or was removed"""
+    forget_credential(instance.token)
+
+def publish_guest_status(guest, previous):
+    """Tell live dashboards that a guest checked in or changed their RSVP"""
+    live.publish_on_commit(guest.wedding_id, 'checkin' if guest.status == 'attended' else 'rsvp', {
+        'guest_id': guest.id,
+        'name': guest.name,
+        'status': guest.status,
+        'status_display': guest.get_status_display(),
+        'previous': previous,
+        'plus_ones': guest.plus_ones,
+        'url': reverse('guest_detail', args=[guest.id]),
+    })
+
+@receiver(post_init, sender=Guest)
+def remember_guest_status(sender, instance, **kwargs):
+    # Read the loaded value directly, a deferred status must not cost a query
+    instance._live_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=Guest)
+def publish_guest_status_change(sender, instance, created, **kwargs):
+    previous = instance._live_status
+    instance._live_status = instance.status
+    if not created and previous is not None and previous != instance.status:
+        publish_guest_status(instance, previous)
+
+@receiver(post_delete, sender=Guest)
+def record_guest_deletion(sender, instance, origin=None, **kwargs):
+    sync.record_deletion(instance, origin)
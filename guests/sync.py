@@ -0,0 +1,19 @@
+"""Guests in delta sync (see core/sync.py)"""
+from django.utils import timezone
+
+from .models import Guest
+from core import sync
+
+def _prepare_guest(guest, changed, user):
+    if 'status' in changed:
+        if guest.status in ('confirmed', 'declined'):
+            guest.rsvp_date = timezone.now()
+        elif guest.status == 'attended' and not guest.check_in_date:
+            guest.check_in_date = timezone.now()
+
+sync.register(
+    'guest', Guest, 'wedding',
+    ('name', 'email', 'phone', 'status', 'plus_ones', 'notes', 'invitation_sent', 'rsvp_date', 'check_in_date'),
+    writable=('name', 'email', 'phone', 'status', 'plus_ones', 'notes'),
+    prepare=_prepare_guest,
+)
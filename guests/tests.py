@@ -1,3 +1,227 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import get_wedding_cache_version
+from core.testing import WeddingTestCase, create_user
+from guests.admin import _resend_invitations
+from guests.models import Guest, GuestCredential, Invitation
+from guests.seating import Party, solve
+
+
+def party(guest_id, size=1, group='', table=None, locked=False):
+    return Party(guest_id, size, group, table, locked)
+
+
+class SeatingSolverTests(SimpleTestCase):
+    def solve(self, parties, tables, **kwargs):
+        return solve(parties, tables, time_limit=0.2, **kwargs)
+
+    def loads(self, result, parties):
+        loads = {}
+        for p in parties:
+            table = result.assignment[p.guest_id]
+            if table is not None:
+                loads[table] = loads.get(table, 0) + p.size
+        return loads
+
+    def test_tables_are_never_over_capacity(self):
+        parties = [party(i, size=1 + i % 3) for i in range(1, 21)]
+        tables = [(100, 8), (101, 8), (102, 8), (103, 8), (104, 8)]
+        result = self.solve(parties, tables)
+
+        capacities = dict(tables)
+        for table, load in self.loads(result, parties).items():
+            self.assertLessEqual(load, capacities[table])
+        self.assertEqual(result.stats['over_capacity'], [])
+        self.assertEqual(result.stats['seated'] + result.stats['unseated'], sum(p.size for p in parties))
+
+    def test_guests_that_do_not_fit_stay_unseated(self):
+        parties = [party(1, size=4), party(2, size=4), party(3, size=4)]
+        result = self.solve(parties, [(100, 5), (101, 5)])
+
+        self.assertEqual(result.stats['seated'], 8)
+        self.assertEqual(result.stats['unseated'], 4)
+        self.assertEqual(result.stats['over_capacity'], [])
+
+    def test_apart_guests_get_different_tables(self):
+        # One group would fit at one table, but two of its members must sit apart
+        parties = [party(i, group='family') for i in range(1, 7)]
+        result = self.solve(parties, [(100, 6), (101, 6)], apart=[(1, 2), (3, 4)])
+
+        self.assertNotEqual(result.assignment[1], result.assignment[2])
+        self.assertNotEqual(result.assignment[3], result.assignment[4])
+        self.assertEqual(result.stats['apart_violations'], 0)
+        self.assertEqual(result.stats['unseated'], 0)
+
+    def test_together_guests_share_a_table(self):
+        parties = [party(i) for i in range(1, 9)]
+        result = self.solve(parties, [(100, 4), (101, 4)], together=[(1, 8), (8, 5)])
+
+        self.assertEqual(result.assignment[1], result.assignment[8])
+        self.assertEqual(result.assignment[8], result.assignment[5])
+
+    def test_groups_are_kept_together_when_they_fit(self):
+        parties = [party(i, group='a' if i <= 4 else 'b') for i in range(1, 9)]
+        result = self.solve(parties, [(100, 4), (101, 4)])
+
+        self.assertEqual(len({result.assignment[i] for i in range(1, 5)}), 1)
+        self.assertEqual(len({result.assignment[i] for i in range(5, 9)}), 1)
+        self.assertEqual(result.stats['split_groups'], 0)
+
+    def test_locked_guests_keep_their_table(self):
+        parties = [party(1, table=101, locked=True), party(2, group='x'), party(3, group='x')]
+        result = self.solve(parties, [(100, 2), (101, 2)], apart=[(1, 2)])
+
+        self.assertEqual(result.assignment[1], 101)
+        self.assertEqual(result.assignment[2], 100)
+
+    def test_incremental_solve_only_places_new_guests(self):
+        parties = [party(i, table=100 + (i - 1) // 3) for i in range(1, 7)] + [party(7)]
+        result = self.solve(parties, [(100, 4), (101, 4)], incremental=True)
+
+        self.assertEqual(result.stats['moved'], 0)
+        self.assertIsNotNone(result.assignment[7])
+
+
+class GuestLookupTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        Guest.objects.create(wedding=self.wedding, name='Carla Diaz', phone='555-0101')
+
+    def lookup(self, wedding, q='carla'):
+        return self.client.get(reverse('guest_lookup'), {'wedding': wedding, 'q': q})
+
+    def test_finds_guests_by_name(self):
+        response = self.lookup(self.wedding.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([guest['name'] for guest in response.json()['results']], ['Carla Diaz'])
+
+    def test_invalid_wedding_id(self):
+        self.assertEqual(self.lookup('abc').status_code, 400)
+        self.assertEqual(self.client.get(reverse('guest_lookup')).status_code, 400)
+        self.assertEqual(self.lookup(self.wedding.id + 1).status_code, 404)
+
+
+class ConditionalGetTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz')
+
+    def etag(self, url):
+        # The first request sets the CSRF cookie, which is part of the ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        return response['ETag']
+
+    def test_unchanged_list_is_not_modified(self):
+        url = reverse('guest_list')
+        etag = self.etag(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_list_changes_after_a_save_or_delete(self):
+        url = reverse('guest_list')
+        etag = self.etag(url)
+        self.guest.name = 'Carla Diaz-Lopez'
+        self.guest.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Carla Diaz-Lopez')
+
+        etag = response['ETag']
+        Guest.objects.create(wedding=self.wedding, name='Dan Evans').delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.guest.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_changes_with_its_wedding(self):
+        url = reverse('guest_detail', args=[self.guest.id])
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+
+        etag = response['ETag']
+        self.wedding.location = 'Garden'
+        self.wedding.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_other_users_get_their_own_etag(self):
+        url = reverse('guest_list')
+        etag = self.etag(url)
+        self.client.force_login(create_user('other'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class GuestAdminActionTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(create_user('root', is_staff=True, is_superuser=True))
+
+    def action(self, name, guests):
+        return self.client.post('/admin/guests/guest/', {
+            'action': name, '_selected_action': [guest.id for guest in guests],
+        })
+
+    def test_mark_checked_in(self):
+        arrived = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', status='attended')
+        arriving = Guest.objects.create(wedding=self.wedding, name='Dan Evans', status='confirmed')
+        version = get_wedding_cache_version(self.wedding.id)
+
+        with mock.patch('guests.admin.publish_guest_status') as publish:
+            self.action('mark_checked_in', [arrived, arriving])
+
+        arriving.refresh_from_db()
+        self.assertEqual(arriving.status, 'attended')
+        self.assertIsNotNone(arriving.check_in_date)
+        self.assertEqual([call.args[0].id for call in publish.call_args_list], [arriving.id])
+        self.assertNotEqual(get_wedding_cache_version(self.wedding.id), version)
+
+    def test_resend_invitations_sends_the_latest_invitation(self):
+        guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', email='carla@example.com')
+        GuestCredential.objects.create(guest=guest, username='carla', expiry_date=timezone.now() + datetime.timedelta(days=30))
+        Invitation.objects.create(wedding=self.wedding, guest=guest, message='First')
+        latest = Invitation.objects.create(wedding=self.wedding, guest=guest, message='Second')
+        no_email = Guest.objects.create(wedding=self.wedding, name='Dan Evans')
+
+        with mock.patch('guests.admin.run_in_background') as run:
+            response = self.action('resend_invitations', [guest, no_email])
+
+        run.assert_called_once_with(_resend_invitations, [latest.id])
+        guest.refresh_from_db()
+        self.assertTrue(guest.invitation_sent)
+        self.assertFalse(Guest.objects.get(id=no_email.id).invitation_sent)
+        self.assertIn('1 guests were skipped', [str(m) for m in get_messages(response.wsgi_request)][0])
+
+
+class SendInvitationTests(WeddingTestCase):
+    def test_invitations_are_emailed_with_a_qr_code(self):
+        guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', email='carla@example.com')
+        no_email = Guest.objects.create(wedding=self.wedding, name='Dan Eve')
+
+        response = self.client.post(reverse('send_invitation'), {
+            'wedding': self.wedding.id, 'guests': [guest.id, no_email.id], 'message': 'Join us!',
+        })
+
+        self.assertRedirects(response, f"{reverse('guest_list')}?wedding={self.wedding.id}", fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.to, ['carla@example.com'])
+        self.assertIn('Join us!', email.alternatives[0][0])
+
+        credential = GuestCredential.objects.get(guest=guest)
+        self.assertTrue(credential.qr_code)
+        self.assertIn(credential.username, email.body)
+        self.assertEqual(list(Invitation.objects.values_list('guest_id', flat=True)), [guest.id])
+        guest.refresh_from_db()
+        self.assertTrue(guest.invitation_sent)
@@ -10,7 +10,9 @@ urlpatterns = [
     path('<int:guest_id>/delete/', views.guest_delete, name='guest_delete'),
     path('qr/<str:token>/', views.guest_qr_login, name='guest_qr_login'),
     path('checkin/', views.guest_checkin, name='guest_checkin'),
+    path('lookup/', views.guest_lookup, name='guest_lookup'),
     path('invitation/', views.send_invitation, name='send_invitation'),
+    path('seating/<int:wedding_id>/', views.seating_plan, name='seating_plan'),
     # Redirect guest login to the unified login
     path('login/', lambda request: redirect('login'), name='guest_login'),
 ]
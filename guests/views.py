@@ -1,24 +1,77 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
 from django.utils import timezone
 from django.urls import reverse
+from django.db.models import Count, Max
 import uuid
 import datetime
 import random
 import string
 
-from .models import Guest, GuestCredential, Invitation
+from .models import Guest, GuestCredential, Invitation, SeatingTable, SeatingConstraint
+from .seating import seat_wedding, SEATED_STATUSES
+from .lookup import lookup_guests
 from weddings.models import Wedding
-from core.utils import send_guest_invitation_email
+from core.utils import guest_invitation_email, send_email
+from core.http import conditional_page, subquery_aggregate, latest
+from core.passwords import check_guest_credential, create_guest_user
+from core.guest_session import guest_login_redirect
+from core.aio import get_user_with_profile, gather_blocking
+from core.cache import bump_wedding_cache_version
 
 def generate_simple_password(length=8):
     """Generate a simple password for guests"""
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
+def _guest_list_state(request):
+    """Newest change and size of the guest list shown to the user"""
+    user = request.user
+    role = user.profile.role
+    wedding_id = request.GET.get('wedding')
+
+    if wedding_id:
+        guests = Guest.objects.filter(wedding_id=wedding_id)
+    elif role == 'admin':
+        guests = Guest.objects.filter(wedding__admin=user)
+    elif role == 'team_member':
+        guests = Guest.objects.filter(wedding__team_members__member=user)
+    else:
+        guests = user.guest_profiles.all()
+
+    # The list also shows wedding titles and dates, so include the weddings' changes
+    state = guests.aggregate(
+        guests_modified=Max('updated_at'),
+        weddings_modified=Max('wedding__updated_at'),
+        count=Count('id', distinct=True),
+    )
+    return latest(state['guests_modified'], state['weddings_modified']), (role, wedding_id, state['count'])
+
+def _guest_detail_state(request, guest_id):
+    """Newest change of a guest, their wedding and their invitations, in one query"""
+    state = Guest.objects.filter(id=guest_id).annotate(
+        invitations_sent=subquery_aggregate(Invitation.objects.all(), 'guest', Max('sent_date')),
+        invitations_viewed=subquery_aggregate(Invitation.objects.all(), 'guest', Max('viewed_date')),
+        invitations_count=subquery_aggregate(Invitation.objects.all(), 'guest', Count('id')),
+    ).values(
+        'updated_at', 'wedding__updated_at', 'credential__id',
+        'invitations_sent', 'invitations_viewed', 'invitations_count',
+    ).first()
+
+    if state is None:
+        return None
+
+    last_modified = latest(
+        state['updated_at'], state['wedding__updated_at'],
+        state['invitations_sent'], state['invitations_viewed'],
+    )
+    return last_modified, (state['credential__id'], state['invitations_count'])
+
 @login_required
+@conditional_page(_guest_list_state)
 def guest_list(request):
     """List all guests the user has access to"""
     user = request.user
@@ -56,6 +109,7 @@ def guest_list(request):
     return render(request, 'guests/guest_list.html', context)
 
 @login_required
+@conditional_page(_guest_detail_state)
 def guest_detail(request, guest_id):
     """View guest details"""
     guest = get_object_or_404(Guest, id=guest_id)
@@ -149,6 +203,7 @@ def guest_create(request):
             address=address,
             plus_ones=plus_ones,
             notes=notes,
+            group=request.POST.get('group', '').strip()[:100],
             status='invited'
         )
 
@@ -205,6 +260,7 @@ def guest_edit(request, guest_id):
         guest.plus_ones = request.POST.get('plus_ones', 0)
         guest.notes = request.POST.get('notes')
         guest.status = request.POST.get('status')
+        guest.group = request.POST.get('group', '').strip()[:100]
 
         guest.save()
 
@@ -268,42 +324,12 @@ def guest_login(request):
 
             # Check if the password matches the stored plain text password
             # This is for guest credentials that store plain text passwords
-            if credential.password == password:
-                # If guest already has a user, log them in
-                if guest.user:
-                    user = guest.user
-                    # Update the user's password if it might have changed
-                    user.set_password(password)
-                    user.save()
-                else:
-                    # Create a new user for this guest
-                    from django.contrib.auth.models import User
-                    import uuid
-
-                    # Create a unique username if needed
-                    user_username = f"guest_{uuid.uuid4().hex[:8]}"
-
-                    # Create the user
-                    user = User.objects.create_user(
-                        username=user_username,
-                        password=password,  # This will hash the password
-                        email=guest.email
-                    )
-
-                    # Set user profile to guest role
-                    from core.models import UserProfile
-                    UserProfile.objects.create(user=user, role='guest')
-
-                    # Associate guest with user
-                    guest.user = user
-                    guest.save()
-
-                # Log the user in
-                from django.contrib.auth import login
-                login(request, user)
+            if check_guest_credential(credential, password):
+                # Guest accounts have no usable password of their own
+                user = guest.user or create_guest_user(guest, f"guest_{uuid.uuid4().hex[:8]}")
 
                 messages.success(request, f"Welcome, {guest.name}!")
-                return redirect('dashboard')
+                return guest_login_redirect(request, credential, user)
             # If the guest already has a user account, try to authenticate with Django's system
             elif guest.user:
                 from django.contrib.auth import authenticate, login
@@ -324,7 +350,7 @@ def guest_login(request):
 def guest_qr_login(request, token):
     """Handle QR code login"""
     try:
-        credential = GuestCredential.objects.get(token=token)
+        credential = GuestCredential.objects.select_related('guest__user').get(token=token)
 
         # Check if credential is valid
         if not credential.is_valid:
@@ -348,40 +374,15 @@ def guest_qr_login(request, token):
 
         # If guest has a user account, log them in directly
         if guest.user:
-            from django.contrib.auth import login
-            login(request, guest.user)
             messages.success(request, f"Welcome, {guest.name}!")
-            return redirect('dashboard')
+            return guest_login_redirect(request, credential, guest.user)
         else:
-            # Create a new user for this guest
-            from django.contrib.auth.models import User
-            import uuid
-
-            # Create a unique username and use the credential password if available
-            user_username = f"guest_{uuid.uuid4().hex[:8]}"
-            password = credential.password or generate_simple_password()
-
-            # Create the user
-            user = User.objects.create_user(
-                username=user_username,
-                password=password,
-                email=guest.email
-            )
-
-            # Set user profile to guest role
-            from core.models import UserProfile
-            UserProfile.objects.create(user=user, role='guest')
-
-            # Associate guest with user
-            guest.user = user
-            guest.save()
-
-            # Log the user in
-            from django.contrib.auth import login
-            login(request, user)
+            # Create a login account for this guest; it has no usable
+            # password, the QR code token is what proves who they are
+            user = create_guest_user(guest, f"guest_{uuid.uuid4().hex[:8]}")
 
             messages.success(request, f"Welcome, {guest.name}!")
-            return redirect('dashboard')
+            return guest_login_redirect(request, credential, user)
 
     except GuestCredential.DoesNotExist:
         messages.error(request, "Invalid QR code.")
@@ -420,37 +421,149 @@ def guest_checkin(request):
         return redirect('guest_detail', guest_id=guest.id)
 
 @login_required
-def send_invitation(request):
-    """Send invitations to guests"""
-    # Only admins and team members can send invitations
-    if request.user.profile.role not in ['admin', 'team_member']:
-        messages.error(request, "You don't have permission to send invitations.")
-        return redirect('dashboard')
-
-    # Get wedding if provided in query params
-    wedding_id = request.GET.get('wedding')
-    if wedding_id:
-        wedding = get_object_or_404(Wedding, id=wedding_id)
-
-        # Check if user has access to this wedding
-        if request.user.profile.role == 'admin' and wedding.admin != request.user:
-            return HttpResponseForbidden("You don't have permission to send invitations for this wedding.")
+def guest_lookup(request):
+    """Typeahead search of a wedding's guests by name or phone for the check-in desk (JSON)"""
+    wedding_id = request.GET.get('wedding', '')
+    if not wedding_id.isdigit():
+        return JsonResponse({'error': 'A wedding ID is required.'}, status=400)
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+    user = request.user
 
-        if request.user.profile.role == 'team_member' and not wedding.team_members.filter(member=request.user).exists():
-            return HttpResponseForbidden("You don't have permission to send invitations for this wedding.")
+    # Only the wedding's admin and team members can look up guests
+    if user.profile.role == 'admin' and wedding.admin == user:
+        pass
+    elif user.profile.role == 'team_member' and wedding.team_members.filter(member=user).exists():
+        pass
+    else:
+        return JsonResponse({'error': "You don't have permission to look up guests for this wedding."}, status=403)
 
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+
+    checkin_url = reverse('guest_checkin')
+    results = [
+        {
+            **guest,
+            'checked_in': guest['status'] == 'attended',
+            'url': reverse('guest_detail', args=[guest['id']]),
+            'checkin_url': f"{checkin_url}?guest_id={guest['id']}",
+        }
+        for guest in lookup_guests(wedding.id, request.GET.get('q', ''), limit)
+    ]
+
+    return JsonResponse({'results': results})
+
+async def _can_send_invitations(user, wedding):
+    """Whether an admin or team member may send invitations for a wedding"""
+    if user.profile.role == 'admin':
+        return wedding.admin_id == user.id
+    return await wedding.team_members.filter(member=user).aexists()
+
+def _send_invitation_page(request, wedding):
+    """Render the invitation form (synchronous: the template reads querysets)"""
+    if wedding:
         # Get guests for this wedding who haven't been sent invitations
         guests = Guest.objects.filter(wedding=wedding, invitation_sent=False)
+        available_weddings = None
     else:
         # Get available weddings based on user role
         if request.user.profile.role == 'admin':
             available_weddings = Wedding.objects.filter(admin=request.user)
         else:
-            wedding_teams = request.user.wedding_teams.all()
+            wedding_teams = request.user.wedding_teams.select_related('wedding')
             available_weddings = [team.wedding for team in wedding_teams]
-
         guests = []
-        wedding = None
+
+    context = {
+        'guests': guests,
+        'wedding': wedding,
+        'available_weddings': available_weddings,
+    }
+
+    return render(request, 'guests/send_invitation.html', context)
+
+async def _send_invitations(request, wedding, guest_ids, message):
+    """
+    Create and email invitations, sending the emails concurrently
+
+    Returns:
+        tuple: (successful, failed) counts
+    """
+    guests = [
+        guest async for guest in
+        Guest.objects.filter(wedding=wedding, id__in=guest_ids).select_related('credential')
+    ]
+
+    invitations = []
+    credentials = []
+    for guest in guests:
+        # Skip if guest has no email
+        if not guest.email:
+            messages.warning(request, f"No email address for {guest.name}. Invitation not sent.")
+            continue
+
+        # Get or create guest credential
+        try:
+            credential = guest.credential
+        except GuestCredential.DoesNotExist:
+            # Saving a credential also writes its QR code image
+            credential = await GuestCredential.objects.acreate(
+                guest=guest,
+                username=f"guest_{uuid.uuid4().hex[:8]}",
+                password=generate_simple_password(),
+                expiry_date=wedding.date + datetime.timedelta(days=7),
+            )
+
+        invitations.append(Invitation(wedding=wedding, guest=guest, message=message))
+        credentials.append(credential)
+
+    invitations = await Invitation.objects.abulk_create(invitations)
+
+    # QR codes are created and read here, where the ORM may be used; the
+    # senders only get the finished emails
+    emails = await sync_to_async(lambda: [
+        guest_invitation_email(invitation, credential)
+        for invitation, credential in zip(invitations, credentials)
+    ])()
+
+    # SMTP round trips dominate; send the emails side by side
+    results = await gather_blocking([(send_email, email) for email in emails])
+
+    sent = [invitation.guest_id for invitation, ok in zip(invitations, results) if ok]
+    failed = [invitation.id for invitation, ok in zip(invitations, results) if not ok]
+
+    if sent:
+        await Guest.objects.filter(id__in=sent).aupdate(
+            invitation_sent=True, invitation_sent_date=timezone.now(), updated_at=timezone.now()
+        )
+        await sync_to_async(bump_wedding_cache_version)(wedding.id)
+    if failed:
+        # Remove invitations whose email failed
+        await Invitation.objects.filter(id__in=failed).adelete()
+
+    return len(sent), len(failed)
+
+@login_required
+async def send_invitation(request):
+    """Send invitations to guests"""
+    user = await get_user_with_profile(request)
+
+    # Only admins and team members can send invitations
+    if user.profile.role not in ['admin', 'team_member']:
+        messages.error(request, "You don't have permission to send invitations.")
+        return redirect('dashboard')
+
+    # Get wedding if provided in query params
+    wedding_id = request.GET.get('wedding')
+    wedding = None
+    if wedding_id:
+        wedding = await aget_object_or_404(Wedding, id=wedding_id)
+
+        # Check if user has access to this wedding
+        if not await _can_send_invitations(user, wedding):
+            return HttpResponseForbidden("You don't have permission to send invitations for this wedding.")
 
     if request.method == 'POST':
         wedding_id = request.POST.get('wedding')
@@ -466,54 +579,11 @@ def send_invitation(request):
             else:
                 return redirect('send_invitation')
 
-        wedding = get_object_or_404(Wedding, id=wedding_id)
-
-        # Send invitations to selected guests
-        successful_invites = 0
-        failed_invites = 0
-
-        for guest_id in guest_ids:
-            guest = get_object_or_404(Guest, id=guest_id)
-
-            # Skip if guest has no email
-            if not guest.email:
-                messages.warning(request, f"No email address for {guest.name}. Invitation not sent.")
-                continue
-
-            # Get or create guest credential
-            try:
-                credential = guest.credential
-            except GuestCredential.DoesNotExist:
-                # Create credential if it doesn't exist
-                expiry_date = wedding.date + datetime.timedelta(days=7)
-                username = f"guest_{uuid.uuid4().hex[:8]}"
-                password = generate_simple_password()
-                credential = GuestCredential.objects.create(
-                    guest=guest,
-                    username=username,
-                    password=password,
-                    expiry_date=expiry_date
-                )
-
-            # Create invitation
-            invitation = Invitation.objects.create(
-                wedding=wedding,
-                guest=guest,
-                message=message
-            )
+        wedding = await aget_object_or_404(Wedding, id=wedding_id)
+        if not await _can_send_invitations(user, wedding):
+            return HttpResponseForbidden("You don't have permission to send invitations for this wedding.")
 
-            # Send email with invitation
-            email_sent = send_guest_invitation_email(invitation, credential)
-
-            if email_sent:
-                # Update guest
-                guest.invitation_sent = True
-                guest.invitation_sent_date = timezone.now()
-                guest.save()
-                successful_invites += 1
-            else:
-                failed_invites += 1
-                invitation.delete()  # Remove invitation if email failed
+        successful_invites, failed_invites = await _send_invitations(request, wedding, guest_ids, message)
 
         # Show appropriate message based on results
         if successful_invites > 0 and failed_invites == 0:
@@ -526,10 +596,120 @@ def send_invitation(request):
         # Use query parameter instead of keyword argument
         return redirect(f"{reverse('guest_list')}?wedding={wedding_id}")
 
+    return await sync_to_async(_send_invitation_page)(request, wedding)
+
+@login_required
+def seating_plan(request, wedding_id):
+    """Seating plan of a wedding: tables, constraints and the solver"""
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+
+    # Only the wedding's admin and team plan the seating
+    if request.user.profile.role == 'admin' and wedding.admin != request.user:
+        return HttpResponseForbidden("You don't have permission to plan the seating of this wedding.")
+
+    if request.user.profile.role == 'team_member' and not wedding.team_members.filter(member=request.user).exists():
+        return HttpResponseForbidden("You don't have permission to plan the seating of this wedding.")
+
+    if request.user.profile.role == 'guest':
+        return HttpResponseForbidden("You don't have permission to plan the seating.")
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+
+        if action == 'add_tables':
+            try:
+                count = max(1, min(int(request.POST.get('count') or 1), 200))
+                capacity = max(1, int(request.POST.get('capacity') or 10))
+            except ValueError:
+                messages.error(request, "Number of tables and seats must be numbers.")
+                return redirect('seating_plan', wedding_id=wedding.id)
+            name = request.POST.get('name', '').strip() or 'Table'
+            start = wedding.seating_tables.count() + 1
+            SeatingTable.objects.bulk_create([
+                SeatingTable(wedding=wedding, name=f"{name} {start + i}", capacity=capacity)
+                for i in range(count)
+            ])
+            messages.success(request, f"{count} table{'s' if count != 1 else ''} added.")
+
+        elif action == 'edit_table':
+            table = get_object_or_404(SeatingTable, id=request.POST.get('table_id'), wedding=wedding)
+            table.name = request.POST.get('name', '').strip() or table.name
+            try:
+                table.capacity = max(1, int(request.POST.get('capacity') or table.capacity))
+            except ValueError:
+                pass
+            table.save()
+            messages.success(request, f"Table '{table.name}' updated.")
+
+        elif action == 'delete_table':
+            table = get_object_or_404(SeatingTable, id=request.POST.get('table_id'), wedding=wedding)
+            # Its guests become unseated; unlock them so the solver can place them again
+            table.guests.update(table_locked=False, updated_at=timezone.now())
+            table.delete()
+            bump_wedding_cache_version(wedding.id)
+            messages.success(request, f"Table '{table.name}' deleted.")
+
+        elif action == 'add_constraint':
+            guest = get_object_or_404(Guest, id=request.POST.get('guest'), wedding=wedding)
+            other_guest = get_object_or_404(Guest, id=request.POST.get('other_guest'), wedding=wedding)
+            kind = request.POST.get('kind')
+            if guest == other_guest or kind not in dict(SeatingConstraint.KIND_CHOICES):
+                messages.error(request, "Pick two different guests and a rule.")
+            else:
+                SeatingConstraint.objects.create(wedding=wedding, guest=guest, other_guest=other_guest, kind=kind)
+                messages.success(request, "Seating rule added.")
+
+        elif action == 'delete_constraint':
+            SeatingConstraint.objects.filter(id=request.POST.get('constraint_id'), wedding=wedding).delete()
+            messages.success(request, "Seating rule removed.")
+
+        elif action == 'assign':
+            guest = get_object_or_404(Guest, id=request.POST.get('guest_id'), wedding=wedding)
+            table_id = request.POST.get('table_id')
+            guest.table = get_object_or_404(SeatingTable, id=table_id, wedding=wedding) if table_id else None
+            # Seats chosen by hand stay put when the plan is solved again
+            guest.table_locked = guest.table is not None and request.POST.get('lock') == 'on'
+            guest.save()
+            messages.success(request, f"{guest.name} moved to {guest.table.name if guest.table else 'unseated'}.")
+
+        elif action == 'solve':
+            statuses = SEATED_STATUSES + (('invited',) if request.POST.get('include_pending') == 'on' else ())
+            stats = seat_wedding(wedding, incremental=request.POST.get('mode') != 'full', statuses=statuses)
+            if stats['over_capacity'] or stats['apart_violations']:
+                messages.warning(
+                    request,
+                    "Not every rule could be met: add tables or seats, or review the must-sit-together rules.",
+                )
+            messages.success(
+                request,
+                f"Seated {stats['seated']} people ({stats['unseated']} without a table, "
+                f"{stats['changed']} guests changed tables) in {stats['seconds']}s.",
+            )
+
+        return redirect('seating_plan', wedding_id=wedding.id)
+
+    tables = list(wedding.seating_tables.all())
+    seated = {}
+    unseated = []
+    for guest in Guest.objects.filter(wedding=wedding).exclude(status__in=['declined', 'no_show']).order_by('group', 'name'):
+        if guest.table_id:
+            seated.setdefault(guest.table_id, []).append(guest)
+        else:
+            unseated.append(guest)
+    for table in tables:
+        table.seated_guests = seated.get(table.id, [])
+        table.seats_taken = sum(1 + guest.plus_ones for guest in table.seated_guests)
+        table.over_capacity = table.seats_taken > table.capacity
+
     context = {
-        'guests': guests,
         'wedding': wedding,
-        'available_weddings': available_weddings if not wedding else None,
+        'tables': tables,
+        'unseated': unseated,
+        'all_guests': sorted([guest for guests in seated.values() for guest in guests] + unseated, key=lambda g: g.name),
+        'constraints': wedding.seating_constraints.select_related('guest', 'other_guest'),
+        'kind_choices': SeatingConstraint.KIND_CHOICES,
+        'total_seats': sum(table.capacity for table in tables),
+        'seats_taken': sum(table.seats_taken for table in tables),
     }
+    return render(request, 'guests/seating_plan.html', context)
 
-    return render(request, 'guests/send_invitation.html', context)
@@ -52,6 +52,10 @@ def run_migrations():
     # Apply migrations
     os.system('python manage.py migrate')
 
+    # The search table comes from a hand-written migration that the reset
+    # above removed; create it again (see core/search.py)
+    os.system('python manage.py rebuild_search_index')
+
     print("Migrations complete.")
 
 def seed_data(preserve_users=False):
@@ -71,8 +75,33 @@ def seed_data(preserve_users=False):
 
     print("Database seeding complete.")
 
+def restore_from_snapshot(name):
+    """Restore the database and media directory from a snapshot
+
+    Args:
+        name (str): Name of the snapshot to restore
+    """
+    from core.snapshots import restore_snapshot
+
+    print(f"Restoring snapshot '{name}'...")
+    restore_snapshot(name)
+    print("Snapshot restored.")
+
+def save_snapshot(name):
+    """Capture the freshly seeded database and media directory as a snapshot
+
+    Args:
+        name (str): Name of the snapshot to create
+    """
+    from core.snapshots import create_snapshot
+
+    print(f"Saving snapshot '{name}'...")
+    path = create_snapshot(name)
+    print(f"  ✓ Snapshot saved to {path}")
+
 if __name__ == "__main__":
     import argparse
+    from core.snapshots import snapshot_exists, list_snapshots
 
     # Set up command line arguments
     parser = argparse.ArgumentParser(description='Reset and seed the database.')
@@ -80,21 +109,50 @@ if __name__ == "__main__":
                         help='Preserve existing users when seeding (default: False)')
     parser.add_argument('--yes', '-y', action='store_true',
                         help='Skip confirmation prompt')
+    parser.add_argument('--snapshot', metavar='NAME',
+                        help='Restore the named snapshot if it exists, otherwise reset, seed and save it')
+    parser.add_argument('--refresh-snapshot', action='store_true',
+                        help='Rebuild the snapshot given with --snapshot even if it already exists')
+    parser.add_argument('--list-snapshots', action='store_true',
+                        help='List the available snapshots and exit')
 
     args = parser.parse_args()
 
+    if args.list_snapshots:
+        names = list_snapshots()
+        if names:
+            for name in names:
+                print(f"- {name}")
+        else:
+            print("No snapshots found.")
+        sys.exit(0)
+
+    # Restoring a snapshot replaces the data but leaves the migrations alone
+    restore = args.snapshot and snapshot_exists(args.snapshot) and not args.refresh_snapshot
+
     if args.yes:
         confirm = 'y'
+    elif restore:
+        confirm = input(f"This will replace the database and media with snapshot '{args.snapshot}'. "
+                        "Are you sure? (y/n): ")
     else:
         # Confirm with the user
         confirm = input("This will delete the database and all migrations. Are you sure? (y/n): ")
 
     if confirm.lower() == 'y':
+        if restore:
+            restore_from_snapshot(args.snapshot)
+            print("Database has been restored successfully.")
+            sys.exit(0)
+
         reset_database()
         run_migrations()
         seed_data(preserve_users=args.preserve_users)
         print("Database has been reset and reseeded successfully.")
         if args.preserve_users:
             print("Existing users have been preserved.")
+
+        if args.snapshot:
+            save_snapshot(args.snapshot)
     else:
         print("Operation cancelled.")
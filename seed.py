@@ -21,6 +21,7 @@ django.setup()
 # Import models after Django setup
 from django.contrib.auth.models import User
 from core.models import UserProfile
+from core.passwords import set_account_password
 from weddings.models import Wedding, WeddingTeam, WeddingEvent, WeddingTheme
 from guests.models import Guest, GuestCredential, Invitation
 from tasks.models import Task, TaskComment, Checklist, ChecklistItem, Reminder
@@ -185,7 +186,7 @@ def create_users():
                 )
 
                 if created:
-                    user.set_password(data['password'])
+                    set_account_password(user, data['password'], 'seed')
                     user.save()
                     print(f"  ✓ Created admin user: {data['username']}")
                 else:
@@ -240,7 +241,7 @@ def create_users():
                 )
 
                 if created:
-                    user.set_password(password)
+                    set_account_password(user, password, 'seed')
                     user.save()
                     print(f"  ✓ Created team member: {username}")
                 else:
@@ -298,7 +299,7 @@ def create_users():
                 )
 
                 if created:
-                    user.set_password(password)
+                    set_account_password(user, password, 'seed')
                     user.save()
                     print(f"  ✓ Created guest user: {username}")
                 else:
@@ -17,6 +17,7 @@ def generate_simple_password(length=8):
 
 # Import models after Django setup
 from core.models import UserProfile
+from core.passwords import make_account_password
 from weddings.models import Wedding, WeddingTeam, WeddingEvent, WeddingTheme
 from guests.models import Guest, GuestCredential, Invitation
 from tasks.models import Task, TaskComment, Checklist, ChecklistItem, Reminder
@@ -50,10 +51,10 @@ def create_users():
     print("Creating users...")
 
     # Create admin user
-    admin_user = User.objects.create_user(
+    admin_user = User.objects.create(
         username='admin',
         email='admin@example.com',
-        password='admin123',
+        password=make_account_password('admin123', 'seed'),
         first_name='Admin',
         last_name='User',
         is_staff=True
@@ -68,10 +69,10 @@ def create_users():
     # Create team members
     team_members = []
     for i in range(1, 6):
-        team_user = User.objects.create_user(
+        team_user = User.objects.create(
             username=f'team{i}',
             email=f'team{i}@example.com',
-            password='team123',
+            password=make_account_password('team123', 'seed'),
             first_name=f'Team{i}',
             last_name='Member'
         )
@@ -86,10 +87,10 @@ def create_users():
     # Create guest users
     guest_users = []
     for i in range(1, 11):
-        guest_user = User.objects.create_user(
+        guest_user = User.objects.create(
             username=f'guest{i}',
             email=f'guest{i}@example.com',
-            password='guest123',
+            password=make_account_password('guest123', 'seed'),
             first_name=f'Guest{i}',
             last_name='User'
         )
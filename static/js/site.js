@@ -0,0 +1,83 @@
+// Mobile menu, user dropdown and message dismissal (loaded by base.html)
+document.addEventListener('DOMContentLoaded', function () {
+    const mobileMenuButton = document.getElementById('mobile-menu-button');
+    const mobileMenuClose = document.getElementById('mobile-menu-close');
+    const mobileMenuOverlay = document.getElementById('mobile-menu-overlay');
+    const mobileMenu = document.getElementById('mobile-menu');
+
+    if (mobileMenuButton && mobileMenuClose && mobileMenuOverlay && mobileMenu) {
+        // Open mobile menu
+        mobileMenuButton.addEventListener('click', function () {
+            mobileMenuOverlay.classList.remove('hidden');
+            setTimeout(() => {
+                mobileMenu.classList.remove('translate-x-full');
+            }, 10);
+            document.body.classList.add('overflow-hidden');
+        });
+
+        // Close mobile menu
+        mobileMenuClose.addEventListener('click', closeMenu);
+        mobileMenuOverlay.addEventListener('click', function (e) {
+            if (e.target === mobileMenuOverlay) {
+                closeMenu();
+            }
+        });
+
+        function closeMenu() {
+            mobileMenu.classList.add('translate-x-full');
+            setTimeout(() => {
+                mobileMenuOverlay.classList.add('hidden');
+            }, 300);
+            document.body.classList.remove('overflow-hidden');
+        }
+    }
+
+    // User dropdown toggle
+    const userDropdownToggle = document.getElementById('user-dropdown-toggle');
+    const userDropdownMenu = document.getElementById('user-dropdown-menu');
+    const userDropdownContainer = document.getElementById('user-dropdown-container');
+
+    if (userDropdownToggle && userDropdownMenu) {
+        // Toggle dropdown on click
+        userDropdownToggle.addEventListener('click', function (e) {
+            e.stopPropagation();
+            userDropdownMenu.classList.toggle('hidden');
+        });
+
+        // Close dropdown when clicking outside
+        document.addEventListener('click', function (e) {
+            if (!userDropdownContainer.contains(e.target)) {
+                userDropdownMenu.classList.add('hidden');
+            }
+        });
+    }
+
+    // Message auto-close
+    const messageCloseButtons = document.querySelectorAll('.message-close');
+
+    messageCloseButtons.forEach(button => {
+        button.addEventListener('click', function () {
+            const message = this.closest('.mb-3');
+            message.classList.add('opacity-0');
+            setTimeout(() => {
+                message.style.display = 'none';
+                // Using display:none instead of remove() to prevent potential issues
+                // message.remove();
+            }, 300);
+        });
+    });
+
+    // Auto-hide messages after 5 seconds
+    const messageElements = document.querySelectorAll('.fixed.top-20 .mb-3');
+
+    messageElements.forEach(message => {
+        setTimeout(() => {
+            message.classList.add('opacity-0');
+            setTimeout(() => {
+                message.style.display = 'none';
+                // Using display:none instead of remove() to prevent potential issues
+                // message.remove();
+            }, 300);
+        }, 5000);
+    });
+});
@@ -0,0 +1,55 @@
+/**
+ * Tailwind build for the site stylesheet (static/build/app.css).
+ *
+ * Only classes found in the files listed under `content` end up in the CSS,
+ * so classes built in Python (form widgets, template tags) must be written
+ * out in full there too. Run `python manage.py build_assets` after changing
+ * templates.
+ */
+module.exports = {
+    content: [
+        './templates/**/*.html',
+        './*/templates/**/*.html',
+        './*/forms.py',
+        './*/views.py',
+        './*/templatetags/*.py',
+        './static/js/**/*.js',
+    ],
+    theme: {
+        extend: {
+            colors: {
+                primary: {
+                    50: '#fdf2f8',
+                    100: '#fce7f3',
+                    200: '#fbcfe8',
+                    300: '#f9a8d4',
+                    400: '#f472b6',
+                    500: '#ec4899',
+                    600: '#db2777',
+                    700: '#be185d',
+                    800: '#9d174d',
+                    900: '#831843',
+                    950: '#500724',
+                },
+                secondary: {
+                    50: '#f8fafc',
+                    100: '#f1f5f9',
+                    200: '#e2e8f0',
+                    300: '#cbd5e1',
+                    400: '#94a3b8',
+                    500: '#64748b',
+                    600: '#475569',
+                    700: '#334155',
+                    800: '#1e293b',
+                    900: '#0f172a',
+                    950: '#020617',
+                },
+            },
+            fontFamily: {
+                sans: ['Poppins', 'sans-serif'],
+                serif: ['Playfair Display', 'serif'],
+            },
+        },
+    },
+    plugins: [],
+};
@@ -0,0 +1,27 @@
+"""Task, checklist and reminder resources of the JSON API (see core/api.py)"""
+from .models import Task, TaskComment, Checklist, ChecklistItem, Reminder
+from core import api
+
+api.register(
+    'tasks', Task, 'wedding',
+    ('wedding', 'title', 'description', 'assigned_to', 'created_by', 'due_date', 'priority', 'status',
+     'completion_date', 'created_at', 'updated_at'),
+    includes=(
+        api.Include('comments', TaskComment, 'task', ('user', 'comment', 'created_at')),
+        api.Include('reminders', Reminder, 'task', ('title', 'reminder_type', 'reminder_date', 'is_sent')),
+    ),
+)
+api.register(
+    'checklists', Checklist, 'wedding',
+    ('wedding', 'title', 'description', 'is_template', 'created_by', 'created_at', 'updated_at'),
+    includes=(
+        api.Include('items', ChecklistItem, 'checklist', (
+            'title', 'description', 'due_date', 'is_completed', 'completed_date', 'completed_by', 'updated_at',
+        )),
+    ),
+)
+api.register(
+    'reminders', Reminder, 'wedding',
+    ('wedding', 'title', 'description', 'reminder_type', 'reminder_date', 'task', 'checklist_item', 'is_sent',
+     'sent_date', 'created_at', 'updated_at'),
+)
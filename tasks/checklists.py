@@ -0,0 +1,170 @@
+"""
+Batched saving of checklist items
+
+Saving a formset item by item costs one query per item, which makes large
+checklists slow to save. These helpers work out which items were added,
+changed or removed and apply each group with a single bulk query inside one
+transaction.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .forms import ChecklistItemForm
+from .models import Checklist, ChecklistItem
+
+# Fields an inline editor may change, besides completion
+EDITABLE_FIELDS = list(ChecklistItemForm.Meta.fields)
+
+
+def apply_item_changes(checklist, created=(), updated=(), deleted_ids=(), fields=None):
+    """
+    Apply item changes to a checklist with one query per kind of change
+
+    Args:
+        checklist: Checklist object (must be saved)
+        created (list): New, unsaved ChecklistItem objects
+        updated (list): Existing ChecklistItem objects with changed attributes
+        deleted_ids (list): IDs of items to delete
+        fields (list): Fields to write for updated items (default: all editable fields)
+
+    Returns:
+        list: The created items, with primary keys where the database returns them
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if deleted_ids:
+            ChecklistItem.objects.filter(checklist=checklist, id__in=deleted_ids).delete()
+        if updated:
+            # bulk_update() does not apply auto_now, which delta sync relies on
+            for item in updated:
+                item.updated_at = now
+            ChecklistItem.objects.bulk_update(updated, [*(fields or EDITABLE_FIELDS), 'updated_at'], batch_size=500)
+        if created:
+            for item in created:
+                item.checklist = checklist
+            created = ChecklistItem.objects.bulk_create(created, batch_size=500)
+
+        # Deleted items leave no modification time behind; touching the
+        # checklist keeps conditional GETs of the checklist pages correct
+        if deleted_ids or updated or created:
+            Checklist.objects.filter(id=checklist.id).update(updated_at=now)
+
+    return list(created)
+
+
+def save_item_formset(formset, checklist):
+    """
+    Save a valid ChecklistItemFormSet with bulk queries
+
+    Unchanged forms and untouched extra forms are skipped entirely.
+
+    Args:
+        formset: Validated ChecklistItemFormSet
+        checklist: Saved Checklist the items belong to
+    """
+    formset.instance = checklist
+    # commit=False only collects the changes, without touching the database
+    formset.save(commit=False)
+
+    fields = set()
+    for _, changed_fields in formset.changed_objects:
+        fields.update(changed_fields)
+
+    apply_item_changes(
+        checklist,
+        created=formset.new_objects,
+        updated=[item for item, _ in formset.changed_objects],
+        deleted_ids=[item.id for item in formset.deleted_objects],
+        fields=sorted(fields & set(EDITABLE_FIELDS)) or None,
+    )
+
+
+def _set_completion(item, completed, user):
+    if completed and not item.is_completed:
+        item.is_completed = True
+        item.completed_date = timezone.now()
+        item.completed_by = user
+    elif not completed and item.is_completed:
+        item.is_completed = False
+        item.completed_date = None
+        item.completed_by = None
+
+
+def _item_form(data, item=None):
+    """Validate submitted item fields, merged into the item's current values"""
+    initial = {}
+    if item is not None:
+        initial = {field: getattr(item, field) for field in EDITABLE_FIELDS}
+        if isinstance(initial.get('due_date'), datetime.date):
+            initial['due_date'] = initial['due_date'].isoformat()
+    merged = {**initial, **{field: data[field] for field in EDITABLE_FIELDS if field in data}}
+    merged = {field: '' if value is None else value for field, value in merged.items()}
+    return ChecklistItemForm(merged, instance=item)
+
+
+def apply_item_payload(checklist, payload, user):
+    """
+    Validate and apply changes sent by the inline checklist editor
+
+    Args:
+        checklist: Checklist object
+        payload (dict): {"create": [{...}], "update": [{"id": ..., ...}], "delete": [ids]}
+            where items carry any of title, description, due_date and is_completed
+        user: User making the change (recorded on completed items)
+
+    Returns:
+        tuple: (result, errors). result lists created items and updated and
+        deleted IDs; errors maps "create.N"/"update.N" to form errors, in
+        which case nothing was saved.
+    """
+    errors = {}
+    created = []
+    updated = []
+    fields = set()
+
+    for position, data in enumerate(payload.get('create') or []):
+        form = _item_form(data)
+        if not form.is_valid():
+            errors[f"create.{position}"] = form.errors
+            continue
+        item = form.save(commit=False)
+        _set_completion(item, bool(data.get('is_completed')), user)
+        created.append(item)
+
+    changes = payload.get('update') or []
+    existing = ChecklistItem.objects.filter(checklist=checklist).in_bulk(
+        [data.get('id') for data in changes if isinstance(data.get('id'), int)]
+    )
+    for position, data in enumerate(changes):
+        item = existing.get(data.get('id'))
+        if item is None:
+            errors[f"update.{position}"] = {'id': ["Item not found in this checklist."]}
+            continue
+        form = _item_form(data, item)
+        if not form.is_valid():
+            errors[f"update.{position}"] = form.errors
+            continue
+        form.save(commit=False)
+        fields.update(form.changed_data)
+        if 'is_completed' in data:
+            _set_completion(item, bool(data['is_completed']), user)
+            fields.update(['is_completed', 'completed_date', 'completed_by'])
+        updated.append(item)
+
+    deleted_ids = [item_id for item_id in payload.get('delete') or [] if isinstance(item_id, int)]
+
+    if errors:
+        return None, errors
+
+    created = apply_item_changes(checklist, created, updated, deleted_ids, sorted(fields) or EDITABLE_FIELDS)
+
+    return {
+        'created': [
+            {'id': item.id, 'title': item.title, 'is_completed': item.is_completed}
+            for item in created
+        ],
+        'updated': [item.id for item in updated],
+        'deleted': deleted_ids,
+    }, None
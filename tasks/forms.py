@@ -1,5 +1,5 @@
 from django import forms
-from django.forms import inlineformset_factory
+from django.forms import inlineformset_factory, BaseInlineFormSet
 from .models import Checklist, ChecklistItem
 
 class ChecklistForm(forms.ModelForm):
@@ -64,11 +64,38 @@ class ChecklistItemForm(forms.ModelForm):
             'due_date': forms.DateInput(attrs={'class': 'w-full rounded-md border-gray-300 shadow-sm focus:border-primary-300 focus:ring focus:ring-primary-200 focus:ring-opacity-50', 'type': 'date'}),
         }
 
+class ExistingItemField(forms.ModelChoiceField):
+    """Hidden item ID field that looks items up in the formset's queryset, loaded once"""
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            item = self.formset._existing_object(int(value))
+        except (TypeError, ValueError):
+            item = None
+        if item is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return item
+
+class BaseChecklistItemFormSet(BaseInlineFormSet):
+    """Item formset that validates item IDs without a query per form"""
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        field = form.fields['id']
+        form.fields['id'] = ExistingItemField(
+            self, field.queryset, initial=field.initial, required=False, widget=field.widget
+        )
+
 # Create a formset for checklist items
 ChecklistItemFormSet = inlineformset_factory(
     Checklist,
     ChecklistItem,
     form=ChecklistItemForm,
+    formset=BaseChecklistItemFormSet,
     extra=3,
     can_delete=True
 )
@@ -32,6 +32,10 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Delta sync reads a wedding's rows changed since a point in time
+        indexes = [models.Index(fields=['wedding', 'updated_at'])]
+
     def __str__(self):
         return f"{self.title} - {self.wedding}"
 
@@ -90,6 +94,10 @@ class ChecklistItem(models.Model):
     completed_date = models.DateTimeField(blank=True, null=True)
     completed_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='completed_checklist_items', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['checklist', 'updated_at'])]
 
     def __str__(self):
         return f"{self.title} - {self.checklist}"
@@ -119,6 +127,10 @@ class Reminder(models.Model):
     is_sent = models.BooleanField(default=False)
     sent_date = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['wedding', 'updated_at'])]
 
     def __str__(self):
         return f"{self.title} - {self.wedding}"
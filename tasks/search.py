@@ -0,0 +1,26 @@
+"""Task and task comment documents of the search index (see core/search.py)"""
+from django.urls import reverse
+
+from .models import Task, TaskComment
+from core import search
+
+def _task_document(task):
+    return {
+        'wedding_id': task.wedding_id,
+        'title': task.title,
+        'body': [task.description],
+        'url': reverse('task_detail', args=[task.id]),
+        'staff_only': True,
+    }
+
+def _comment_document(comment):
+    return {
+        'wedding_id': comment.task.wedding_id,
+        'title': comment.task.title,
+        'body': [comment.comment],
+        'url': reverse('task_detail', args=[comment.task_id]),
+        'staff_only': True,
+    }
+
+search.register('task', 2, Task, 'wedding', ('title', 'description'), _task_document)
+search.register('comment', 3, TaskComment, 'task__wedding', ('comment',), _comment_document, related=('task',))
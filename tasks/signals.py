@@ -0,0 +1,26 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Task, TaskComment, Checklist, ChecklistItem, Reminder
+from .sync import forget_checklist_wedding
+from core import search, sync
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=TaskComment)
+def index_task(sender, instance, **kwargs):
+    search.index_object(instance)
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskComment)
+def unindex_task(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+@receiver([post_save, post_delete], sender=Checklist)
+def forget_checklist(sender, instance, **kwargs):
+    forget_checklist_wedding(instance.id)
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=ChecklistItem)
+@receiver(post_delete, sender=Reminder)
+def record_task_deletion(sender, instance, origin=None, **kwargs):
+    sync.record_deletion(instance, origin)
@@ -0,0 +1,65 @@
+"""Tasks, checklist items and reminders in delta sync (see core/sync.py)"""
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task, Checklist, ChecklistItem, Reminder
+from core import sync
+
+def _wedding_users(wedding):
+    """Users a wedding's tasks can be assigned to"""
+    return User.objects.filter(Q(wedding_teams__wedding=wedding) | Q(administered_weddings=wedding)).distinct()
+
+def _prepare_task(task, changed, user):
+    if task._state.adding:
+        task.created_by = user
+    if 'status' in changed:
+        task.completion_date = timezone.now() if task.status == 'completed' else None
+
+def _prepare_checklist_item(item, changed, user):
+    if 'is_completed' in changed:
+        item.completed_date = timezone.now() if item.is_completed else None
+        item.completed_by = user if item.is_completed else None
+
+# Wedding of each checklist, so deleting many items does not query it per item
+_checklist_weddings = {}
+
+def _checklist_item_wedding(item):
+    if ChecklistItem.checklist.is_cached(item):
+        return item.checklist.wedding_id
+    if item.checklist_id not in _checklist_weddings:
+        if len(_checklist_weddings) > 10000:
+            _checklist_weddings.clear()
+        _checklist_weddings[item.checklist_id] = (
+            Checklist.objects.filter(id=item.checklist_id).values_list('wedding_id', flat=True).first()
+        )
+    return _checklist_weddings[item.checklist_id]
+
+def forget_checklist_wedding(checklist_id):
+    """Drop the remembered wedding of a checklist that changed or was deleted"""
+    _checklist_weddings.pop(checklist_id, None)
+
+sync.register(
+    'task', Task, 'wedding',
+    ('title', 'description', 'assigned_to', 'created_by', 'due_date', 'priority', 'status', 'completion_date'),
+    writable=('title', 'description', 'assigned_to', 'due_date', 'priority', 'status'),
+    choices={'assigned_to': _wedding_users},
+    prepare=_prepare_task,
+)
+sync.register(
+    'checklist_item', ChecklistItem, 'checklist__wedding',
+    ('checklist', 'title', 'description', 'due_date', 'is_completed', 'completed_date', 'completed_by'),
+    writable=('checklist', 'title', 'description', 'due_date', 'is_completed'),
+    choices={'checklist': lambda wedding: Checklist.objects.filter(wedding=wedding)},
+    prepare=_prepare_checklist_item,
+    wedding_of=_checklist_item_wedding,
+)
+sync.register(
+    'reminder', Reminder, 'wedding',
+    ('title', 'description', 'reminder_type', 'reminder_date', 'task', 'checklist_item', 'is_sent', 'sent_date'),
+    writable=('title', 'description', 'reminder_type', 'reminder_date', 'task', 'checklist_item'),
+    choices={
+        'task': lambda wedding: Task.objects.filter(wedding=wedding),
+        'checklist_item': lambda wedding: ChecklistItem.objects.filter(checklist__wedding=wedding),
+    },
+)
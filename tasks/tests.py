@@ -1,3 +1,129 @@
-from django.test import TestCase
+import datetime
+import json
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.testing import WeddingTestCase
+from tasks.checklists import apply_item_changes, apply_item_payload
+from tasks.models import Checklist, ChecklistItem
+
+
+class ChecklistConditionalGetTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checklist = Checklist.objects.create(title='Venue', wedding=self.wedding, created_by=self.admin)
+        self.item = ChecklistItem.objects.create(checklist=self.checklist, title='Book the hall')
+
+    def etag(self, url):
+        # The first request sets the CSRF cookie, which is part of the ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def sync_rename(self, title):
+        response = self.client.post('/api/sync/', json.dumps({'mutations': [{
+            'id': f'rename-{title}', 'type': 'checklist_item', 'op': 'update',
+            'object_id': self.item.id, 'data': {'title': title},
+        }]}), content_type='application/json')
+        self.assertEqual(response.json()['mutations'][0]['status'], 'applied')
+
+    def test_item_edit_changes_detail_page(self):
+        url = f'/tasks/checklist/{self.checklist.id}/'
+        etag = self.etag(url)
+        self.sync_rename('Hall booked')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Hall booked')
+
+    def test_item_edit_changes_list_page(self):
+        url = '/tasks/checklist/'
+        etag = self.etag(url)
+        self.sync_rename('Hall booked')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ChecklistItemChangeTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checklist = Checklist.objects.create(title='Venue', wedding=self.wedding, created_by=self.admin)
+        self.hall = ChecklistItem.objects.create(checklist=self.checklist, title='Book the hall')
+        self.band = ChecklistItem.objects.create(checklist=self.checklist, title='Book the band')
+        other = Checklist.objects.create(title='Other', wedding=self.wedding, created_by=self.admin)
+        self.other_item = ChecklistItem.objects.create(checklist=other, title='Not mine')
+
+    def test_changes_are_applied_in_bulk(self):
+        checklist_updated = self.checklist.updated_at
+        hall_updated = self.hall.updated_at
+        self.hall.title = 'Hall booked'
+
+        with CaptureQueriesContext(connection) as queries:
+            created = apply_item_changes(
+                self.checklist,
+                created=[ChecklistItem(title='Flowers'), ChecklistItem(title='Cake')],
+                updated=[self.hall],
+                deleted_ids=[self.band.id, self.other_item.id],
+                fields=['title'],
+            )
+
+        # One statement per kind of change, however many items it covers
+        item_writes = [
+            query['sql'].split()[0] for query in queries
+            if query['sql'].startswith(('INSERT INTO "tasks_checklistitem"', 'UPDATE "tasks_checklistitem"'))
+        ]
+        self.assertEqual(item_writes, ['UPDATE', 'INSERT'])
+
+        self.assertEqual(sorted(self.checklist.items.values_list('title', flat=True)), ['Cake', 'Flowers', 'Hall booked'])
+        self.assertEqual({item.checklist_id for item in created}, {self.checklist.id})
+        self.assertTrue(ChecklistItem.objects.filter(id=self.other_item.id).exists())
+        self.hall.refresh_from_db()
+        self.checklist.refresh_from_db()
+        self.assertGreater(self.hall.updated_at, hall_updated)
+        self.assertGreater(self.checklist.updated_at, checklist_updated)
+
+    def test_payload_is_applied(self):
+        result, errors = apply_item_payload(self.checklist, {
+            'create': [{'title': 'Flowers', 'due_date': '2030-05-01', 'is_completed': True}],
+            'update': [{'id': self.hall.id, 'is_completed': True}, {'id': self.band.id, 'description': 'Jazz'}],
+            'delete': [],
+        }, self.admin)
+
+        self.assertIsNone(errors)
+        flowers = ChecklistItem.objects.get(title='Flowers')
+        self.assertEqual(result, {
+            'created': [{'id': flowers.id, 'title': 'Flowers', 'is_completed': True}],
+            'updated': [self.hall.id, self.band.id],
+            'deleted': [],
+        })
+        self.assertEqual((flowers.due_date, flowers.completed_by), (datetime.date(2030, 5, 1), self.admin))
+        self.hall.refresh_from_db()
+        self.assertEqual((self.hall.title, self.hall.is_completed, self.hall.completed_by), ('Book the hall', True, self.admin))
+        self.assertIsNotNone(self.hall.completed_date)
+        self.band.refresh_from_db()
+        self.assertEqual((self.band.title, self.band.description), ('Book the band', 'Jazz'))
+
+    def test_invalid_payload_saves_nothing(self):
+        result, errors = apply_item_payload(self.checklist, {
+            'create': [{'title': 'Flowers'}, {'title': ''}],
+            'update': [{'id': self.other_item.id, 'title': 'Mine now'}, {'id': self.hall.id, 'due_date': 'soon'}],
+            'delete': [self.band.id],
+        }, self.admin)
+
+        self.assertIsNone(result)
+        self.assertEqual(set(errors), {'create.1', 'update.0', 'update.1'})
+        self.assertEqual(ChecklistItem.objects.count(), 3)
+        self.assertEqual(ChecklistItem.objects.get(id=self.other_item.id).title, 'Not mine')
+
+    def test_items_api(self):
+        url = reverse('checklist_items_api', args=[self.checklist.id])
+        response = self.client.post(url, json.dumps({'delete': [self.band.id]}), content_type='application/json')
+        self.assertEqual(response.json(), {'status': 'success', 'created': [], 'updated': [], 'deleted': [self.band.id]})
+        self.assertFalse(ChecklistItem.objects.filter(id=self.band.id).exists())
+
+        response = self.client.post(url, json.dumps({'create': [{}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('create.0', response.json()['errors'])
@@ -15,6 +15,7 @@ urlpatterns = [
     path('checklist/create/', views.checklist_create, name='checklist_create'),
     path('checklist/<int:checklist_id>/', views.checklist_detail, name='checklist_detail'),
     path('checklist/<int:checklist_id>/edit/', views.checklist_edit, name='checklist_edit'),
+    path('checklist/<int:checklist_id>/items/', views.checklist_items_api, name='checklist_items_api'),
     path('checklist/<int:checklist_id>/delete/', views.checklist_delete, name='checklist_delete'),
     path('checklist/item/<int:item_id>/toggle/', views.checklist_item_toggle, name='checklist_item_toggle'),
     path('checklist/template/<int:template_id>/use/', views.use_template, name='use_template'),
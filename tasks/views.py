@@ -3,12 +3,89 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponseForbidden, JsonResponse
 from django.db import transaction
+from django.db.models import Count, Max, Q
+import json
 
 from .models import Task, TaskComment, Checklist, ChecklistItem, Reminder
 from .forms import ChecklistForm, ChecklistItemFormSet
+from .checklists import save_item_formset, apply_item_payload
 from weddings.models import Wedding
+from core.http import conditional_page, subquery_aggregate, latest
+
+def _user_scope(request, queryset):
+    """Restrict a queryset of wedding-owned rows the same way the list views do"""
+    user = request.user
+    wedding_id = request.GET.get('wedding')
+
+    if wedding_id:
+        return queryset.filter(wedding_id=wedding_id)
+    if user.profile.role == 'admin':
+        return queryset.filter(wedding__admin=user)
+    if user.profile.role == 'team_member':
+        return queryset.filter(wedding__team_members__member=user)
+    return queryset.none()
+
+def _task_list_state(request):
+    """Newest change and size of the task list shown to the user"""
+    # The list also shows wedding titles and assignee names, so include their changes
+    state = _user_scope(request, Task.objects.all()).aggregate(
+        tasks_modified=Max('updated_at'),
+        weddings_modified=Max('wedding__updated_at'),
+        count=Count('id', distinct=True),
+    )
+    last_modified = latest(state['tasks_modified'], state['weddings_modified'])
+    return last_modified, (request.user.profile.role, request.GET.get('wedding'), state['count'])
+
+def _task_detail_state(request, task_id):
+    """Newest change of a task, its wedding and its comments, in one query"""
+    state = Task.objects.filter(id=task_id).annotate(
+        comments_modified=subquery_aggregate(TaskComment.objects.all(), 'task', Max('created_at')),
+        comments_count=subquery_aggregate(TaskComment.objects.all(), 'task', Count('id')),
+    ).values('updated_at', 'wedding__updated_at', 'comments_modified', 'comments_count').first()
+
+    if state is None:
+        return None
+
+    last_modified = latest(state['updated_at'], state['wedding__updated_at'], state['comments_modified'])
+    return last_modified, (state['comments_count'],)
+
+def _checklist_list_state(request):
+    """Newest change of the checklists, templates and items shown to the user"""
+    user = request.user
+    checklists = _user_scope(request, Checklist.objects.all())
+    if user.profile.role == 'admin' and not request.GET.get('wedding'):
+        checklists = checklists | Checklist.objects.filter(is_template=True)
+
+    # Item counts and completion are shown, so track item changes too
+    state = checklists.aggregate(
+        checklists_modified=Max('updated_at'),
+        items_modified=Max('items__updated_at'),
+        count=Count('id', distinct=True),
+        items_count=Count('items', distinct=True),
+        completed_count=Count('items', filter=Q(items__is_completed=True), distinct=True),
+    )
+    last_modified = latest(state['checklists_modified'], state['items_modified'])
+    return last_modified, (
+        user.profile.role, request.GET.get('wedding'),
+        state['count'], state['items_count'], state['completed_count'],
+    )
+
+def _checklist_detail_state(request, checklist_id):
+    """Newest change of a checklist and its items, in one query"""
+    state = Checklist.objects.filter(id=checklist_id).annotate(
+        items_modified=subquery_aggregate(ChecklistItem.objects.all(), 'checklist', Max('updated_at')),
+        items_count=subquery_aggregate(ChecklistItem.objects.all(), 'checklist', Count('id')),
+        completed_count=subquery_aggregate(ChecklistItem.objects.filter(is_completed=True), 'checklist', Count('id')),
+    ).values('updated_at', 'items_modified', 'items_count', 'completed_count').first()
+
+    if state is None:
+        return None
+
+    last_modified = latest(state['updated_at'], state['items_modified'])
+    return last_modified, (state['items_count'], state['completed_count'])
 
 @login_required
+@conditional_page(_task_list_state)
 def task_list(request):
     """List all tasks the user has access to"""
     user = request.user
@@ -50,6 +127,7 @@ def task_list(request):
     return render(request, 'tasks/task_list.html', context)
 
 @login_required
+@conditional_page(_task_detail_state)
 def task_detail(request, task_id):
     """View task details"""
     task = get_object_or_404(Task, id=task_id)
@@ -245,6 +323,7 @@ def task_complete(request, task_id):
     return redirect(request.META.get('HTTP_REFERER', 'task_list'))
 
 @login_required
+@conditional_page(_checklist_list_state)
 def checklist(request):
     """View and manage checklists"""
     user = request.user
@@ -334,6 +413,7 @@ def reminders(request):
     return render(request, 'tasks/reminders.html', context)
 
 @login_required
+@conditional_page(_checklist_detail_state)
 def checklist_detail(request, checklist_id):
     """View checklist details"""
     checklist = get_object_or_404(Checklist, id=checklist_id)
@@ -387,16 +467,11 @@ def checklist_create(request):
         form = ChecklistForm(request.POST, user=request.user)
         formset = ChecklistItemFormSet(request.POST)
 
-        print(f"Form valid: {form.is_valid()}")
-        print(f"Formset valid: {formset.is_valid()}")
-
-        if not form.is_valid():
-            print(f"Form errors: {form.errors}")
+        # Validate both so the page shows every error at once
+        form_valid = form.is_valid()
+        formset_valid = formset.is_valid()
 
-        if not formset.is_valid():
-            print(f"Formset errors: {formset.errors}")
-
-        if form.is_valid() and formset.is_valid():
+        if form_valid and formset_valid:
             try:
                 with transaction.atomic():
                     # Save checklist
@@ -408,18 +483,15 @@ def checklist_create(request):
                         checklist.wedding = None
 
                     checklist.save()
-                    print(f"Checklist saved: {checklist.id} - {checklist.title}")
 
-                    # Save checklist items
-                    formset.instance = checklist
-                    formset.save()
-                    print(f"Formset saved with {formset.total_form_count()} items")
+                    # Save checklist items in bulk
+                    save_item_formset(formset, checklist)
 
                 messages.success(request, f"Checklist '{checklist.title}' created successfully.")
+                return redirect('checklist_detail', checklist_id=checklist.id)
             except Exception as e:
                 print(f"Error saving checklist: {str(e)}")
                 messages.error(request, f"Error creating checklist: {str(e)}")
-            return redirect('checklist_detail', checklist_id=checklist.id)
     else:
         initial = {}
         if wedding:
@@ -458,37 +530,27 @@ def checklist_edit(request, checklist_id):
         form = ChecklistForm(request.POST, instance=checklist, user=request.user)
         formset = ChecklistItemFormSet(request.POST, instance=checklist)
 
-        print(f"Edit form valid: {form.is_valid()}")
-        print(f"Edit formset valid: {formset.is_valid()}")
-
-        if not form.is_valid():
-            print(f"Edit form errors: {form.errors}")
+        # Validate both so the page shows every error at once
+        form_valid = form.is_valid()
+        formset_valid = formset.is_valid()
 
-        if not formset.is_valid():
-            print(f"Edit formset errors: {formset.errors}")
-
-        if form.is_valid() and formset.is_valid():
+        if form_valid and formset_valid:
             try:
                 with transaction.atomic():
-                    # Save checklist
-                    checklist = form.save()
-                    print(f"Checklist updated: {checklist.id} - {checklist.title}")
-
-                    # If it's a template, set wedding to None
+                    # Save checklist; templates never belong to a wedding
+                    checklist = form.save(commit=False)
                     if checklist.is_template:
                         checklist.wedding = None
-                        checklist.save()
-                        print("Set wedding to None for template")
+                    checklist.save()
 
-                    # Save checklist items
-                    formset.save()
-                    print(f"Formset updated with {formset.total_form_count()} items")
+                    # Save only the added, changed and removed items, in bulk
+                    save_item_formset(formset, checklist)
 
                 messages.success(request, f"Checklist '{checklist.title}' updated successfully.")
+                return redirect('checklist_detail', checklist_id=checklist.id)
             except Exception as e:
                 print(f"Error updating checklist: {str(e)}")
                 messages.error(request, f"Error updating checklist: {str(e)}")
-            return redirect('checklist_detail', checklist_id=checklist.id)
     else:
         form = ChecklistForm(instance=checklist, user=request.user)
         formset = ChecklistItemFormSet(instance=checklist)
@@ -501,6 +563,40 @@ def checklist_edit(request, checklist_id):
 
     return render(request, 'tasks/checklist_form.html', context)
 
+@login_required
+def checklist_items_api(request, checklist_id):
+    """Apply the item changes sent by the inline checklist editor (JSON)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method is allowed'}, status=405)
+
+    checklist = get_object_or_404(Checklist.objects.select_related('wedding'), id=checklist_id)
+    user = request.user
+
+    # Check if user has permission
+    has_permission = False
+    if checklist.is_template and user.profile.role == 'admin':
+        has_permission = True
+    elif user.profile.role == 'admin' and checklist.wedding and checklist.wedding.admin == user:
+        has_permission = True
+    elif user.profile.role == 'team_member' and checklist.wedding and checklist.wedding.team_members.filter(member=user).exists():
+        has_permission = True
+
+    if not has_permission:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'status': 'error', 'message': 'Expected a JSON object'}, status=400)
+
+    result, errors = apply_item_payload(checklist, payload, user)
+    if errors:
+        return JsonResponse({'status': 'error', 'errors': errors}, status=400)
+
+    return JsonResponse({'status': 'success', **result})
+
 @login_required
 def checklist_delete(request, checklist_id):
     """Delete a checklist"""
@@ -653,14 +749,16 @@ def use_template(request, template_id):
             )
 
             # Copy template items
-            for item in template.items.all():
-                ChecklistItem.objects.create(
+            ChecklistItem.objects.bulk_create([
+                ChecklistItem(
                     checklist=new_checklist,
                     title=item.title,
                     description=item.description,
                     due_date=None,  # User will need to set due dates
                     is_completed=False
                 )
+                for item in template.items.all()
+            ])
 
         messages.success(request, f"Checklist '{new_checklist.title}' created from template successfully.")
         return redirect('checklist_detail', checklist_id=new_checklist.id)
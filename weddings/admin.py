@@ -14,6 +14,8 @@ class WeddingAdmin(admin.ModelAdmin):
     list_display = ('title', 'bride_name', 'groom_name', 'date', 'status', 'admin')
     list_filter = ('status', 'date', 'created_at')
     search_fields = ('title', 'bride_name', 'groom_name', 'location')
+    # Also orders the wedding autocomplete used by the guest and media admins
+    ordering = ('-date',)
     date_hierarchy = 'date'
     inlines = [WeddingTeamInline, WeddingEventInline]
 
@@ -0,0 +1,17 @@
+"""Wedding and event resources of the JSON API (see core/api.py)"""
+from .models import Wedding, WeddingTeam, WeddingEvent
+from core import api
+
+EVENT_FIELDS = ('wedding', 'name', 'description', 'date', 'start_time', 'end_time', 'location', 'address',
+                'created_at', 'updated_at')
+
+api.register(
+    'weddings', Wedding, 'id',
+    ('title', 'description', 'bride_name', 'groom_name', 'date', 'time', 'location', 'address', 'status',
+     'admin', 'created_at', 'updated_at'),
+    includes=(
+        api.Include('events', WeddingEvent, 'wedding', EVENT_FIELDS[1:]),
+        api.Include('team', WeddingTeam, 'wedding', ('member', 'role', 'created_at')),
+    ),
+)
+api.register('events', WeddingEvent, 'wedding', EVENT_FIELDS)
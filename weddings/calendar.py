@@ -0,0 +1,258 @@
+"""
+iCalendar (.ics) subscription feeds
+
+Team members and guests subscribe to a feed URL in their calendar app instead
+of copying event details by hand. There are two kinds of feed:
+
+- a personal feed with the events of every wedding the user belongs to and
+  their tasks (admins: all open tasks of their weddings, team members: the
+  open tasks assigned to them, guests: none);
+- a wedding feed with one wedding's events, and all of its open tasks for
+  the wedding's admin and team.
+
+Calendar apps cannot log in, so feeds are addressed by a signed token naming
+the user and wedding. The token also carries a fingerprint of the user's
+password hash, so changing the password revokes every feed URL handed out.
+
+Calendar apps poll every few minutes. Each poll only runs the cheap state()
+aggregates over ``updated_at``; unchanged feeds are answered with
+``304 Not Modified`` and changed ones are rendered once and then served from
+the cache until the rows change again.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+
+from .models import Wedding, WeddingEvent
+
+SALT = 'wms.calendar'
+
+# How long a rendered feed stays cached (seconds); entries are keyed by the
+# feed's state, so this only bounds how long unused feeds take up space
+FEED_CACHE_TIMEOUT = getattr(settings, 'CALENDAR_FEED_CACHE_TIMEOUT', 60 * 60 * 24)
+
+OPEN_TASK_STATUSES = ('pending', 'in_progress')
+
+
+def _password_fingerprint(user):
+    return salted_hmac(SALT, user.password).hexdigest()[:12]
+
+
+def feed_token(user, wedding_id=None):
+    """
+    Build the token of a user's calendar feed
+
+    Args:
+        user: User the feed is for
+        wedding_id (int): Wedding of a wedding feed, None for the personal feed
+
+    Returns:
+        str: URL-safe signed token
+    """
+    return signing.Signer(salt=SALT).sign_object([user.pk, wedding_id, _password_fingerprint(user)], compress=True)
+
+
+def feed_url(request, wedding_id=None):
+    """Absolute URL of the requesting user's personal or wedding feed"""
+    return request.build_absolute_uri(reverse('calendar_feed', args=[feed_token(request.user, wedding_id)]))
+
+
+def read_token(token):
+    """
+    Check a feed token
+
+    Returns:
+        tuple: (user, wedding_id), or None if the token is invalid or revoked
+    """
+    from django.contrib.auth.models import User
+
+    try:
+        user_id, wedding_id, fingerprint = signing.Signer(salt=SALT).unsign_object(token)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+    user = User.objects.select_related('profile').filter(pk=user_id, is_active=True).first()
+    if user is None or fingerprint != _password_fingerprint(user):
+        return None
+    return user, wedding_id
+
+
+def _wedding_ids(user, wedding_id=None):
+    """Weddings whose events the user's feed shows"""
+    role = user.profile.role
+    if role == 'admin':
+        weddings = Wedding.objects.filter(admin=user)
+    elif role == 'team_member':
+        weddings = Wedding.objects.filter(team_members__member=user)
+    else:
+        weddings = Wedding.objects.filter(guests__user=user)
+    if wedding_id is not None:
+        weddings = weddings.filter(id=wedding_id)
+    return weddings
+
+
+def _tasks(user, wedding_ids, wedding_id=None):
+    """Open tasks the user's feed shows"""
+    from tasks.models import Task
+
+    role = user.profile.role
+    tasks = Task.objects.filter(wedding_id__in=wedding_ids, status__in=OPEN_TASK_STATUSES)
+    if role == 'guest':
+        return tasks.none()
+    if role == 'team_member' and wedding_id is None:
+        tasks = tasks.filter(assigned_to=user)
+    return tasks
+
+
+def feed_state(user, wedding_id=None):
+    """
+    Summarize everything a feed shows in three small queries
+
+    Returns:
+        tuple: (last_modified, parts) where parts changes whenever a row is
+        added, changed or removed, or None if the user may not see the wedding
+    """
+    weddings = list(_wedding_ids(user, wedding_id).values_list('id', 'updated_at').distinct().order_by('id'))
+    if wedding_id is not None and not weddings:
+        return None
+    wedding_ids = [wedding for wedding, _ in weddings]
+
+    events = WeddingEvent.objects.filter(wedding_id__in=wedding_ids).aggregate(
+        modified=Max('updated_at'), count=Count('id'),
+    )
+    tasks = _tasks(user, wedding_ids, wedding_id).aggregate(modified=Max('updated_at'), count=Count('id'))
+
+    last_modified = max(
+        [modified for modified in (events['modified'], tasks['modified']) if modified is not None]
+        + [updated_at for _, updated_at in weddings],
+        default=None,
+    )
+    return last_modified, (tuple(wedding_ids), events['count'], tasks['count'])
+
+
+def feed_etag(user, wedding_id, state):
+    """ETag of a feed in the given state"""
+    last_modified, parts = state
+    payload = repr((user.pk, user.profile.role, wedding_id, last_modified, parts))
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _escape(text):
+    return (
+        str(text or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Fold a content line into 75-octet pieces (RFC 5545, 3.1)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    pieces = []
+    while encoded:
+        size = 75 if not pieces else 74
+        # Never split a multi-byte character
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        pieces.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return '\r\n '.join(pieces)
+
+
+def _stamp(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event_lines(event, wedding_title, domain):
+    start, end = WeddingEvent.span(event['date'], event['start_time'], event['end_time'])
+    location = ', '.join(part for part in (event['location'], event['address']) if part)
+    # Times are floating: they are local to the wedding, wherever the
+    # subscriber happens to be
+    return [
+        'BEGIN:VEVENT',
+        f"UID:event-{event['id']}@{domain}",
+        f"DTSTAMP:{_stamp(event['updated_at'])}",
+        f"LAST-MODIFIED:{_stamp(event['updated_at'])}",
+        f"DTSTART:{start:%Y%m%dT%H%M%S}",
+        f"DTEND:{end:%Y%m%dT%H%M%S}",
+        f"SUMMARY:{_escape(event['name'])} ({_escape(wedding_title)})",
+        f"LOCATION:{_escape(location)}",
+        f"DESCRIPTION:{_escape(event['description'])}",
+        'END:VEVENT',
+    ]
+
+
+def _task_lines(task, wedding_title, domain):
+    return [
+        'BEGIN:VEVENT',
+        f"UID:task-{task['id']}@{domain}",
+        f"DTSTAMP:{_stamp(task['updated_at'])}",
+        f"LAST-MODIFIED:{_stamp(task['updated_at'])}",
+        f"DTSTART;VALUE=DATE:{task['due_date']:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{task['due_date'] + datetime.timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_escape('Due: ' + task['title'])} ({_escape(wedding_title)})",
+        f"DESCRIPTION:{_escape(task['description'])}",
+        'TRANSP:TRANSPARENT',
+        'END:VEVENT',
+    ]
+
+
+def render_feed(user, wedding_id, domain):
+    """
+    Render a feed as iCalendar text
+
+    Args:
+        user: User the feed is for
+        wedding_id (int): Wedding of a wedding feed, None for the personal feed
+        domain (str): Host name used in event UIDs
+
+    Returns:
+        str: Calendar with CRLF line endings
+    """
+    titles = dict(_wedding_ids(user, wedding_id).values_list('id', 'title').distinct())
+    name = titles.get(wedding_id, 'Wedding') if wedding_id is not None else 'My weddings'
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Wedding Management System//Calendar//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{_escape(name)}",
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+    ]
+    events = WeddingEvent.objects.filter(wedding_id__in=titles).order_by('date', 'start_time').values(
+        'id', 'wedding_id', 'name', 'description', 'date', 'start_time', 'end_time', 'location', 'address',
+        'updated_at',
+    )
+    for event in events:
+        lines += _event_lines(event, titles[event['wedding_id']], domain)
+    tasks = _tasks(user, list(titles), wedding_id).order_by('due_date').values(
+        'id', 'wedding_id', 'title', 'description', 'due_date', 'updated_at',
+    )
+    for task in tasks:
+        lines += _task_lines(task, titles[task['wedding_id']], domain)
+    lines.append('END:VCALENDAR')
+
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def cached_feed(user, wedding_id, domain, etag):
+    """The rendered feed for a state, rendered only when the state is new"""
+    key = f"calendar_feed:{etag}:{domain}"
+    body = cache.get(key)
+    if body is None:
+        body = render_feed(user, wedding_id, domain)
+        cache.set(key, body, FEED_CACHE_TIMEOUT)
+    return body
@@ -0,0 +1,204 @@
+"""
+Schedule conflicts of team members across weddings
+
+A team member (photographer, DJ, ...) works every event of the weddings
+they are on. They are double-booked when events of two different weddings
+overlap in time.
+
+Events are turned into [start, end) datetime intervals (an event whose end
+time is before its start time runs past midnight) and put in an
+IntervalIndex: intervals sorted by start, searched with bisect. Because no
+event lasts longer than the longest interval in the index, an overlap query
+only scans the few intervals that start shortly before the queried end, so
+checking one event against thousands takes microseconds. Only events in the
+date range being checked are loaded.
+"""
+import bisect
+import datetime
+from collections import defaultdict, namedtuple
+
+from .models import WeddingEvent, WeddingTeam
+
+# Events can run past midnight, so date ranges are widened by this much
+_SPILL = datetime.timedelta(days=1)
+
+Slot = namedtuple('Slot', 'event_id wedding_id wedding_title name start end')
+Conflict = namedtuple('Conflict', 'member_id event other')
+
+_EVENT_FIELDS = ('id', 'wedding_id', 'wedding__title', 'name', 'date', 'start_time', 'end_time')
+
+
+def _slot(event_id, wedding_id, wedding_title, name, date, start_time, end_time):
+    start, end = WeddingEvent.span(date, start_time, end_time)
+    return Slot(event_id, wedding_id, wedding_title, name, start, end)
+
+
+def event_slot(event):
+    """The Slot of a (possibly unsaved) WeddingEvent"""
+    return _slot(event.pk, event.wedding_id, event.wedding.title, event.name, event.date, event.start_time, event.end_time)
+
+
+class IntervalIndex:
+    """Static index of slots answering "which slots overlap [start, end)?\""""
+
+    def __init__(self, slots):
+        self.slots = sorted(slots, key=lambda slot: slot.start)
+        self.starts = [slot.start for slot in self.slots]
+        self.longest = max((slot.end - slot.start for slot in self.slots), default=datetime.timedelta(0))
+
+    def overlapping(self, start, end):
+        """Slots that overlap [start, end)"""
+        result = []
+        # Slots starting at or after end cannot overlap; those starting more
+        # than `longest` before start have ended by then
+        i = bisect.bisect_left(self.starts, end) - 1
+        earliest = start - self.longest
+        while i >= 0 and self.starts[i] >= earliest:
+            if self.slots[i].end > start:
+                result.append(self.slots[i])
+            i -= 1
+        return result
+
+
+def _events(wedding_ids, date_from=None, date_to=None):
+    queryset = WeddingEvent.objects.filter(wedding_id__in=wedding_ids)
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from - _SPILL)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to + _SPILL)
+    return [_slot(*row) for row in queryset.values_list(*_EVENT_FIELDS)]
+
+
+def _weddings_by_member(member_ids):
+    weddings = defaultdict(set)
+    for member_id, wedding_id in WeddingTeam.objects.filter(member_id__in=member_ids).values_list('member_id', 'wedding_id'):
+        weddings[member_id].add(wedding_id)
+    return weddings
+
+
+def _check(member_weddings, slots, index, member_id):
+    """Conflicts of slots against the index for one member"""
+    conflicts = []
+    for slot in slots:
+        for other in index.overlapping(slot.start, slot.end):
+            if other.wedding_id != slot.wedding_id and other.wedding_id in member_weddings:
+                conflicts.append(Conflict(member_id, slot, other))
+    return conflicts
+
+
+def conflicts_for_event(event):
+    """
+    Conflicts the team of an event's wedding would have with it
+
+    Args:
+        event: WeddingEvent, saved or not, with its new date and times
+
+    Returns:
+        list: Conflict tuples (member_id, event slot, other event slot)
+    """
+    slot = event_slot(event)
+    members = list(WeddingTeam.objects.filter(wedding_id=event.wedding_id).values_list('member_id', flat=True))
+    weddings = _weddings_by_member(members)
+    other_weddings = set().union(*weddings.values()) - {event.wedding_id} if weddings else set()
+    if not other_weddings:
+        return []
+
+    index = IntervalIndex(_events(other_weddings, slot.start.date(), slot.end.date()))
+    conflicts = []
+    for member_id in members:
+        conflicts += _check(weddings[member_id], [slot], index, member_id)
+    return conflicts
+
+
+def conflicts_for_member(member_id, wedding_id):
+    """
+    Conflicts a person would have if they joined a wedding's team
+
+    Args:
+        member_id (int): User ID of the team member
+        wedding_id (int): Wedding they would join
+
+    Returns:
+        list: Conflict tuples; event is the joined wedding's event
+    """
+    slots = _events([wedding_id])
+    other_weddings = _weddings_by_member([member_id])[member_id] - {wedding_id}
+    if not slots or not other_weddings:
+        return []
+
+    index = IntervalIndex(_events(
+        other_weddings, min(slot.start for slot in slots).date(), max(slot.end for slot in slots).date(),
+    ))
+    return _check(other_weddings, slots, index, member_id)
+
+
+def find_conflicts(date_from=None, date_to=None, member_ids=None, wedding_id=None):
+    """
+    All double bookings of team members
+
+    Args:
+        date_from (date): Only events on or after this date
+        date_to (date): Only events on or before this date
+        member_ids (list): Only these team members (default: everyone)
+        wedding_id (int): Only conflicts involving this wedding
+
+    Returns:
+        list: Conflict tuples, each pair reported once
+    """
+    team = WeddingTeam.objects.all()
+    if member_ids is not None:
+        team = team.filter(member_id__in=member_ids)
+    if wedding_id is not None:
+        team = team.filter(member__wedding_teams__wedding_id=wedding_id)
+    weddings = defaultdict(set)
+    for member_id, member_wedding in team.values_list('member_id', 'wedding_id').distinct():
+        weddings[member_id].add(member_wedding)
+
+    # Only people on two or more weddings can be double-booked
+    weddings = {member_id: ids for member_id, ids in weddings.items() if len(ids) > 1}
+    if not weddings:
+        return []
+
+    slots = _events(set().union(*weddings.values()), date_from, date_to)
+    if date_from is not None:
+        slots = [slot for slot in slots if slot.end.date() >= date_from]
+    if date_to is not None:
+        slots = [slot for slot in slots if slot.start.date() <= date_to]
+    by_wedding = defaultdict(list)
+    for slot in slots:
+        by_wedding[slot.wedding_id].append(slot)
+
+    conflicts = []
+    for member_id, member_weddings in weddings.items():
+        member_slots = [slot for wedding in member_weddings for slot in by_wedding[wedding]]
+        index = IntervalIndex(member_slots)
+        for slot in member_slots:
+            if wedding_id is not None and slot.wedding_id != wedding_id:
+                continue
+            for other in index.overlapping(slot.start, slot.end):
+                # Report each pair once (or once per event of the given wedding)
+                if other.wedding_id != slot.wedding_id and (wedding_id is not None or slot.event_id < other.event_id):
+                    conflicts.append(Conflict(member_id, slot, other))
+    return conflicts
+
+
+def describe(conflicts):
+    """
+    Describe conflicts for people, e.g. in form errors
+
+    Returns:
+        list: One sentence per conflict
+    """
+    from django.contrib.auth.models import User
+
+    users = User.objects.in_bulk({conflict.member_id for conflict in conflicts})
+    lines = []
+    for conflict in conflicts:
+        user = users.get(conflict.member_id)
+        who = (user.get_full_name() or user.username) if user else "A team member"
+        other = conflict.other
+        lines.append(
+            f"{who} is also booked for {other.name} ({other.wedding_title}) "
+            f"on {other.start:%b %d}, {other.start:%H:%M}-{other.end:%H:%M}."
+        )
+    return lines
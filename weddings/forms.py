@@ -1,3 +1,6 @@
+import csv
+import io
+
 from django import forms
 from django.contrib.auth.models import User
 from django.core.validators import EmailValidator
@@ -76,3 +79,79 @@ class NewTeamMemberForm(forms.Form):
     last_name = forms.CharField(max_length=30, required=True)
     email = forms.EmailField(required=True, validators=[EmailValidator()])
     role = forms.ChoiceField(choices=WeddingTeamForm.ROLE_CHOICES, required=True)
+
+
+class TeamImportForm(forms.Form):
+    """Form for adding many new team members at once"""
+    rows = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 6}),
+        help_text="One person per line: first name, last name, email[, role]",
+    )
+    csv_file = forms.FileField(required=False, help_text="CSV file with the same columns")
+    role = forms.ChoiceField(choices=WeddingTeamForm.ROLE_CHOICES, help_text="Role for rows that do not name one")
+
+    MAX_ROWS = 500
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('rows') or ''
+        csv_file = cleaned_data.get('csv_file')
+        if csv_file:
+            try:
+                text += '\n' + csv_file.read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise forms.ValidationError("The CSV file must be UTF-8 encoded.")
+
+        people, errors = self._parse(text, cleaned_data.get('role'))
+        if errors:
+            raise forms.ValidationError(errors)
+        if not people:
+            raise forms.ValidationError("Enter at least one team member.")
+        if len(people) > self.MAX_ROWS:
+            raise forms.ValidationError(f"At most {self.MAX_ROWS} team members can be imported at once.")
+
+        cleaned_data['people'] = people
+        return cleaned_data
+
+    def _parse(self, text, default_role):
+        roles = dict(WeddingTeamForm.ROLE_CHOICES)
+        # Roles may be given by value ("dj") or label ("DJ/Music")
+        role_lookup = {value.lower(): value for value in roles}
+        role_lookup.update({label.lower(): value for value, label in roles.items()})
+        validate_email = EmailValidator()
+
+        people = []
+        errors = []
+        seen = set()
+        for line_number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+            row = [value.strip() for value in row]
+            if not any(row):
+                continue
+            # Skip a header row
+            if any(value.lower() in ('email', 'e-mail') for value in row):
+                continue
+            if len(row) < 3:
+                errors.append(f"Line {line_number}: expected first name, last name and email.")
+                continue
+
+            first_name, last_name, email = row[:3]
+            role = role_lookup.get(row[3].lower()) if len(row) > 3 and row[3] else default_role
+            try:
+                validate_email(email)
+            except forms.ValidationError:
+                errors.append(f"Line {line_number}: '{email}' is not a valid email address.")
+                continue
+            if role is None:
+                errors.append(f"Line {line_number}: unknown role '{row[3]}'.")
+                continue
+            if email.lower() in seen:
+                continue
+            seen.add(email.lower())
+            people.append({
+                'first_name': first_name[:30],
+                'last_name': last_name[:30],
+                'email': email,
+                'role': role,
+            })
+        return people, errors
@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from weddings.conflicts import describe, find_conflicts
+
+
+class Command(BaseCommand):
+    help = "List team members booked for overlapping events of different weddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat,
+                            help='First date to check, YYYY-MM-DD (default: today)')
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat,
+                            help='Last date to check, YYYY-MM-DD (default: no limit)')
+
+    def handle(self, *args, **options):
+        conflicts = find_conflicts(
+            date_from=options['date_from'] or timezone.now().date(),
+            date_to=options['date_to'],
+        )
+        for conflict, line in zip(conflicts, describe(conflicts)):
+            event = conflict.event
+            self.stdout.write(f"  ✗ {event.name} ({event.wedding_title}, {event.start:%Y-%m-%d %H:%M}): {line}")
+
+        if conflicts:
+            self.stdout.write(self.style.WARNING(f"{len(conflicts)} schedule conflicts found."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No schedule conflicts."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='weddingevent',
+            index=models.Index(fields=['wedding', 'updated_at'], name='weddings_we_wedding_e1062f_idx'),
+        ),
+    ]
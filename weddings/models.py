@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+import datetime
 import uuid
 
 class Wedding(models.Model):
@@ -81,6 +82,9 @@ class WeddingEvent(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['wedding', 'updated_at'])]
+
     def __str__(self):
         return f"{self.name} - {self.wedding}"
 
@@ -88,6 +92,32 @@ class WeddingEvent(models.Model):
     def is_upcoming(self):
         return self.date > timezone.now().date() or (self.date == timezone.now().date() and self.start_time > timezone.now().time())
 
+    @staticmethod
+    def span(date, start_time, end_time):
+        """
+        Start and end of an event as naive local datetimes
+
+        An event whose end time is not after its start time runs past
+        midnight and ends the next day. Takes the fields rather than an
+        instance so that code working on values() rows agrees with it.
+
+        Returns:
+            tuple: (start, end) datetimes
+        """
+        start = datetime.datetime.combine(date, start_time)
+        end = datetime.datetime.combine(date, end_time)
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        return start, end
+
+    @property
+    def start_datetime(self):
+        return self.span(self.date, self.start_time, self.end_time)[0]
+
+    @property
+    def end_datetime(self):
+        return self.span(self.date, self.start_time, self.end_time)[1]
+
 class WeddingTheme(models.Model):
     """Wedding theme and style information"""
     wedding = models.OneToOneField(Wedding, on_delete=models.CASCADE, related_name='theme')
@@ -0,0 +1,16 @@
+"""Wedding event documents of the search index (see core/search.py)"""
+from django.urls import reverse
+
+from .models import WeddingEvent
+from core import search
+
+def _event_document(event):
+    return {
+        'wedding_id': event.wedding_id,
+        'title': event.name,
+        'body': [event.description, event.location],
+        'url': reverse('wedding_detail', args=[event.wedding_id]),
+        'staff_only': False,
+    }
+
+search.register('event', 5, WeddingEvent, 'wedding', ('name', 'description', 'location'), _event_document)
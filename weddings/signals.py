@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Wedding, WeddingTeam, WeddingEvent, WeddingTheme
+from core import search, sync
+from core.cache import bump_wedding_cache_version
+
+@receiver([post_save, post_delete], sender=Wedding)
+def invalidate_wedding_cache(sender, instance, **kwargs):
+    """Drop cached data of a wedding when the wedding itself changes"""
+    bump_wedding_cache_version(instance.id)
+
+@receiver([post_save, post_delete], sender=WeddingTeam)
+@receiver([post_save, post_delete], sender=WeddingEvent)
+@receiver([post_save, post_delete], sender=WeddingTheme)
+def invalidate_wedding_cache_for_related(sender, instance, **kwargs):
+    """Drop cached data of a wedding when its team, events or theme change"""
+    bump_wedding_cache_version(instance.wedding_id)
+
+@receiver(post_save, sender=WeddingEvent)
+def index_event(sender, instance, **kwargs):
+    search.index_object(instance)
+
+@receiver(post_delete, sender=WeddingEvent)
+def unindex_event(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+@receiver(post_delete, sender=WeddingEvent)
+def record_event_deletion(sender, instance, origin=None, **kwargs):
+    sync.record_deletion(instance, origin)
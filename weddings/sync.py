@@ -0,0 +1,9 @@
+"""Wedding events in delta sync (see core/sync.py)"""
+from .models import WeddingEvent
+from core import sync
+
+sync.register(
+    'event', WeddingEvent, 'wedding',
+    ('name', 'description', 'date', 'start_time', 'end_time', 'location', 'address'),
+    writable=('name', 'description', 'date', 'start_time', 'end_time', 'location', 'address'),
+)
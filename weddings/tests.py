@@ -1,3 +1,355 @@
-from django.test import TestCase
+import datetime
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.urls import reverse
+
+from core import live
+from core.cache import cached_for_wedding
+from core.testing import WeddingTestCase, create_user, create_wedding
+from guests.models import Guest
+from weddings.calendar import feed_token, render_feed
+from weddings.conflicts import IntervalIndex, Slot, conflicts_for_event, conflicts_for_member, event_slot, find_conflicts
+from weddings.models import WeddingEvent, WeddingTeam
+from weddings.views import _import_team_members
+
+
+class EventTimesTests(WeddingTestCase):
+
+    def event(self, wedding, start, end, date=datetime.date(2030, 6, 1)):
+        return WeddingEvent.objects.create(
+            wedding=wedding, name='Party', date=date, start_time=start, end_time=end, location='Hall',
+        )
+
+    def test_overnight_event_ends_the_next_day(self):
+        event = self.event(self.wedding, datetime.time(20, 0), datetime.time(2, 0))
+        self.assertEqual(event.start_datetime, datetime.datetime(2030, 6, 1, 20, 0))
+        self.assertEqual(event.end_datetime, datetime.datetime(2030, 6, 2, 2, 0))
+
+        same_day = self.event(self.wedding, datetime.time(15, 0), datetime.time(16, 0))
+        self.assertEqual(same_day.end_datetime, datetime.datetime(2030, 6, 1, 16, 0))
+
+    def test_feed_and_conflicts_agree_on_overnight_events(self):
+        event = self.event(self.wedding, datetime.time(20, 0), datetime.time(2, 0))
+        slot = event_slot(event)
+        self.assertEqual((slot.start, slot.end), (event.start_datetime, event.end_datetime))
+
+        feed = render_feed(self.admin, self.wedding.id, 'example.com')
+        self.assertIn('DTSTART:20300601T200000', feed)
+        self.assertIn('DTEND:20300602T020000', feed)
+
+        # A team member on both weddings is double-booked by an event the next morning
+        member = create_user('dj', role='team_member')
+        other = create_wedding(self.admin)
+        WeddingTeam.objects.create(wedding=self.wedding, member=member, role='dj')
+        WeddingTeam.objects.create(wedding=other, member=member, role='dj')
+        morning = self.event(other, datetime.time(1, 0), datetime.time(3, 0), date=datetime.date(2030, 6, 2))
+        self.assertEqual([conflict.other.event_id for conflict in conflicts_for_event(morning)], [event.id])
+
+
+class CalendarFeedTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = WeddingEvent.objects.create(
+            wedding=self.wedding, name='Dinner; drinks, dancing', description='Line one\nBack\\slash',
+            date=datetime.date(2030, 6, 1), start_time=datetime.time(18, 0), end_time=datetime.time(23, 0),
+            location='Hall',
+        )
+        self.url = reverse('calendar_feed', args=[feed_token(self.admin)])
+
+    def feed(self):
+        return render_feed(self.admin, None, 'example.com')
+
+    def test_text_is_escaped(self):
+        lines = self.feed().split('\r\n')
+        self.assertIn('SUMMARY:Dinner\\; drinks\\, dancing (Test Wedding)', lines)
+        self.assertIn('DESCRIPTION:Line one\\nBack\\\\slash', lines)
+
+    def test_long_lines_are_folded(self):
+        self.event.description = 'Smørrebrød og kaffe ☕ ' * 20
+        self.event.save()
+        feed = self.feed()
+
+        for line in feed.split('\r\n'):
+            self.assertLessEqual(len(line.encode('utf-8')), 75)
+        unfolded = feed.replace('\r\n ', '').split('\r\n')
+        self.assertIn(f'DESCRIPTION:{self.event.description}', unfolded)
+
+    def test_unchanged_feed_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.event.name = 'Dinner'
+        self.event.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn(b'SUMMARY:Dinner (Test Wedding)', changed.content)
+
+        etag = changed['ETag']
+        self.event.delete()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_password_change_revokes_the_feed(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.admin.set_password('new')
+        self.admin.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ConflictTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = create_wedding(self.admin, title='Other Wedding')
+        self.member = create_user('dj', role='team_member')
+        for wedding in (self.wedding, self.other):
+            WeddingTeam.objects.create(wedding=wedding, member=self.member, role='dj')
+
+    def event(self, wedding, start, end, date=datetime.date(2030, 6, 1)):
+        return WeddingEvent.objects.create(
+            wedding=wedding, name='Party', date=date, start_time=datetime.time(*start), end_time=datetime.time(*end),
+            location='Hall',
+        )
+
+    def pairs(self, conflicts):
+        return {(conflict.event.event_id, conflict.other.event_id) for conflict in conflicts}
+
+    def test_index_matches_a_full_scan(self):
+        rng = random.Random(4)
+        base = datetime.datetime(2030, 6, 1)
+        slots = []
+        for event_id in range(300):
+            start = base + datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 30, 15))
+            slots.append(Slot(event_id, 1, '', '', start, start + datetime.timedelta(minutes=rng.randrange(15, 60 * 14, 15))))
+        index = IntervalIndex(slots)
+
+        for _ in range(200):
+            start = base + datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 30, 15))
+            end = start + datetime.timedelta(hours=rng.randrange(1, 10))
+            expected = {slot.event_id for slot in slots if slot.start < end and slot.end > start}
+            self.assertEqual({slot.event_id for slot in index.overlapping(start, end)}, expected)
+
+    def test_overlapping_events_of_two_weddings(self):
+        ceremony = self.event(self.wedding, (14, 0), (16, 0))
+        clash = self.event(self.other, (15, 0), (17, 0))
+        self.event(self.other, (16, 0), (18, 0))  # starts as the ceremony ends
+        self.event(self.wedding, (14, 30), (15, 0))  # same wedding, ends as the clash starts
+
+        conflicts = find_conflicts()
+        self.assertEqual(self.pairs(conflicts), {(ceremony.id, clash.id)})
+        self.assertEqual([conflict.member_id for conflict in conflicts], [self.member.id])
+
+        self.assertEqual(find_conflicts(member_ids=[self.admin.id]), [])
+        self.assertEqual(find_conflicts(date_from=datetime.date(2030, 6, 2)), [])
+        self.assertEqual(
+            {conflict.event.wedding_id for conflict in find_conflicts(wedding_id=self.other.id)}, {self.other.id},
+        )
+
+    def test_overnight_event_conflicts_with_the_next_morning(self):
+        party = self.event(self.wedding, (22, 0), (3, 0))
+        brunch = self.event(self.other, (2, 0), (4, 0), date=datetime.date(2030, 6, 2))
+        self.event(self.other, (3, 0), (5, 0), date=datetime.date(2030, 6, 2))
+
+        self.assertEqual(self.pairs(find_conflicts()), {(party.id, brunch.id)})
+        # The party started the day before the range but is still running in it
+        self.assertEqual(self.pairs(find_conflicts(date_from=datetime.date(2030, 6, 2))), {(party.id, brunch.id)})
+
+    def test_joining_a_team(self):
+        newcomer = create_user('photo', role='team_member')
+        WeddingTeam.objects.create(wedding=self.other, member=newcomer, role='photographer')
+        ceremony = self.event(self.wedding, (14, 0), (16, 0))
+        clash = self.event(self.other, (15, 0), (17, 0))
+
+        self.assertEqual(self.pairs(conflicts_for_member(newcomer.id, self.wedding.id)), {(ceremony.id, clash.id)})
+        self.assertEqual(conflicts_for_member(create_user('free', role='team_member').id, self.wedding.id), [])
+
+
+class WeddingCacheTests(WeddingTestCase):
+
+    def cached(self, wedding, compute):
+        return cached_for_wedding(wedding.id, 'test', compute)
+
+    def test_values_are_computed_once_until_the_wedding_changes(self):
+        compute = mock.Mock(side_effect=[1, 2, 3, 4])
+        self.assertEqual(self.cached(self.wedding, compute), 1)
+        self.assertEqual(self.cached(self.wedding, compute), 1)
+
+        guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz')
+        self.assertEqual(self.cached(self.wedding, compute), 2)
+        event = WeddingEvent.objects.create(
+            wedding=self.wedding, name='Dinner', date=datetime.date(2030, 6, 1),
+            start_time=datetime.time(18, 0), end_time=datetime.time(20, 0), location='Hall',
+        )
+        self.assertEqual(self.cached(self.wedding, compute), 3)
+        guest.delete()
+        event.delete()
+        self.assertEqual(self.cached(self.wedding, compute), 4)
+        self.assertEqual(compute.call_count, 4)
+
+    def test_changes_only_invalidate_their_own_wedding(self):
+        other = create_wedding(self.admin, title='Other Wedding')
+        self.cached(self.wedding, lambda: 'first')
+        self.cached(other, lambda: 'other')
+
+        Guest.objects.create(wedding=other, name='Carla Diaz')
+        self.assertEqual(self.cached(self.wedding, lambda: 'recomputed'), 'first')
+        self.assertEqual(self.cached(other, lambda: 'recomputed'), 'recomputed')
+
+    def test_detail_page_shows_guest_changes(self):
+        url = reverse('wedding_detail', args=[self.wedding.id])
+        self.assertEqual(self.client.get(url).context['guest_count'], 0)
+
+        guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', status='confirmed')
+        response = self.client.get(url)
+        self.assertEqual((response.context['guest_count'], response.context['confirmed_count']), (1, 1))
+
+        guest.delete()
+        self.assertEqual(self.client.get(url).context['guest_count'], 0)
+
+
+class LiveUpdateTests(WeddingTestCase):
+    def setUp(self):
+        super().setUp()
+        # Channels live in process memory and would outlive the test database
+        live._channels.clear()
+        self.addCleanup(live._channels.clear)
+
+    def test_subscribers_get_the_events_after_the_last_one_they_saw(self):
+        start = live.current_id(self.wedding.id)
+        self.assertEqual(live.wait_for_events(self.wedding.id, start, 0), [])
+
+        live.publish(self.wedding.id, 'media', {'title': 'First'})
+        live.publish(self.wedding.id, 'media', {'title': 'Second'})
+        first, second = live.wait_for_events(self.wedding.id, start, 0)
+        self.assertEqual([first.data, second.data], [{'title': 'First'}, {'title': 'Second'}])
+        self.assertEqual(live.wait_for_events(self.wedding.id, first.id, 0), [second])
+        self.assertEqual(live.current_id(self.wedding.id), second.id)
+        self.assertEqual(live.format_sse(first), f'id: {first.id}\nevent: media\ndata: {{"title": "First"}}\n\n')
+
+    def test_clients_that_missed_events_are_told_to_reset(self):
+        start = live.current_id(self.wedding.id)
+        with mock.patch.object(live, 'BUFFER_SIZE', 2):
+            for title in ['First', 'Second', 'Third']:
+                live.publish(self.wedding.id, 'media', {'title': title})
+        [reset] = live.wait_for_events(self.wedding.id, start, 0)
+        self.assertEqual(reset.kind, 'reset')
+
+        # An id from another process or before a restart
+        self.assertEqual(live.wait_for_events(self.wedding.id, live._latest_id + 1, 0)[0].kind, 'reset')
+
+    def test_check_ins_are_published_after_commit(self):
+        guest = Guest.objects.create(wedding=self.wedding, name='Carla Diaz', status='confirmed')
+        start = live.current_id(self.wedding.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            guest.status = 'attended'
+            guest.save()
+            self.assertEqual(live.wait_for_events(self.wedding.id, start, 0), [])
+
+        [event] = live.wait_for_events(self.wedding.id, start, 0)
+        self.assertEqual(event.kind, 'checkin')
+        self.assertEqual(
+            (event.data['guest_id'], event.data['previous'], event.data['status']),
+            (guest.id, 'confirmed', 'attended'),
+        )
+
+    def test_poll(self):
+        url = reverse('wedding_live_poll', args=[self.wedding.id])
+        start = self.client.get(url).json()
+        self.assertEqual(start['events'], [])
+
+        live.publish(self.wedding.id, 'rsvp', {'guest_id': 1})
+        response = self.client.get(url, {'after': start['last_id']}).json()
+        [event] = response['events']
+        self.assertEqual((event['type'], event['data']), ('rsvp', {'guest_id': 1}))
+        self.assertEqual(response['last_id'], event['id'])
+
+        guest = create_user('guest1', role='guest')
+        Guest.objects.create(wedding=self.wedding, user=guest, name='Guest One')
+        self.client.force_login(guest)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class TeamImportTests(WeddingTestCase):
+    def test_existing_users_are_matched_regardless_of_case(self):
+        dana = create_user('dana', role='team_member', email='Dana@Example.com')
+
+        response = self.client.post(reverse('wedding_team', args=[self.wedding.id]), {
+            'action': 'import',
+            'rows': 'Dana, Lee, dana@example.com\nEli, Moss, eli@example.com',
+            'role': 'dj',
+        })
+
+        self.assertRedirects(response, reverse('wedding_team', args=[self.wedding.id]), fetch_redirect_response=False)
+        self.assertEqual(User.objects.filter(email__iexact='dana@example.com').count(), 1)
+        self.assertEqual(
+            set(WeddingTeam.objects.filter(wedding=self.wedding).values_list('member__email', 'role')),
+            {(dana.email, 'dj'), ('eli@example.com', 'dj')},
+        )
+
+    def test_imported_accounts_can_log_in_before_any_email_is_sent(self):
+        with mock.patch('weddings.views.run_in_background') as background:
+            self.client.post(reverse('wedding_team', args=[self.wedding.id]), {
+                'action': 'import', 'rows': 'Eli, Moss, eli@example.com', 'role': 'dj',
+            })
+
+        # The background job only sends emails; the password works already
+        _, wedding_id, invitations = background.call_args.args
+        [(user_id, password, role)] = invitations
+        self.assertEqual((wedding_id, role), (self.wedding.id, 'DJ/Music'))
+        self.assertTrue(User.objects.get(id=user_id).check_password(password))
+
+    def test_import_sorts_people_into_new_existing_and_already_on_the_team(self):
+        on_team = create_user('fran', role='team_member', email='fran@example.com')
+        WeddingTeam.objects.create(wedding=self.wedding, member=on_team, role='photographer')
+        create_user('dana', role='team_member', email='dana@example.com')
+        create_user('eli', role='team_member', email='eli@elsewhere.com')
+
+        with mock.patch('weddings.views.run_in_background') as background:
+            response = self.client.post(reverse('wedding_team', args=[self.wedding.id]), {
+                'action': 'import',
+                'rows': 'first,last,email,role\n'
+                        'Fran, Fox, FRAN@example.com, dj\n'
+                        'Dana, Lee, dana@example.com\n'
+                        'Eli, Moss, eli@example.com, Florist\n'
+                        'Eli, Moss, eli@example.com, dj\n',
+                'role': 'coordinator',
+            })
+
+        messages = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(messages, [
+            "1 new team members created and 1 existing users added to the team. "
+            "Invitation emails are being sent. 1 were already on the team."
+        ])
+        self.assertEqual(
+            set(WeddingTeam.objects.filter(wedding=self.wedding).values_list('member__username', 'role')),
+            {('fran', 'photographer'), ('dana', 'coordinator'), ('eli1', 'florist')},
+        )
+        [(user_id, _, role)] = background.call_args.args[2]
+        self.assertEqual((User.objects.get(id=user_id).username, role), ('eli1', 'Florist'))
+
+    def test_import_again_changes_nothing(self):
+        people = [
+            {'first_name': 'Dana', 'last_name': 'Lee', 'email': 'dana@example.com', 'role': 'dj'},
+            {'first_name': 'Eli', 'last_name': 'Moss', 'email': 'eli@example.com', 'role': 'dj'},
+        ]
+        with mock.patch('weddings.views.run_in_background'):
+            self.assertEqual(_import_team_members(self.wedding, people), (2, 0, 0))
+            self.assertEqual(_import_team_members(self.wedding, people), (0, 0, 2))
+        self.assertEqual(WeddingTeam.objects.filter(wedding=self.wedding).count(), 2)
+        self.assertEqual(User.objects.filter(email__in=['dana@example.com', 'eli@example.com']).count(), 2)
+
+    def test_invalid_rows_import_nobody(self):
+        response = self.client.post(reverse('wedding_team', args=[self.wedding.id]), {
+            'action': 'import',
+            'rows': 'Dana, Lee, dana@example.com\nEli, Moss, not-an-email\nFran, Fox, fran@example.com, juggler',
+            'role': 'dj',
+        })
+
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], [
+            "Line 2: 'not-an-email' is not a valid email address.",
+            "Line 3: unknown role 'juggler'.",
+        ])
+        self.assertFalse(User.objects.filter(email='dana@example.com').exists())
@@ -9,7 +9,11 @@ urlpatterns = [
     path('<int:wedding_id>/delete/', views.wedding_delete, name='wedding_delete'),
     path('<int:wedding_id>/team/', views.wedding_team, name='wedding_team'),
     path('<int:wedding_id>/theme/', views.wedding_theme, name='wedding_theme'),
+    path('<int:wedding_id>/search/', views.wedding_search, name='wedding_search'),
+    path('<int:wedding_id>/live/', views.wedding_live, name='wedding_live'),
+    path('<int:wedding_id>/live/poll/', views.wedding_live_poll, name='wedding_live_poll'),
     path('<int:wedding_id>/events/create/', views.wedding_event_create, name='wedding_event_create'),
     path('events/<int:event_id>/edit/', views.wedding_event_edit, name='wedding_event_edit'),
     path('events/<int:event_id>/delete/', views.wedding_event_delete, name='wedding_event_delete'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
 ]
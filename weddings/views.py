@@ -1,15 +1,71 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Lower
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
 
 from .models import Wedding, WeddingTeam, WeddingEvent, WeddingTheme
-from .forms import WeddingForm, WeddingEventForm, WeddingThemeForm, WeddingTeamForm, NewTeamMemberForm
-from core.utils import create_team_member_user, send_team_member_invitation_email
+from .forms import WeddingForm, WeddingEventForm, WeddingThemeForm, WeddingTeamForm, NewTeamMemberForm, TeamImportForm
+from .conflicts import conflicts_for_event, conflicts_for_member, find_conflicts, describe
+from .calendar import cached_feed, feed_etag, feed_state, feed_url, read_token
+from guests.models import Guest
+from core.utils import create_team_member_user, create_team_member_users, send_team_member_invitation_email
+from core.background import run_in_background
+from core.cache import bump_wedding_cache_version
+from core.cache import cached_for_wedding, get_wedding_cache_version
+from core.http import conditional_page, subquery_aggregate, latest
+from core.search import search_wedding
+from core import live
+from core.aio import get_user_with_profile
+
+def _wedding_list_state(request):
+    """Newest change and size of the wedding list shown to the user"""
+    user = request.user
+    role = user.profile.role
+
+    if role == 'admin':
+        weddings = Wedding.objects.filter(admin=user)
+    elif role == 'team_member':
+        weddings = Wedding.objects.filter(team_members__member=user)
+    else:
+        weddings = Wedding.objects.filter(guests__user=user)
+
+    state = weddings.aggregate(last_modified=Max('updated_at'), count=Count('id', distinct=True))
+    return state['last_modified'], (role, state['count'])
+
+def _wedding_detail_state(request, wedding_id):
+    """Newest change of a wedding and everything shown on its page, in one query"""
+    state = Wedding.objects.filter(id=wedding_id).annotate(
+        events_modified=subquery_aggregate(WeddingEvent.objects.all(), 'wedding', Max('updated_at')),
+        events_count=subquery_aggregate(WeddingEvent.objects.all(), 'wedding', Count('id')),
+        theme_modified=subquery_aggregate(WeddingTheme.objects.all(), 'wedding', Max('updated_at')),
+        team_modified=subquery_aggregate(WeddingTeam.objects.all(), 'wedding', Max('created_at')),
+        team_count=subquery_aggregate(WeddingTeam.objects.all(), 'wedding', Count('id')),
+        guests_modified=subquery_aggregate(Guest.objects.all(), 'wedding', Max('updated_at')),
+        guests_count=subquery_aggregate(Guest.objects.all(), 'wedding', Count('id')),
+    ).values(
+        'updated_at', 'events_modified', 'events_count', 'theme_modified',
+        'team_modified', 'team_count', 'guests_modified', 'guests_count',
+    ).first()
+
+    if state is None:
+        return None
+
+    last_modified = latest(
+        state['updated_at'], state['events_modified'], state['theme_modified'],
+        state['team_modified'], state['guests_modified'],
+    )
+    return last_modified, (state['events_count'], state['team_count'], state['guests_count'])
 
 @login_required
+@conditional_page(_wedding_list_state)
 def wedding_list(request):
     """List all weddings the user has access to"""
     user = request.user
@@ -31,7 +87,32 @@ def wedding_list(request):
 
     return render(request, 'weddings/wedding_list.html', {'weddings': weddings})
 
+def _wedding_detail_data(wedding):
+    """Query the events, team, theme and guest counts shown on the wedding page"""
+    events = list(WeddingEvent.objects.filter(wedding=wedding).order_by('date', 'start_time'))
+    team = list(WeddingTeam.objects.filter(wedding=wedding).select_related('member__profile'))
+
+    try:
+        theme = WeddingTheme.objects.get(wedding=wedding)
+    except WeddingTheme.DoesNotExist:
+        theme = None
+
+    # Count all guests and the confirmed/attended ones in a single query
+    guest_counts = wedding.guests.aggregate(
+        guest_count=Count('id'),
+        confirmed_count=Count('id', filter=Q(status='confirmed')),
+        attended_count=Count('id', filter=Q(status='attended')),
+    )
+
+    return {
+        'events': events,
+        'team': team,
+        'theme': theme,
+        **guest_counts,
+    }
+
 @login_required
+@conditional_page(_wedding_detail_state)
 def wedding_detail(request, wedding_id):
     """View wedding details"""
     wedding = get_object_or_404(Wedding, id=wedding_id)
@@ -50,35 +131,109 @@ def wedding_detail(request, wedding_id):
     if not has_access:
         return HttpResponseForbidden("You don't have permission to view this wedding.")
 
-    # Get wedding events
-    events = WeddingEvent.objects.filter(wedding=wedding).order_by('date', 'start_time')
-
-    # Get wedding team
-    team = WeddingTeam.objects.filter(wedding=wedding)
-
-    # Get wedding theme
-    try:
-        theme = WeddingTheme.objects.get(wedding=wedding)
-    except WeddingTheme.DoesNotExist:
-        theme = None
-
-    # Get guest count
-    guest_count = wedding.guests.count()
-    confirmed_count = wedding.guests.filter(status='confirmed').count()
-    attended_count = wedding.guests.filter(status='attended').count()
+    # Events, team, theme and guest counts only change through saves that bump
+    # the wedding's cache version, so they are served from the cache
+    data = cached_for_wedding(wedding.id, 'detail', lambda: _wedding_detail_data(wedding))
 
     context = {
         'wedding': wedding,
-        'events': events,
-        'team': team,
-        'theme': theme,
-        'guest_count': guest_count,
-        'confirmed_count': confirmed_count,
-        'attended_count': attended_count,
+        'cache_version': get_wedding_cache_version(wedding.id),
+        'can_manage': user.profile.role == 'admin' and wedding.admin == user,
+        'calendar_url': feed_url(request, wedding.id),
+        **data,
     }
 
     return render(request, 'weddings/wedding_detail.html', context)
 
+async def _live_wedding(request, wedding_id):
+    """The wedding if the user may watch its live updates (coordinators only), else None"""
+    user = await get_user_with_profile(request)
+    wedding = await aget_object_or_404(Wedding, id=wedding_id)
+
+    if user.profile.role == 'admin' and wedding.admin_id == user.id:
+        return wedding
+    if user.profile.role == 'team_member' and await WeddingTeam.objects.filter(wedding=wedding, member=user).aexists():
+        return wedding
+    return None
+
+def _event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+@login_required
+async def wedding_live(request, wedding_id):
+    """Server-sent events stream of a wedding's check-ins, RSVP changes and uploads"""
+    wedding = await _live_wedding(request, wedding_id)
+    if wedding is None:
+        return HttpResponseForbidden("You don't have permission to follow this wedding.")
+
+    # Browsers send Last-Event-ID when they reconnect
+    last_id = _event_id(request.headers.get('Last-Event-ID'))
+
+    # Under ASGI an open stream costs no thread; under WSGI it holds one
+    if isinstance(request, ASGIRequest):
+        stream = live.aevent_stream(wedding.id, last_id, live.STREAM_DURATION)
+    else:
+        stream = live.event_stream(wedding.id, last_id, live.STREAM_DURATION)
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+async def wedding_live_poll(request, wedding_id):
+    """Long-poll alternative to wedding_live for clients without EventSource (JSON)"""
+    wedding = await _live_wedding(request, wedding_id)
+    if wedding is None:
+        return JsonResponse({'error': "You don't have permission to follow this wedding."}, status=403)
+
+    last_id = _event_id(request.GET.get('after'))
+    if last_id is None:
+        # First request: just tell the client where to start
+        return JsonResponse({'last_id': live.current_id(wedding.id), 'events': []})
+
+    events = await live.await_events(wedding.id, last_id, live.POLL_TIMEOUT)
+    return JsonResponse({
+        'last_id': events[-1].id if events else last_id,
+        'events': [{'id': event.id, 'type': event.kind, 'data': event.data} for event in events],
+    })
+
+@login_required
+def wedding_search(request, wedding_id):
+    """Search a wedding's guests, tasks, media and events (JSON)"""
+    wedding = get_object_or_404(Wedding, id=wedding_id)
+
+    # Check if user has access to this wedding
+    user = request.user
+    is_staff = False
+    has_access = False
+
+    if user.profile.role == 'admin' and wedding.admin == user:
+        has_access = is_staff = True
+    elif user.profile.role == 'team_member' and WeddingTeam.objects.filter(wedding=wedding, member=user).exists():
+        has_access = is_staff = True
+    elif user.profile.role == 'guest' and user.guest_profiles.filter(wedding=wedding).exists():
+        has_access = True
+
+    if not has_access:
+        return JsonResponse({'error': "You don't have permission to search this wedding."}, status=403)
+
+    query = request.GET.get('q', '').strip()
+    kinds = [kind for kind in request.GET.get('type', '').split(',') if kind]
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        limit = 20
+
+    # Guests only see events and public media
+    results = search_wedding(wedding.id, query, kinds=kinds, include_staff_only=is_staff, limit=limit)
+
+    return JsonResponse({'query': query, 'count': len(results), 'results': results})
+
 @login_required
 def wedding_create(request):
     """Create a new wedding"""
@@ -140,6 +295,63 @@ def wedding_delete(request, wedding_id):
 
     return render(request, 'weddings/wedding_confirm_delete.html', {'wedding': wedding})
 
+def _email_team_members(wedding_id, invitations):
+    """Email imported team members their login details (runs in a background thread)"""
+    wedding = Wedding.objects.get(id=wedding_id)
+    users = User.objects.in_bulk([user_id for user_id, _, _ in invitations])
+    for user_id, password, role in invitations:
+        send_team_member_invitation_email(users[user_id], password, wedding, role)
+
+def _import_team_members(wedding, people):
+    """
+    Add many people to a wedding's team, creating accounts for new ones
+
+    Args:
+        wedding: Wedding object
+        people (list): Dicts with first_name, last_name, email and role
+
+    Returns:
+        tuple: (number of accounts created, number of existing users added,
+        number of people already on the team)
+    """
+    roles = dict(WeddingTeam.ROLE_CHOICES)
+    role_by_email = {person['email'].lower(): person['role'] for person in people}
+
+    # Existing accounts are added to the team as they are
+    # Matched case-insensitively, like create_team_member_users() does
+    existing_users = list(User.objects.alias(email_lower=Lower('email')).filter(
+        email_lower__in=role_by_email
+    ).exclude(email=''))
+    existing_emails = {user.email.lower() for user in existing_users}
+    on_team = set(WeddingTeam.objects.filter(
+        wedding=wedding, member__in=existing_users
+    ).values_list('member_id', flat=True))
+
+    with transaction.atomic():
+        created = create_team_member_users([
+            person for person in people if person['email'].lower() not in existing_emails
+        ])
+
+        team = [
+            WeddingTeam(wedding=wedding, member=user, role=role_by_email[user.email.lower()])
+            for user in existing_users if user.id not in on_team
+        ]
+        team += [
+            WeddingTeam(wedding=wedding, member=user, role=role_by_email[user.email.lower()])
+            for user, _ in created
+        ]
+        WeddingTeam.objects.bulk_create(team)
+
+    # bulk_create() skips the post_save signals that invalidate cached pages
+    bump_wedding_cache_version(wedding.id)
+
+    # Login details are emailed after the transaction commits, off the request
+    run_in_background(_email_team_members, wedding.id, [
+        (user.id, password, roles[role_by_email[user.email.lower()]]) for user, password in created
+    ])
+
+    return len(created), len(team) - len(created), len(on_team)
+
 @login_required
 def wedding_team(request, wedding_id):
     """Manage wedding team members"""
@@ -150,7 +362,7 @@ def wedding_team(request, wedding_id):
         messages.error(request, "You don't have permission to manage this wedding's team.")
         return redirect('wedding_detail', wedding_id=wedding.id)
 
-    team_members = WeddingTeam.objects.filter(wedding=wedding)
+    team_members = WeddingTeam.objects.filter(wedding=wedding).select_related('member__profile')
 
     # Check if action is to remove a team member
     if request.method == 'POST' and request.POST.get('action') == 'remove':
@@ -175,6 +387,11 @@ def wedding_team(request, wedding_id):
             # Check if this user is already on the team
             if WeddingTeam.objects.filter(wedding=wedding, member=team_member.member).exists():
                 messages.error(request, f"{team_member.member.username} is already on the team.")
+            elif (conflicts := conflicts_for_member(team_member.member_id, wedding.id)) and not request.POST.get('ignore_conflicts'):
+                # Double bookings must be confirmed explicitly
+                for line in describe(conflicts):
+                    messages.error(request, line)
+                messages.warning(request, f"{team_member.member.username} was not added. Tick \"Add even if double-booked\" to add them anyway.")
             else:
                 team_member.save()
                 messages.success(request, f"{team_member.member.username} added to the team as {form.cleaned_data['role']}.")
@@ -202,17 +419,33 @@ def wedding_team(request, wedding_id):
                     role=role
                 )
 
-                # Send invitation email
-                email_sent = send_team_member_invitation_email(user, password, wedding, dict(WeddingTeam.ROLE_CHOICES)[role])
+                # Send the invitation email after the response, off the request;
+                # the SMTP round trip can take seconds on a venue network
+                run_in_background(send_team_member_invitation_email, user, password, wedding, dict(WeddingTeam.ROLE_CHOICES)[role])
 
-                if email_sent:
-                    messages.success(request, f"New team member {user.get_full_name()} created and added to the team as {dict(WeddingTeam.ROLE_CHOICES)[role]}. An invitation email has been sent.")
-                else:
-                    messages.warning(request, f"New team member {user.get_full_name()} created and added to the team, but the invitation email could not be sent.")
+                messages.success(request, f"New team member {user.get_full_name()} created and added to the team as {dict(WeddingTeam.ROLE_CHOICES)[role]}. An invitation email is being sent.")
             else:
                 messages.error(request, f"Could not create new team member. A user with email {email} may already exist.")
 
             return redirect('wedding_team', wedding_id=wedding.id)
+
+    # Check if action is to import many new team members at once
+    elif request.method == 'POST' and request.POST.get('action') == 'import':
+        import_form = TeamImportForm(request.POST, request.FILES)
+        if import_form.is_valid():
+            created, added, skipped = _import_team_members(wedding, import_form.cleaned_data['people'])
+
+            summary = f"{created} new team members created and {added} existing users added to the team."
+            if created:
+                summary += " Invitation emails are being sent."
+            if skipped:
+                summary += f" {skipped} were already on the team."
+            messages.success(request, summary)
+            return redirect('wedding_team', wedding_id=wedding.id)
+
+        for error in import_form.non_field_errors():
+            messages.error(request, error)
+        return redirect('wedding_team', wedding_id=wedding.id)
     else:
         form = WeddingTeamForm()
         new_member_form = NewTeamMemberForm()
@@ -223,8 +456,10 @@ def wedding_team(request, wedding_id):
     context = {
         'wedding': wedding,
         'team_members': team_members,
+        'conflicts': describe(find_conflicts(date_from=timezone.now().date(), wedding_id=wedding.id)),
         'form': form,
         'new_member_form': new_member_form,
+        'import_form': TeamImportForm(),
         'available_team_members': available_team_members,
     }
 
@@ -294,10 +529,15 @@ def wedding_event_create(request, wedding_id):
         if form.is_valid():
             event = form.save(commit=False)
             event.wedding = wedding
-            event.save()
 
-            messages.success(request, f"Event '{event.name}' added successfully.")
-            return redirect('wedding_detail', wedding_id=wedding.id)
+            conflicts = conflicts_for_event(event)
+            if conflicts and not request.POST.get('ignore_conflicts'):
+                for line in describe(conflicts):
+                    form.add_error(None, line)
+            else:
+                event.save()
+                messages.success(request, f"Event '{event.name}' added successfully.")
+                return redirect('wedding_detail', wedding_id=wedding.id)
     else:
         form = WeddingEventForm()
 
@@ -330,9 +570,14 @@ def wedding_event_edit(request, event_id):
     if request.method == 'POST':
         form = WeddingEventForm(request.POST, instance=event)
         if form.is_valid():
-            form.save()
-            messages.success(request, f"Event '{event.name}' updated successfully.")
-            return redirect('wedding_detail', wedding_id=wedding.id)
+            conflicts = conflicts_for_event(form.instance)
+            if conflicts and not request.POST.get('ignore_conflicts'):
+                for line in describe(conflicts):
+                    form.add_error(None, line)
+            else:
+                form.save()
+                messages.success(request, f"Event '{event.name}' updated successfully.")
+                return redirect('wedding_detail', wedding_id=wedding.id)
     else:
         form = WeddingEventForm(instance=event)
 
@@ -370,3 +615,34 @@ def wedding_event_delete(request, event_id):
         return redirect('wedding_detail', wedding_id=wedding.id)
 
     return render(request, 'weddings/wedding_event_confirm_delete.html', {'event': event})
+
+def _calendar_feed(request, token):
+    """The user, wedding and state of a feed, looked up once per request"""
+    if not hasattr(request, '_calendar_feed'):
+        feed = read_token(token)
+        state = feed_state(*feed) if feed is not None else None
+        request._calendar_feed = (*feed, state) if state is not None else None
+    return request._calendar_feed
+
+def _calendar_etag(request, token):
+    feed = _calendar_feed(request, token)
+    return feed_etag(*feed) if feed is not None else None
+
+def _calendar_last_modified(request, token):
+    feed = _calendar_feed(request, token)
+    return feed[2][0] if feed is not None else None
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_calendar_etag, last_modified_func=_calendar_last_modified)
+def calendar_feed(request, token):
+    """iCalendar feed for calendar apps; the signed token stands in for a login"""
+    feed = _calendar_feed(request, token)
+    if feed is None:
+        raise Http404("Calendar not found")
+    user, wedding_id, state = feed
+
+    body = cached_feed(user, wedding_id, request.get_host(), feed_etag(user, wedding_id, state))
+    response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
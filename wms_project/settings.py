@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.guest_session.GuestSessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +90,53 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Pick the backend with WMS_CACHE_BACKEND: 'locmem' (default), 'file' or 'redis'.
+# WMS_CACHE_LOCATION overrides the directory (file) or server URL (redis).
+
+CACHE_BACKEND = os.environ.get('WMS_CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('WMS_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('WMS_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'wms',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# How long cached wedding pages and query results live (seconds). Entries are
+# invalidated on change anyway, so this only bounds memory use.
+WEDDING_CACHE_TIMEOUT = 60 * 15
+
+# Mixed into the ETags of conditional pages (core.http.conditional_page).
+# Set WMS_RELEASE to a new value on every deploy so template changes are not
+# hidden behind 304 responses.
+CONDITIONAL_GET_SALT = os.environ.get('WMS_RELEASE', '')
+
+# How guests who log in with their credential or QR code are kept logged in:
+# 'database' (a regular Django session) or 'signed' (a signed cookie bound to
+# their GuestCredential token, with no session table reads or writes; see
+# core/guest_session.py)
+GUEST_SESSION_MODE = os.environ.get('WMS_GUEST_SESSION_MODE', 'database')
+GUEST_SESSION_AGE = 60 * 60 * 24 * 2
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -108,6 +156,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (see core/passwords.py)
+# New passwords use the first hasher.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Demo and development databases only: WMS_FAST_SEED_PASSWORDS=1 hashes seed
+# accounts with unsalted MD5 to keep reseeding quick. MD5 is then accepted
+# for logins too; Django rehashes those passwords with PBKDF2 when they are used
+FAST_SEED_PASSWORDS = os.environ.get('WMS_FAST_SEED_PASSWORDS', '') == '1'
+if FAST_SEED_PASSWORDS:
+    PASSWORD_HASHERS.append('django.contrib.auth.hashers.MD5PasswordHasher')
+
+# Hasher for seed and demo accounts ('default' uses the first one above)
+SEED_PASSWORD_HASHER = 'md5' if FAST_SEED_PASSWORDS else 'default'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -127,10 +196,54 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed copies (plus .gz/.br) to STATIC_ROOT,
+# which can be cached forever; see core/staticfiles.py
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+
+# Front-end assets. 'local' uses the stylesheet, icons and fonts built into
+# static/build/ by `python manage.py build_assets`; 'cdn' loads Tailwind's
+# in-browser compiler, Font Awesome and Google Fonts from their CDNs, for
+# development without npm. Defaults to 'local' once a build exists.
+STATIC_ASSETS = os.environ.get('WMS_STATIC_ASSETS') or (
+    'local' if os.path.exists(os.path.join(BASE_DIR, 'static', 'build', 'app.css')) else 'cdn'
+)
+
+# Serve STATIC_ROOT from Django (core.staticfiles.serve) when there is no
+# front web server to do it
+SERVE_STATIC = os.environ.get('WMS_SERVE_STATIC', '') == '1'
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are hashed as they stream in, so content-addressed storage
+# (core.storage) can store them without reading them again
+FILE_UPLOAD_HANDLERS = [
+    'core.storage.HashingMemoryFileUploadHandler',
+    'core.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Protected media (core.sendfile)
+# Wedding media is served by gallery.views.media_file after an access check.
+# With SENDFILE_BACKEND = None Django streams the file itself (with Range
+# support). In production set it to 'nginx' to hand the transfer to nginx via
+# X-Accel-Redirect, or 'apache'/'lighttpd' for X-Sendfile.
+SENDFILE_BACKEND = os.environ.get('WMS_SENDFILE_BACKEND') or None
+SENDFILE_ROOT = MEDIA_ROOT
+SENDFILE_URL = '/protected-media/'
+
+# Galleries with more items than this are zipped in the background and served
+# from MEDIA_ROOT/archives/ instead of being zipped on the fly
+GALLERY_EXPORT_STREAM_MAX_ITEMS = 500
+
+# Storage quotas in megabytes (0 = unlimited): all media of one wedding, and
+# everything one guest uploads. Admins and team members have no personal quota.
+WEDDING_MEDIA_QUOTA_MB = int(os.environ.get('WMS_WEDDING_MEDIA_QUOTA_MB', 50 * 1024))
+GUEST_MEDIA_QUOTA_MB = int(os.environ.get('WMS_GUEST_MEDIA_QUOTA_MB', 2 * 1024))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -15,9 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.static import serve
+
+from core import staticfiles
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,7 +31,20 @@ urlpatterns = [
     path('gallery/', include('gallery.urls')),
 ]
 
-# Serve media files in development
+# Serve media files in development. Wedding photos, videos and gallery
+# archives are left out on purpose: they are only reachable through the
+# gallery views, which check that the user may see them.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>(?!wedding_media/|archives/).*)$' % settings.MEDIA_URL.lstrip('/'), serve,
+                {'document_root': settings.MEDIA_ROOT}),
+    ]
+    if not settings.SERVE_STATIC:
+        urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+
+# Without a front web server, serve collected static files with their
+# precompressed copies and far-future cache headers
+if settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), staticfiles.serve),
+    ]